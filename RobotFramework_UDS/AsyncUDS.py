@@ -0,0 +1,377 @@
+from robot.api import logger
+from doipclient import constants
+from doipclient.messages import (AliveCheckRequest, AliveCheckResponse, DiagnosticMessage,
+                                 DiagnosticMessageNegativeAcknowledgement, DiagnosticMessagePositiveAcknowledgement,
+                                 GenericDoIPNegativeAcknowledge, ReservedMessage, RoutingActivationRequest,
+                                 RoutingActivationResponse, payload_message_to_type, payload_type_to_message)
+from udsoncan import services
+from udsoncan.Response import Response
+from udsoncan.client import SessionTiming
+from udsoncan.configs import default_client_config
+from .UDSClient import ResponseTiming
+from .UDSKeywords import UDSKeywords, UDSDevice, UDSDeviceManager
+from .PDXCache import PDXCache
+import asyncio
+import struct
+import time
+
+
+class AsyncDoIPConnection:
+    """
+DoIP connection to one ECU on a non-blocking TCP socket of the asyncio event loop.
+
+The connection performs the routing activation when it is opened, answers alive check
+requests of the DoIP entity and acknowledges diagnostic messages like ``DoIPClient``.
+    """
+    HEADER_FORMAT = "!BBHL"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    # Response code of a successful routing activation
+    ROUTING_SUCCESSFULLY_ACTIVATED = 0x10
+
+    def __init__(self, ecu_ip_address, ecu_logical_address, tcp_port=constants.TCP_DATA_UNSECURED,
+                 activation_type=RoutingActivationRequest.ActivationType.Default, protocol_version=0x02,
+                 client_logical_address=0x0E00, client_ip_address=None):
+        self.ecu_ip_address = ecu_ip_address
+        self.ecu_logical_address = ecu_logical_address
+        self.tcp_port = tcp_port
+        self.activation_type = activation_type
+        self.protocol_version = protocol_version
+        self.client_logical_address = client_logical_address
+        self.client_ip_address = client_ip_address
+        self.reader = None
+        self.writer = None
+
+    def is_open(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def open(self, timeout=constants.A_PROCESSING_TIME):
+        """
+Open the TCP connection and activate the routing.
+        """
+        local_addr = (self.client_ip_address, 0) if self.client_ip_address else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ecu_ip_address, self.tcp_port, local_addr=local_addr), timeout)
+        await self.send_message(RoutingActivationRequest(self.client_logical_address, self.activation_type))
+        response = await self.read_message(timeout, RoutingActivationResponse)
+        if response.response_code != AsyncDoIPConnection.ROUTING_SUCCESSFULLY_ACTIVATED:
+            await self.close()
+            raise ConnectionError(f"Routing activation of {self.ecu_ip_address} denied with response code 0x{response.response_code:02X}")
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def send_message(self, message):
+        payload = message.pack()
+        header = struct.pack(AsyncDoIPConnection.HEADER_FORMAT, self.protocol_version, 0xFF ^ self.protocol_version,
+                             payload_message_to_type[type(message)], len(payload))
+        self.writer.write(header + payload)
+        await self.writer.drain()
+
+    async def __read_frame(self, timeout):
+        # A cancelled readexactly does not consume the buffered bytes, so the header read can time out
+        # without losing data. Once the header is consumed, the payload has to be read completely or the
+        # stream is out of sync, so a payload which does not follow in time closes the connection.
+        header = await asyncio.wait_for(self.reader.readexactly(AsyncDoIPConnection.HEADER_SIZE), timeout)
+        _, _, payload_type, payload_length = struct.unpack(AsyncDoIPConnection.HEADER_FORMAT, header)
+        try:
+            payload = await asyncio.wait_for(self.reader.readexactly(payload_length), constants.A_PROCESSING_TIME)
+        except (TimeoutError, asyncio.TimeoutError):
+            await self.close()
+            raise ConnectionError(f"Incomplete DoIP message of {self.ecu_ip_address}, the connection is closed")
+        return payload_type, payload
+
+    async def read_message(self, timeout, message_type=None):
+        """
+Read the next DoIP message, or the next message of the given type if ``message_type`` is given.
+
+The timeout applies to the start of the message, a message which has started is always read completely.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("ECU failed to respond in time")
+            payload_type, payload = await self.__read_frame(remaining)
+            payload_length = len(payload)
+            message_class = payload_type_to_message.get(payload_type)
+            if message_class is None:
+                message = ReservedMessage.unpack(payload_type, payload, payload_length)
+            else:
+                message = message_class.unpack(payload, payload_length)
+
+            if isinstance(message, GenericDoIPNegativeAcknowledge):
+                raise IOError(f"DoIP Negative Acknowledge. NACK Code: {message.nack_code}")
+            if isinstance(message, AliveCheckRequest):
+                await self.send_message(AliveCheckResponse(self.client_logical_address))
+                continue
+            if message_type is None or isinstance(message, message_type):
+                return message
+
+    async def send(self, payload, timeout=constants.A_PROCESSING_TIME):
+        """
+Send a diagnostic message and wait for its acknowledgement.
+        """
+        await self.send_message(DiagnosticMessage(self.client_logical_address, self.ecu_logical_address, bytes(payload)))
+        deadline = time.monotonic() + timeout
+        while True:
+            message = await self.read_message(deadline - time.monotonic())
+            if isinstance(message, DiagnosticMessagePositiveAcknowledgement):
+                return
+            if isinstance(message, DiagnosticMessageNegativeAcknowledgement):
+                raise IOError(f"Diagnostic request rejected with negative acknowledge code: {message.nack_code}")
+            logger.warn(f"Received unexpected DoIP message {type(message).__name__}. Ignoring")
+
+    async def receive(self, timeout):
+        """
+Wait for the next diagnostic message of the ECU and return its user data.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            message = await self.read_message(deadline - time.monotonic(), DiagnosticMessage)
+            if message.source_address == self.ecu_logical_address and message.target_address == self.client_logical_address:
+                return bytes(message.user_data)
+
+
+class AsyncUDSClient:
+    """
+UDS request handling of one ECU on an ``AsyncDoIPConnection``.
+
+The requests of one ECU are serialized, requests to different ECUs run concurrently
+in the event loop. The timeouts and the validation of the responses are done by
+``ResponseTiming`` like for ``UDSClient``, including the P2 and P2* timings reported by
+the server in diagnosticSessionControl responses.
+
+Unlike ``udsoncan.Client``, the client does not support suppressPositiveResponse and
+payload overrides, since it sends raw requests.
+    """
+    def __init__(self, connection, config=default_client_config):
+        self.connection = connection
+        self.config = config
+        self.session_timing = SessionTiming(p2_server_max=None, p2_star_server_max=None)
+        self.lock = asyncio.Lock()
+
+    async def request(self, payload, timeout=None):
+        """
+Send a request and wait for its positive response.
+
+**Arguments:**
+
+* ``payload``
+
+  / *Condition*: required / *Type*: bytes /
+
+  The complete request.
+
+* ``timeout``
+
+  / *Condition*: optional / *Type*: float / *Default*: None /
+
+  The timeout in seconds like for ``udsoncan.Client.send_request``, by default ``request_timeout``
+  of the config for the request and P2 or P2* for each response.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: bytes /
+
+  The complete positive response.
+        """
+        payload = bytes(payload)
+
+        async with self.lock:
+            timing = ResponseTiming(payload, self.config, self.session_timing, -1 if timeout is None else timeout)
+            await self.connection.send(payload)
+            while True:
+                try:
+                    response_data = await self.connection.receive(timing.get_wait_timeout())
+                except (TimeoutError, asyncio.TimeoutError):
+                    raise timing.get_timeout_exception()
+                if timing.is_response_pending(response_data):
+                    continue
+                response = timing.check(response_data)
+                timing.update_session_timing(response, self.session_timing)
+                return response_data
+
+
+class AsyncUDS:
+    """
+asyncio API to drive many ECUs from one event loop.
+
+The devices are managed by an ``UDSDeviceManager`` and share the loaded PDX files with the
+Robot keywords through the ``PDXRegistry`` of ``UDSKeywords``, so the same ``DiagnosticServices``
+encode and decode the requests of both.
+
+Usage::
+
+   uds = AsyncUDS()
+   uds.create_device("ecu1", "192.168.0.10", 0x1001)
+   await uds.connect("ecu1")
+   await uds.load_pdx("ECU.pdx", "Variant", "ecu1")
+   values = await uds.read_by_name(["VIN_Read"], "ecu1")
+
+It can also be imported as Robot Framework library, Robot runs the coroutines of all keywords
+in one event loop, so the connections stay open between the keywords::
+
+   Library    RobotFramework_UDS.AsyncUDS.AsyncUDS    AS    AsyncUDS
+    """
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+
+    def __init__(self, uds_manager=None, pdx_cache=None):
+        self.uds_manager = uds_manager if uds_manager is not None else UDSDeviceManager()
+        self.pdx_cache = pdx_cache if pdx_cache is not None else PDXCache()
+
+    def __device_check(self, device_name):
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use create_device to create a new one.")
+        uds_device = self.uds_manager.uds_device[device_name]
+        if not uds_device.available:
+            raise ValueError(f"Device with name '{device_name}' is not available. Please use connect to connect.")
+        return uds_device
+
+    def create_device(self, device_name, ecu_ip_address, ecu_logical_address, tcp_port=constants.TCP_DATA_UNSECURED,
+                      activation_type=RoutingActivationRequest.ActivationType.Default, protocol_version=0x02,
+                      client_logical_address=0x0E00, client_ip_address=None, config=default_client_config):
+        """
+Create a device for a DoIP ECU, the connection is opened by ``connect``.
+        """
+        if self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' already exists.")
+        uds_device = UDSDevice()
+        uds_device.name = device_name
+        uds_device.ip_address = ecu_ip_address
+        uds_device.logical_address = ecu_logical_address
+        uds_device.config = dict(config)
+        uds_device.connector = AsyncDoIPConnection(ecu_ip_address, ecu_logical_address, tcp_port, activation_type,
+                                                   protocol_version, client_logical_address, client_ip_address)
+        uds_device.client = AsyncUDSClient(uds_device.connector, uds_device.config)
+        self.uds_manager.uds_device[device_name] = uds_device
+        return uds_device
+
+    async def connect(self, device_name="default"):
+        """
+Open the connection of a device and activate the routing.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use create_device to create a new one.")
+        uds_device = self.uds_manager.uds_device[device_name]
+        if not uds_device.connector.is_open():
+            await uds_device.connector.open()
+        uds_device.available = True
+
+    async def close(self, device_name="default"):
+        """
+Close the connection of a device.
+        """
+        uds_device = self.__device_check(device_name)
+        uds_device.available = False
+        await uds_device.connector.close()
+
+    async def remove_device(self, device_name="default"):
+        """
+Close the connection of a device, remove it and release its PDX file.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists.")
+        uds_device = self.uds_manager.uds_device.pop(device_name)
+        await uds_device.connector.close()
+        uds_device.release_diag_service_db()
+
+    async def load_pdx(self, pdx_file, variant, device_name="default", use_cache=True, variant_scoped=False, low_memory=False):
+        """
+Load the PDX file of a device in a worker thread, see keyword ``Load PDX``.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use create_device to create a new one.")
+        uds_device = self.uds_manager.uds_device[device_name]
+        pdx_cache = self.pdx_cache if use_cache else None
+        handle, key = UDSKeywords.pdx_registry.acquire(pdx_file, variant, pdx_cache, variant_scoped, low_memory)
+        uds_device.release_diag_service_db()
+        uds_device.diag_service_db = handle
+        uds_device.diag_service_db_key = key
+        await asyncio.wrap_future(handle)
+
+    async def request(self, payload, device_name="default", timeout=None):
+        """
+Send a raw request and return the complete positive response, see ``AsyncUDSClient.request``.
+        """
+        uds_device = self.__device_check(device_name)
+        return await uds_device.client.request(payload, timeout)
+
+    async def read_by_name(self, service_name_list, device_name="default"):
+        """
+Read DIDs by their service names in one ReadDataByIdentifier request.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: dict /
+
+  The decoded values per service name.
+        """
+        uds_device = self.__device_check(device_name)
+        diag_service_db = uds_device.diag_service_db
+        if isinstance(service_name_list, str):
+            service_name_list = [service_name_list]
+        did_mapping = {diag_service_db.get_did_by_name(service_name): service_name for service_name in service_name_list}
+        payload = bytes([services.ReadDataByIdentifier.request_id()]) + b"".join(did.to_bytes(2, "big") for did in did_mapping)
+
+        response_data = await uds_device.client.request(payload)
+        response = Response.from_payload(response_data)
+        didconfig = diag_service_db.get_did_codec(services.ReadDataByIdentifier.request_id())
+        services.ReadDataByIdentifier.interpret_response(response, list(did_mapping), didconfig)
+        return {did_mapping[did]: value for did, value in response.service_data.values.items()}
+
+    async def write_by_name(self, service_name, value, device_name="default"):
+        """
+Write the value of a DID by its service name with WriteDataByIdentifier.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: bytes /
+
+  The complete positive response.
+        """
+        uds_device = self.__device_check(device_name)
+        diag_service_db = uds_device.diag_service_db
+        did = diag_service_db.get_did_by_name(service_name)
+        codec = diag_service_db.get_did_codec(services.WriteDataByIdentifier.request_id())[did]
+        payload = bytes([services.WriteDataByIdentifier.request_id()]) + did.to_bytes(2, "big") + bytes(codec.encode(value))
+        return await uds_device.client.request(payload)
+
+    async def routine_by_name(self, routine_name, data=None, device_name="default"):
+        """
+Run a routine by its service name with RoutineControl, see keyword ``Routine Control By Name``.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: dict /
+
+  The decoded positive response.
+        """
+        uds_device = self.__device_check(device_name)
+        diag_service_db = uds_device.diag_service_db
+        routine_id, control_type = diag_service_db.get_routine_by_name(routine_name)
+        if control_type != 1 and control_type != 2:
+            control_type = 3
+
+        if isinstance(data, dict):
+            payload = bytes(diag_service_db.get_encoded_request_message(routine_name, data))
+        else:
+            payload = bytes([services.RoutineControl.request_id(), control_type]) + routine_id.to_bytes(2, "big") + bytes(data or b"")
+
+        response_data = await uds_device.client.request(payload)
+        response_message = diag_service_db.get_full_positive_response_data(routine_name, response_data[1:])
+        return diag_service_db.get_decode_response_message(routine_name, response_message)
@@ -0,0 +1,209 @@
+import queue
+import threading
+import zlib
+
+
+class CompressionMethods:
+    """
+Registry of the compression methods selected by the compressionMethod of the DataFormatIdentifier.
+
+The values of compressionMethod are manufacturer specific, method ``0x1`` is registered as zlib
+(deflate with zlib header). Further methods are registered with a factory for a streaming
+compressor and decompressor, with the interface of ``zlib.compressobj`` and ``zlib.decompressobj``.
+    """
+    methods = {
+        0x1: (zlib.compressobj, zlib.decompressobj),
+    }
+
+    @staticmethod
+    def register(method, compressor_factory, decompressor_factory):
+        """
+Register a compression method.
+
+**Arguments:**
+
+* ``method``
+
+  / *Condition*: required / *Type*: int /
+
+  The compressionMethod of the DataFormatIdentifier (1 to 15).
+
+* ``compressor_factory``
+
+  / *Condition*: required / *Type*: callable /
+
+  Creates an object with ``compress(data)`` and ``flush()``.
+
+* ``decompressor_factory``
+
+  / *Condition*: required / *Type*: callable /
+
+  Creates an object with ``decompress(data)``, ``flush()`` and ``eof``.
+        """
+        method = int(method)
+        if not 0x1 <= method <= 0xF:
+            raise ValueError(f"Compression method must be in range 1 to 15, got {method}")
+        CompressionMethods.methods[method] = (compressor_factory, decompressor_factory)
+
+    @staticmethod
+    def get(method):
+        if method not in CompressionMethods.methods:
+            raise ValueError(f"Compression method 0x{method:X} of the DataFormatIdentifier is not registered. "
+                             f"Registered methods: {', '.join(f'0x{m:X}' for m in sorted(CompressionMethods.methods))}")
+        return CompressionMethods.methods[method]
+
+
+class CompressingReader:
+    """
+Compresses data in a worker thread while the compressed stream is read block by block.
+
+The worker compresses the data chunk by chunk into a bounded queue, so the compression of the
+next blocks overlaps with the transfer of the current block and the memory use is bounded.
+    """
+    CHUNK_SIZE = 64 * 1024
+    QUEUE_SIZE = 16
+
+    def __init__(self, data, compressor):
+        self.data = data
+        self.compressor = compressor
+        self.chunks = queue.Queue(CompressingReader.QUEUE_SIZE)
+        self.pending = bytearray()
+        self.end_of_data = False
+        self.compressed_size = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name="CompressingReader", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def __put(self, item):
+        # Gives up when the reader is closed before the end of the data
+        while not self.stop_event.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __run(self):
+        try:
+            for offset in range(0, len(self.data), CompressingReader.CHUNK_SIZE):
+                if self.stop_event.is_set():
+                    return
+                compressed = self.compressor.compress(self.data[offset:offset + CompressingReader.CHUNK_SIZE])
+                if compressed:
+                    self.__put(compressed)
+            self.__put(self.compressor.flush())
+            self.__put(None)
+        except Exception as e:
+            self.__put(e)
+
+    def read_into(self, buffer, length):
+        """
+Read the next bytes of the compressed stream into a buffer.
+
+**Returns:**
+
+* ``length``
+
+  / *Type*: int /
+
+  The number of bytes read, less than ``length`` only at the end of the stream.
+        """
+        while len(self.pending) < length and not self.end_of_data:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.end_of_data = True
+            elif isinstance(chunk, Exception):
+                raise Exception(f"Compression failed. Reason: {chunk}")
+            else:
+                self.pending += chunk
+        length = min(length, len(self.pending))
+        buffer[:length] = self.pending[:length]
+        del self.pending[:length]
+        self.compressed_size += length
+        return length
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class DecompressingWriter:
+    """
+Decompresses a received stream in a worker thread into an output buffer.
+
+The blocks are handed to the worker through a bounded queue, so the decompression overlaps with
+the transfer of the next blocks. The decompressed data has to fill the output exactly.
+    """
+    QUEUE_SIZE = 16
+
+    def __init__(self, output, decompressor):
+        self.output = output
+        self.decompressor = decompressor
+        self.blocks = queue.Queue(DecompressingWriter.QUEUE_SIZE)
+        self.written = 0
+        self.compressed_size = 0
+        self.error = None
+        self.end_of_stream = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name="DecompressingWriter", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def __write(self, data):
+        if self.written + len(data) > len(self.output):
+            raise ValueError(f"Decompressed data exceeds the size of {len(self.output)} bytes")
+        self.output[self.written:self.written + len(data)] = data
+        self.written += len(data)
+
+    def __run(self):
+        while True:
+            block = self.blocks.get()
+            if self.error is not None:
+                # The remaining blocks are dropped after an error, so that write() never blocks
+                if block is None:
+                    return
+                continue
+            try:
+                if block is None:
+                    self.__write(self.decompressor.flush())
+                    return
+                self.__write(self.decompressor.decompress(block))
+                if getattr(self.decompressor, "eof", False):
+                    self.end_of_stream.set()
+            except Exception as e:
+                self.error = e
+                self.end_of_stream.set()
+                if block is None:
+                    return
+
+    def is_finished(self):
+        """
+Check whether the compressed stream has ended or failed, then no more blocks are needed.
+        """
+        return self.end_of_stream.is_set()
+
+    def write(self, block):
+        self.compressed_size += len(block)
+        self.blocks.put(block)
+
+    def finish(self):
+        """
+Wait until all blocks are decompressed and check that the output is filled completely.
+        """
+        self.blocks.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise Exception(f"Decompression failed. Reason: {self.error}")
+        if self.written != len(self.output):
+            raise ValueError(f"Decompressed {self.written} bytes, expected {len(self.output)} bytes")
+
+    def abort(self):
+        """
+Stop the worker after a failed transfer, without checking the output.
+        """
+        self.blocks.put(None)
+        self.thread.join()
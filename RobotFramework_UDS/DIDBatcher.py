@@ -0,0 +1,158 @@
+from udsoncan import DidCodec
+
+
+class DIDBatcher:
+    """
+Splits the DIDs of a ReadDataByIdentifier request into batches which the ECU accepts.
+
+A batch holds at most ``max_dids`` DIDs and its positive response at most ``max_response_length``
+bytes, a limit of None is not checked. A DID whose response length is not static is always the
+last DID of its batch, because its data runs until the end of the response.
+
+The limits are learned from the negative responses of the ECU: after incorrectMessageLengthOrInvalidFormat
+a batch holds less DIDs, after responseTooLong its response is shorter than the rejected one. The rejected
+batch itself is split in halves, so the limits converge to the ones of the ECU over the next requests
+while every request needs only few retries.
+    """
+    NRC_INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT = 0x13
+    NRC_RESPONSE_TOO_LONG = 0x14
+    # Maximum payload of ISO-TP with 12 bit length
+    ISOTP_MAX_RESPONSE_LENGTH = 4095
+
+    def __init__(self, max_dids=None, max_response_length=None):
+        self.max_dids = None
+        self.max_response_length = None
+        self.learned = False
+        self.set_limits(max_dids, max_response_length)
+
+    def set_limits(self, max_dids=None, max_response_length=None):
+        """
+Set the limits, a limit of None is not checked.
+        """
+        self.max_dids = int(max_dids) if max_dids is not None else None
+        self.max_response_length = int(max_response_length) if max_response_length is not None else None
+        self.learned = False
+
+    def get_limits(self):
+        """
+Get the limits, and whether they were learned from negative responses.
+        """
+        return {"max_dids": self.max_dids, "max_response_length": self.max_response_length, "learned": self.learned}
+
+    @staticmethod
+    def get_record_length(did_codec, did):
+        """
+Get the length of the DID and its data in the response, or None if the length is not static.
+        """
+        codec = did_codec.get(did)
+        if codec is None:
+            return None
+        try:
+            return 2 + len(codec)
+        except DidCodec.ReadAllRemainingData:
+            return None
+
+    def split(self, data_id_list, did_codec):
+        """
+Split DIDs into batches within the limits.
+
+**Arguments:**
+
+* ``data_id_list``
+
+  / *Condition*: required / *Type*: list[int] /
+
+  The DIDs in request order.
+
+* ``did_codec``
+
+  / *Condition*: required / *Type*: dict /
+
+  The DID codecs of ReadDataByIdentifier, used to get the response length of the DIDs.
+
+**Returns:**
+
+* ``batches``
+
+  / *Type*: list[list[int]] /
+
+  The DIDs of the requests in request order.
+        """
+        batches = []
+        batch = []
+        response_length = 1
+        for did in data_id_list:
+            record_length = DIDBatcher.get_record_length(did_codec, did)
+            if batch and ((self.max_dids is not None and len(batch) >= self.max_dids) or
+                          (self.max_response_length is not None and record_length is not None and
+                           response_length + record_length > self.max_response_length)):
+                batches.append(batch)
+                batch = []
+                response_length = 1
+            batch.append(did)
+            if record_length is None:
+                # The data of this DID reaches until the end of the response
+                batches.append(batch)
+                batch = []
+                response_length = 1
+            else:
+                response_length += record_length
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def learn(self, batch, nrc, did_codec):
+        """
+Lower the limits after a batch was rejected with a negative response.
+
+**Arguments:**
+
+* ``batch``
+
+  / *Condition*: required / *Type*: list[int] /
+
+  The DIDs of the rejected request.
+
+* ``nrc``
+
+  / *Condition*: required / *Type*: int /
+
+  The negative response code.
+
+* ``did_codec``
+
+  / *Condition*: required / *Type*: dict /
+
+  The DID codecs of ReadDataByIdentifier.
+
+**Returns:**
+
+* ``learned``
+
+  / *Type*: bool /
+
+  True if the rejected batch is split and read again, False if the request can not be split further
+  or the negative response is not caused by a limit.
+        """
+        if len(batch) < 2 or nrc not in (DIDBatcher.NRC_INCORRECT_MESSAGE_LENGTH_OR_INVALID_FORMAT, DIDBatcher.NRC_RESPONSE_TOO_LONG):
+            return False
+
+        record_lengths = [DIDBatcher.get_record_length(did_codec, did) for did in batch]
+        if nrc == DIDBatcher.NRC_RESPONSE_TOO_LONG and None not in record_lengths:
+            max_response_length = sum(record_lengths)
+            if self.max_response_length is None or max_response_length < self.max_response_length:
+                self.max_response_length = max_response_length
+        else:
+            max_dids = len(batch) - 1
+            if self.max_dids is None or max_dids < self.max_dids:
+                self.max_dids = max_dids
+        self.learned = True
+        return True
+
+    @staticmethod
+    def split_rejected(batch):
+        """
+Split a rejected batch in halves for the retry.
+        """
+        middle = len(batch) // 2
+        return [batch[:middle], batch[middle:]]
@@ -0,0 +1,528 @@
+from robot.api import logger
+from udsoncan.Response import Response
+from udsoncan.exceptions import NegativeResponseException, TimeoutException, UnexpectedResponseException
+from array import array
+import mmap
+import os
+import time
+
+
+class DataTransfer:
+    """
+Transfers a memory area block by block with the TransferData service.
+
+The data of a download is read from a memory-mapped file into one preallocated request buffer,
+so sending a block does not allocate new buffers in Python. The data of an upload is written
+from each response straight into a memory-mapped output file, so the memory use does not depend
+on the size of the transfer. The block sequence counter starts at 1 and wraps from 0xFF to 0x00.
+A block which times out or is answered with busyRepeatRequest is requested again with the same
+sequence counter, up to ``max_retries`` times.
+
+Compressed transfers stream the data through a ``CompressingReader`` or ``DecompressingWriter``,
+which compress or decompress it in a worker thread while the blocks are transferred.
+
+Every acknowledged block is recorded in a ``TransferCheckpoint``. A transfer which is interrupted
+is continued from its checkpoint by calling the same method again, the statistics of all calls
+are collected in one ``TransferStatistics``.
+    """
+    TRANSFER_DATA_SID = 0x36
+    TRANSFER_DATA_POSITIVE_RESPONSE = 0x76
+    # Negative responses after which the same block is sent again
+    RETRY_NRCS = (0x21,)
+    # Answer of the ECU to a TransferData request after the last block of an upload
+    NRC_REQUEST_SEQUENCE_ERROR = 0x24
+    # Errors after which the connection is considered lost once the retries of a block are exhausted
+    CONNECTION_ERRORS = (TimeoutException, TimeoutError, ConnectionError)
+    # Negative responses to TransferData of an ECU which has lost the transfer, e.g. after the DoIPClient
+    # reconnected by itself: conditionsNotCorrect, requestSequenceError, securityAccessDenied,
+    # uploadDownloadNotAccepted, transferDataSuspended and serviceNotSupportedInActiveSession
+    TRANSFER_LOST_NRCS = (0x22, 0x24, 0x33, 0x70, 0x71, 0x7F)
+
+    def __init__(self, client, max_retries=3):
+        self.client = client
+        self.max_retries = int(max_retries)
+        self.retries = 0
+        # Number of retries of the blocks which needed any, by block index
+        self.block_retries = {}
+        self.statistics = None
+
+    @staticmethod
+    def next_sequence_counter(sequence_counter):
+        return (sequence_counter + 1) & 0xFF
+
+    @staticmethod
+    def get_block_length(max_length):
+        """
+Get the number of data bytes per TransferData request from the maxNumberOfBlockLength of the ECU,
+which includes the service id and the block sequence counter.
+        """
+        block_length = max_length - 2
+        if block_length < 1:
+            raise ValueError(f"maxNumberOfBlockLength {max_length} of the ECU leaves no space for data")
+        return block_length
+
+    @staticmethod
+    def is_interrupted(error):
+        """
+Check whether a transfer failed because of a lost connection or a lost transfer state of the ECU.
+        """
+        if isinstance(error, DataTransfer.CONNECTION_ERRORS):
+            return True
+        return isinstance(error, NegativeResponseException) \
+            and error.response.service.request_id() == DataTransfer.TRANSFER_DATA_SID \
+            and error.response.code in DataTransfer.TRANSFER_LOST_NRCS
+
+    def get_statistics(self, block_count):
+        """
+Get the statistics of the transfer, they are created and started by the first call.
+        """
+        if self.statistics is None:
+            self.statistics = TransferStatistics(block_count)
+            self.statistics.start()
+        return self.statistics
+
+    def send_block(self, request, sequence_counter, block_index):
+        """
+Send one TransferData request, again if it fails temporarily, and return the response.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.client.exchange(request)
+            except (TimeoutException, TimeoutError, ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                error = e
+            else:
+                if response[:1] == bytes([DataTransfer.TRANSFER_DATA_POSITIVE_RESPONSE]):
+                    if len(response) < 2:
+                        raise UnexpectedResponseException(Response.from_payload(response),
+                                                          f"TransferData response without block sequence counter, expected 0x{sequence_counter:02X}")
+                    if response[1] != sequence_counter:
+                        raise UnexpectedResponseException(Response.from_payload(response),
+                                                          f"TransferData response for block sequence counter 0x{response[1]:02X}, expected 0x{sequence_counter:02X}")
+                    return response
+                if response[:1] != b"\x7F" or len(response) < 3:
+                    raise UnexpectedResponseException(Response.from_payload(response),
+                                                      f"Unexpected response to TransferData: {bytes(response).hex()}")
+                if response[2] not in DataTransfer.RETRY_NRCS or attempt >= self.max_retries:
+                    raise NegativeResponseException(Response.from_payload(response))
+                error = f"negative response 0x{response[2]:02X}"
+            attempt += 1
+            self.retries += 1
+            self.block_retries[block_index] = attempt
+            logger.info(f"Retry TransferData block {block_index} (counter 0x{sequence_counter:02X}, {attempt}/{self.max_retries}). Reason: {error}")
+
+    def download(self, data, block_length, checkpoint=None):
+        """
+Send data with TransferData requests, starting at the checkpoint.
+
+**Arguments:**
+
+* ``data``
+
+  / *Condition*: required / *Type*: memoryview /
+
+  The data to transfer.
+
+* ``block_length``
+
+  / *Condition*: required / *Type*: int /
+
+  The number of data bytes per request.
+
+* ``checkpoint``
+
+  / *Condition*: optional / *Type*: TransferCheckpoint / *Default*: None /
+
+  The position to start at, it is advanced with every acknowledged block. By default the transfer starts at the beginning.
+
+**Returns:**
+
+* ``statistics``
+
+  / *Type*: TransferStatistics /
+
+  The statistics of the transfer.
+        """
+        if checkpoint is None:
+            checkpoint = TransferCheckpoint()
+        data_length = len(data)
+        statistics = self.get_statistics((data_length + block_length - 1) // block_length)
+
+        buffer = bytearray(2 + block_length)
+        buffer[0] = DataTransfer.TRANSFER_DATA_SID
+        buffer_view = memoryview(buffer)
+        # Without a connection which copies the request, every block has to be sent as own bytes object
+        reuse_buffer = self.client.can_send_buffer()
+
+        while checkpoint.offset < data_length:
+            offset = checkpoint.offset
+            length = min(block_length, data_length - offset)
+            buffer[1] = checkpoint.sequence_counter
+            buffer_view[2:2 + length] = data[offset:offset + length]
+            request = buffer_view[:2 + length] if reuse_buffer else bytes(buffer_view[:2 + length])
+
+            block_start = time.perf_counter()
+            self.send_block(request, checkpoint.sequence_counter, checkpoint.block_index)
+            statistics.add_block(checkpoint.block_index, length, time.perf_counter() - block_start)
+            checkpoint.acknowledge(length)
+        statistics.stop(self.retries, self.block_retries)
+        return statistics
+
+    def upload(self, output, block_length, checkpoint=None):
+        """
+Receive data with TransferData requests, starting at the checkpoint.
+
+**Arguments:**
+
+* ``output``
+
+  / *Condition*: required / *Type*: memoryview /
+
+  The writable buffer for the data, its length is the number of bytes to transfer.
+
+* ``block_length``
+
+  / *Condition*: required / *Type*: int /
+
+  The maximum number of data bytes per response.
+
+* ``checkpoint``
+
+  / *Condition*: optional / *Type*: TransferCheckpoint / *Default*: None /
+
+  The position to start at, it is advanced with every acknowledged block. By default the transfer starts at the beginning.
+
+**Returns:**
+
+* ``statistics``
+
+  / *Type*: TransferStatistics /
+
+  The statistics of the transfer.
+        """
+        if checkpoint is None:
+            checkpoint = TransferCheckpoint()
+        data_length = len(output)
+        statistics = self.get_statistics((data_length + block_length - 1) // block_length)
+        # The requests only consist of the service id and the sequence counter
+        requests = [bytes([DataTransfer.TRANSFER_DATA_SID, counter]) for counter in range(0x100)]
+
+        while checkpoint.offset < data_length:
+            offset = checkpoint.offset
+            sequence_counter = checkpoint.sequence_counter
+            block_start = time.perf_counter()
+            response = self.send_block(requests[sequence_counter], sequence_counter, checkpoint.block_index)
+            length = len(response) - 2
+            if length < 1 or length > block_length or offset + length > data_length:
+                raise UnexpectedResponseException(Response.from_payload(response),
+                                                  f"TransferData block 0x{sequence_counter:02X} has {length} data bytes, "
+                                                  f"expected 1 to {min(block_length, data_length - offset)}")
+            output[offset:offset + length] = response[2:]
+            statistics.add_block(checkpoint.block_index, length, time.perf_counter() - block_start)
+            checkpoint.acknowledge(length)
+        statistics.stop(self.retries, self.block_retries)
+        return statistics
+
+    def download_stream(self, reader, block_length, checkpoint=None):
+        """
+Send a stream of unknown length, e.g. compressed data, with TransferData requests.
+
+**Arguments:**
+
+* ``reader``
+
+  / *Condition*: required / *Type*: CompressingReader /
+
+  The stream, ``read_into(buffer, length)`` returns less than ``length`` bytes only at its end.
+
+* ``block_length``
+
+  / *Condition*: required / *Type*: int /
+
+  The number of data bytes per request.
+
+* ``checkpoint``
+
+  / *Condition*: optional / *Type*: TransferCheckpoint / *Default*: None /
+
+  The position to start at, it is advanced with every acknowledged block. By default the transfer starts at the beginning.
+
+**Returns:**
+
+* ``statistics``
+
+  / *Type*: TransferStatistics /
+
+  The statistics of the transfer, ``bytes`` counts the transferred stream.
+        """
+        if checkpoint is None:
+            checkpoint = TransferCheckpoint()
+        statistics = self.get_statistics(0)
+        buffer = bytearray(2 + block_length)
+        buffer[0] = DataTransfer.TRANSFER_DATA_SID
+        buffer_view = memoryview(buffer)
+        reuse_buffer = self.client.can_send_buffer()
+
+        while True:
+            length = reader.read_into(buffer_view[2:], block_length)
+            if length == 0:
+                break
+            buffer[1] = checkpoint.sequence_counter
+            request = buffer_view[:2 + length] if reuse_buffer else bytes(buffer_view[:2 + length])
+
+            block_start = time.perf_counter()
+            self.send_block(request, checkpoint.sequence_counter, checkpoint.block_index)
+            statistics.add_block(checkpoint.block_index, length, time.perf_counter() - block_start)
+            checkpoint.acknowledge(length)
+            if length < block_length:
+                break
+        statistics.stop(self.retries, self.block_retries)
+        return statistics
+
+    def upload_stream(self, writer, block_length, checkpoint=None):
+        """
+Receive a stream of unknown length, e.g. compressed data, with TransferData requests.
+
+The transfer ends with a block shorter than ``block_length``, when the writer has received the
+end of the stream, or when the ECU answers requestSequenceError because it has no more data.
+
+**Arguments:**
+
+* ``writer``
+
+  / *Condition*: required / *Type*: DecompressingWriter /
+
+  The consumer of the stream, with ``write(block)`` and ``is_finished()``.
+
+* ``block_length``
+
+  / *Condition*: required / *Type*: int /
+
+  The maximum number of data bytes per response.
+
+* ``checkpoint``
+
+  / *Condition*: optional / *Type*: TransferCheckpoint / *Default*: None /
+
+  The position to start at, it is advanced with every acknowledged block. By default the transfer starts at the beginning.
+
+**Returns:**
+
+* ``statistics``
+
+  / *Type*: TransferStatistics /
+
+  The statistics of the transfer, ``bytes`` counts the transferred stream.
+        """
+        if checkpoint is None:
+            checkpoint = TransferCheckpoint()
+        statistics = self.get_statistics(0)
+        requests = [bytes([DataTransfer.TRANSFER_DATA_SID, counter]) for counter in range(0x100)]
+
+        while not writer.is_finished():
+            sequence_counter = checkpoint.sequence_counter
+            block_start = time.perf_counter()
+            try:
+                response = self.send_block(requests[sequence_counter], sequence_counter, checkpoint.block_index)
+            except NegativeResponseException as e:
+                if e.response.code == DataTransfer.NRC_REQUEST_SEQUENCE_ERROR and checkpoint.block_index > 0:
+                    break
+                raise
+            length = len(response) - 2
+            if length < 1 or length > block_length:
+                raise UnexpectedResponseException(Response.from_payload(response),
+                                                  f"TransferData block 0x{sequence_counter:02X} has {length} data bytes, expected 1 to {block_length}")
+            writer.write(response[2:])
+            statistics.add_block(checkpoint.block_index, length, time.perf_counter() - block_start)
+            checkpoint.acknowledge(length)
+            if length < block_length:
+                break
+        statistics.stop(self.retries, self.block_retries)
+        return statistics
+
+    @staticmethod
+    def create_output_file(file_path, size):
+        """
+Create an output file of the given size and memory-map it for writing.
+
+**Returns:**
+
+* ``file``
+
+  / *Type*: file /
+
+  The opened file, it has to be closed after the mapping.
+
+* ``mapping``
+
+  / *Type*: mmap /
+
+  The writable mapping of the whole file.
+        """
+        if size < 1:
+            raise ValueError(f"Size of {file_path} must be positive, got {size}")
+        output_dir = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(output_dir, exist_ok=True)
+        f = open(file_path, "w+b")
+        try:
+            f.truncate(size)
+            return f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_WRITE)
+        except Exception:
+            f.close()
+            raise
+
+    @staticmethod
+    def map_file(file_path):
+        """
+Memory-map a file for reading.
+
+**Returns:**
+
+* ``file``
+
+  / *Type*: file /
+
+  The opened file, it has to be closed after the mapping.
+
+* ``mapping``
+
+  / *Type*: mmap /
+
+  The read-only mapping of the whole file.
+        """
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File {file_path} does not exists")
+        if os.path.getsize(file_path) == 0:
+            raise ValueError(f"File {file_path} is empty")
+        f = open(file_path, "rb")
+        try:
+            return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+
+
+class TransferCheckpoint:
+    """
+The position of a transfer after the last block acknowledged by the ECU.
+
+After a connection loss the transfer is resumed with a new RequestDownload or RequestUpload
+for the memory behind ``offset``, the block sequence counter then starts at 1 again. If the
+ECU does not allow this, the transfer is restarted from the beginning.
+    """
+    def __init__(self):
+        self.offset = 0
+        self.block_index = 0
+        self.sequence_counter = 1
+
+    def acknowledge(self, length):
+        self.offset += length
+        self.block_index += 1
+        self.sequence_counter = DataTransfer.next_sequence_counter(self.sequence_counter)
+
+    def resume(self):
+        """
+Continue at the offset after a new transfer request.
+        """
+        self.sequence_counter = 1
+
+    def restart(self):
+        """
+Start again from the beginning.
+        """
+        self.offset = 0
+        self.block_index = 0
+        self.sequence_counter = 1
+
+
+class TransferStatistics:
+    """
+Throughput, per-block latency and retries of a transfer.
+    """
+    def __init__(self, block_count):
+        self.block_count = block_count
+        self.latencies = array("d", bytes(8 * block_count))
+        self.transferred = 0
+        self.retries = 0
+        self.block_retries = {}
+        self.reconnects = 0
+        self.start_time = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def add_block(self, block_index, length, latency):
+        # Streams and ECUs which send shorter blocks than announced have more blocks than estimated
+        if block_index < self.block_count:
+            self.latencies[block_index] = latency
+        else:
+            self.latencies.append(latency)
+            self.block_count += 1
+        self.transferred += length
+
+    def stop(self, retries, block_retries=None):
+        self.elapsed = time.perf_counter() - self.start_time
+        self.retries = retries
+        self.block_retries = dict(block_retries or {})
+
+    def get_report(self, data_length=None):
+        """
+Get the statistics as dictionary.
+
+**Arguments:**
+
+* ``data_length``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The length of the uncompressed data if the transferred stream was compressed.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  The ``bytes`` of data, the ``transferred_bytes`` in ``blocks`` within ``elapsed`` seconds, the effective
+  ``throughput`` of the data in bytes/s, the ``latency_min``, ``latency_mean``, ``latency_p95`` and
+  ``latency_max`` of the blocks in seconds, the number of ``retries``, the ``block_retries`` by block
+  index of the blocks which needed retries and the number of ``reconnects``.
+        """
+        if data_length is None:
+            data_length = self.transferred
+        latencies = sorted(self.latencies)
+        report = {
+            "bytes": data_length,
+            "transferred_bytes": self.transferred,
+            "blocks": self.block_count,
+            "elapsed": self.elapsed,
+            "throughput": data_length / self.elapsed if self.elapsed > 0 else None,
+            "latency_min": None,
+            "latency_mean": None,
+            "latency_p95": None,
+            "latency_max": None,
+            "retries": self.retries,
+            "block_retries": self.block_retries,
+            "reconnects": self.reconnects,
+        }
+        if latencies:
+            report["latency_min"] = latencies[0]
+            report["latency_mean"] = sum(latencies) / len(latencies)
+            report["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            report["latency_max"] = latencies[-1]
+        return report
+
+    @staticmethod
+    def format_report(report, action):
+        """
+Format a report for the log. Values which were not measured, e.g. for an empty image, are logged as n/a.
+        """
+        throughput = f"{report['throughput'] / 1024:.1f} KiB/s" if report["throughput"] is not None else "n/a"
+        latency_mean = f"{report['latency_mean'] * 1000:.2f} ms" if report["latency_mean"] is not None else "n/a"
+        latency_max = f"{report['latency_max'] * 1000:.2f} ms" if report["latency_max"] is not None else "n/a"
+        return (f"{action} {report['bytes']} bytes in {report['elapsed']:.3f} s ({throughput}), "
+                f"block latency mean {latency_mean}, max {latency_max}, "
+                f"{report['retries']} retries, {report['reconnects']} reconnects")
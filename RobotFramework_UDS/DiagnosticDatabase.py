@@ -0,0 +1,247 @@
+from robot.api import logger
+from .DiagnosticServices import DiagnosticServices
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+
+class DiagnosticDatabase:
+    """
+Diagnostic database of several ECUs, each given by a PDX file, a variant and its logical address.
+
+The PDX files are parsed in parallel by worker processes, every PDX file and variant
+is parsed only once even if it is used by several ECUs. The global indexes map
+
+* ``(logical address, service name)`` to the service, and
+* ``(logical address, DID)`` to the services of this DID per service id.
+
+The ``DiagnosticServices`` of an ECU can be bound directly to a device.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.services_by_name = {}
+        self.services_by_did = {}
+
+    @staticmethod
+    def load_diag_layer(pdx_file, variant, variant_scoped=False):
+        """
+Load the diag layer of a PDX variant, this function is executed in the worker processes.
+
+The ODX objects reference each other strongly, so the diag layer stays usable without its database.
+        """
+        with DiagnosticServices.non_strict_mode():
+            if variant_scoped:
+                odx_db = DiagnosticServices.load_variant_scoped_db(pdx_file, variant, use_weakrefs=False)
+            else:
+                odx_db = DiagnosticServices.load_pdx_db(pdx_file, use_weakrefs=False)
+        return odx_db.ecus[variant]
+
+    @staticmethod
+    def parse_entry(entry):
+        """
+Normalize a database entry, given as dictionary or as sequence ``(pdx_file, variant, logical_address)``.
+
+**Arguments:**
+
+* ``entry``
+
+  / *Condition*: required / *Type*: dict or list /
+
+  The entry with ``pdx_file``, ``variant`` and ``logical_address``.
+
+**Returns:**
+
+* ``entry``
+
+  / *Type*: tuple /
+
+  The PDX file, the variant and the logical address as int.
+        """
+        if isinstance(entry, dict):
+            missing_params = [param for param in ("pdx_file", "variant", "logical_address") if param not in entry]
+            if missing_params:
+                raise ValueError(f"Missing required parameter(s) of PDX database entry {entry}: {', '.join(missing_params)}")
+            pdx_file, variant, logical_address = entry["pdx_file"], entry["variant"], entry["logical_address"]
+        else:
+            if len(entry) != 3:
+                raise ValueError(f"PDX database entry {entry} must consist of the PDX file, the variant and the logical address")
+            pdx_file, variant, logical_address = entry
+
+        if isinstance(logical_address, str):
+            logical_address = int(logical_address)
+        return pdx_file, variant, logical_address
+
+    def load(self, pdx_entries, processes=None, pdx_cache=None, variant_scoped=False, low_memory=False):
+        """
+Load the PDX files of several ECUs and build the global indexes.
+
+**Arguments:**
+
+* ``pdx_entries``
+
+  / *Condition*: required / *Type*: list /
+
+  The entries with PDX file, variant and logical address of the ECUs, see ``parse_entry``.
+
+* ``processes``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The number of worker processes, by default one per CPU. With ``0`` or ``1``, or if there is
+  only one PDX file to parse, the PDX files are parsed in this process.
+
+* ``pdx_cache``
+
+  / *Condition*: optional / *Type*: PDXCache / *Default*: None /
+
+  The persistent PDX cache, cached variants are not parsed again and parsed ones are stored.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, only the diag layers the variants inherit from are parsed.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, each variant is pruned to the objects it needs.
+        """
+        entries = [self.parse_entry(entry) for entry in pdx_entries]
+        start = time.perf_counter()
+
+        # every PDX file and variant is loaded once
+        diag_layers = {}
+        for pdx_file, variant, _ in entries:
+            key = (os.path.abspath(pdx_file), variant)
+            if key not in diag_layers:
+                diag_layers[key] = pdx_cache.load(pdx_file, variant) if pdx_cache is not None else None
+        pending_keys = [key for key, diag_layer in diag_layers.items() if diag_layer is None]
+
+        if pending_keys:
+            # The diag layers are transferred from the workers by pickling, which only pays off
+            # if several PDX files are parsed on several CPUs at the same time.
+            if processes is None:
+                processes = os.cpu_count() or 1
+            max_workers = min(int(processes), len(pending_keys))
+            if max_workers <= 1:
+                for key in pending_keys:
+                    diag_layers[key] = DiagnosticDatabase.load_diag_layer(key[0], key[1], variant_scoped)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {key: executor.submit(DiagnosticDatabase.load_diag_layer, key[0], key[1], variant_scoped) for key in pending_keys}
+                    for key, future in futures.items():
+                        try:
+                            diag_layers[key] = future.result()
+                        except Exception as e:
+                            raise Exception(f"Unable to load PDX {key[0]} ({key[1]}). Reason: {e}")
+            if pdx_cache is not None:
+                for key in pending_keys:
+                    pdx_cache.store(key[0], key[1], diag_layers[key])
+
+        diag_service_dbs = {}
+        for pdx_file, variant, logical_address in entries:
+            key = (os.path.abspath(pdx_file), variant)
+            if key not in diag_service_dbs:
+                diag_service_dbs[key] = DiagnosticServices(pdx_file, variant, low_memory=low_memory, diag_layer=diag_layers[key])
+            self.add_entry(logical_address, diag_service_dbs[key])
+
+        logger.info(f"Loaded {len(diag_service_dbs)} PDX variant(s) for {len(entries)} ECU(s) in {time.perf_counter() - start:.2f} s")
+
+    def add_entry(self, logical_address, diag_service_db):
+        """
+Add the diagnostic services of an ECU and index them by its logical address.
+
+**Arguments:**
+
+* ``logical_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The logical address of the ECU.
+
+* ``diag_service_db``
+
+  / *Condition*: required / *Type*: DiagnosticServices /
+
+  The loaded PDX variant of the ECU.
+        """
+        if logical_address in self.entries:
+            self.remove_entry(logical_address)
+        self.entries[logical_address] = diag_service_db
+        for service_name, service in diag_service_db.services_by_name.items():
+            self.services_by_name[(logical_address, service_name)] = service
+        for service_id, did_services in diag_service_db.services_by_did.items():
+            for did, service in did_services.items():
+                self.services_by_did.setdefault((logical_address, did), {})[service_id] = service
+
+    def remove_entry(self, logical_address):
+        """
+Remove the diagnostic services of an ECU.
+        """
+        self.entries.pop(logical_address, None)
+        self.services_by_name = {key: service for key, service in self.services_by_name.items() if key[0] != logical_address}
+        self.services_by_did = {key: services for key, services in self.services_by_did.items() if key[0] != logical_address}
+
+    def get_entry(self, logical_address):
+        """
+Retrieve the diagnostic services of an ECU.
+
+**Arguments:**
+
+* ``logical_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The logical address of the ECU.
+
+**Returns:**
+
+* ``diag_service_db``
+
+  / *Type*: DiagnosticServices /
+
+  The loaded PDX variant of the ECU, or None if the database has no entry for the address.
+        """
+        return self.entries.get(logical_address)
+
+    def get_service(self, logical_address, service, service_id=0x22):
+        """
+Retrieve a diagnostic service of an ECU by its name or DID.
+
+**Arguments:**
+
+* ``logical_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The logical address of the ECU.
+
+* ``service``
+
+  / *Condition*: required / *Type*: str or int /
+
+  The service's name or the DID.
+
+* ``service_id``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0x22 /
+
+  The service id if a DID is given, e.g. 0x2E for WriteDataByIdentifier.
+
+**Returns:**
+
+* ``diag_service``
+
+  / *Type*: object /
+
+  The diagnostic service.
+        """
+        if isinstance(service, int):
+            diag_service = self.services_by_did.get((logical_address, service), {}).get(service_id)
+        else:
+            diag_service = self.services_by_name.get((logical_address, service))
+        if diag_service is None:
+            raise Exception(f"Diagnostic database does not contain service {service} for logical address {logical_address}")
+        return diag_service
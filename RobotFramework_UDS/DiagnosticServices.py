@@ -1,69 +1,541 @@
 from robot.api import logger
 from udsoncan.common.DidCodec import DidCodec
+from odxtools.database import Database
+from .ServiceCompiler import ServiceCompiler, RequestConverter
+from .PDXArtifact import PDXArtifact
+from .LatencyStatistics import LatencyStatistics
+from collections import OrderedDict
+from contextlib import contextmanager
+from xml.etree import ElementTree
+from types import FunctionType, ModuleType
+from zipfile import ZipFile
+import gc
 import odxtools
-import re
+import os
+import sys
+import threading
+import time
 
 
 class DiagnosticServices:
-    def __init__(self, pdx_file, variant):
+    # Diag layer groups which are only loaded in variant scoped mode if the selected variant inherits from them
+    VARIANT_LAYER_GROUPS = ("ECU-VARIANTS", "BASE-VARIANTS", "FUNCTIONAL-GROUPS")
+    strict_mode_lock = threading.Lock()
+    non_strict_users = 0
+    DID_SERVICE_IDS = (0x22, 0x2E, 0x2F)
+    ROUTINE_CONTROL_SID = 0x31
+    COMPILED_CODEC_MODES = ("off", "on", "verify")
+    DEFAULT_REQUEST_CACHE_SIZE = 256
+
+    def __init__(self, pdx_file, variant, pdx_cache=None, variant_scoped=False, low_memory=False, diag_layer=None):
         self.variant = variant
         self.pdx_file = pdx_file
-        # load pdx file
-        odxtools.exceptions.strict_mode = False
-        self.odx_db = odxtools.load_pdx_file(self.pdx_file)
-        odxtools.exceptions.strict_mode = True
-        self.diag_layer = self.odx_db.ecus[self.variant]
-        self.diag_services = self.odx_db.ecus[self.variant].services
+        self.odx_db = None
+        # A diag layer which has already been loaded, e.g. by another process, is used as it is
+        self.diag_layer = diag_layer
+        self._diag_services = None
+        self.dtc_texts = None
+        self.memory_report = None
+        layer_data = None
+
+        if self.diag_layer is None and PDXArtifact.is_artifact(self.pdx_file):
+            # precompiled artifact, see PDXCompiler
+            catalog, layer_data = PDXArtifact.load(self.pdx_file, self.variant)
+            self.diag_layer = layer_data["diag_layer"]
+            self.dtc_texts = catalog["dtc_texts"]
+        elif self.diag_layer is None:
+            # try to reuse the variant from the PDX cache
+            if pdx_cache is not None:
+                self.diag_layer = pdx_cache.load(self.pdx_file, self.variant)
+
+            if self.diag_layer is None:
+                # load pdx file
+                # In low memory mode the diag layers reference each other strongly, so the variant
+                # keeps its parent layers alive when the database is released.
+                use_weakrefs = not low_memory
+                with DiagnosticServices.non_strict_mode():
+                    if variant_scoped:
+                        self.odx_db = self.load_variant_scoped_db(self.pdx_file, self.variant, use_weakrefs)
+                    else:
+                        self.odx_db = self.load_pdx_db(self.pdx_file, use_weakrefs)
+                self.diag_layer = self.odx_db.ecus[self.variant]
+                if pdx_cache is not None:
+                    pdx_cache.store(self.pdx_file, self.variant, self.diag_layer)
+
+        if low_memory:
+            self.prune()
+
+        # The service indexes are built on the first lookup, see build_service_indexes
+        self._service_indexes = None
+        self.service_indexes_lock = threading.Lock()
+        self.did_codecs = {}
+        self.response_prefixes = {}
+        self.compiled_codec_mode = "on"
+        self.compiled_requests = {}
+        self.compiled_responses = {}
+        self.request_converters = {}
+        if layer_data is not None:
+            self.compiled_requests = layer_data["compiled_requests"]
+            self.compiled_responses = layer_data["compiled_responses"]
+        self.request_cache = OrderedDict()
+        self.request_cache_size = DiagnosticServices.DEFAULT_REQUEST_CACHE_SIZE
+        self.request_cache_hits = 0
+        self.request_cache_misses = 0
+        self.request_cache_lock = threading.Lock()
 
     @staticmethod
-    def convert_sub_param(odx_param, req_sub_param):
+    @contextmanager
+    def non_strict_mode():
         """
-Recursive convert sub parameters in given request to correct data type
+Disable the odxtools strict mode while the block is executed.
+
+The strict mode is a global setting of odxtools, so it is only enabled again when
+the last of several concurrently loading threads has finished.
+        """
+        with DiagnosticServices.strict_mode_lock:
+            DiagnosticServices.non_strict_users += 1
+            odxtools.exceptions.strict_mode = False
+        try:
+            yield
+        finally:
+            with DiagnosticServices.strict_mode_lock:
+                DiagnosticServices.non_strict_users -= 1
+                if DiagnosticServices.non_strict_users == 0:
+                    odxtools.exceptions.strict_mode = True
+
+    @property
+    def diag_services(self):
+        # The service list is only collected when it is needed the first time
+        if self._diag_services is None:
+            self._diag_services = self.diag_layer.services
+        return self._diag_services
+
+    @staticmethod
+    def get_request_coded_value(service, position):
+        """
+Retrieve the coded value of a constant request parameter.
 
 **Arguments:**
 
-* ``odx_param``
+* ``service``
 
   / *Condition*: required / *Type*: object /
 
-  The ODX parameters.
+  The diagnostic service.
 
-* ``req_sub_param``
+* ``position``
 
-  / *Condition*: required / *Type*: dict /
+  / *Condition*: required / *Type*: int /
 
-  The dictionary of request parameter.
+  The position of the parameter in the request.
 
 **Returns:**
 
-* ``req_sub_param``
+* ``coded_value``
+
+  / *Type*: int /
+
+  The coded value, or None if the parameter does not exist or is not constant.
+        """
+        if service.request is None or len(service.request.parameters) <= position:
+            return None
+        return getattr(service.request.parameters[position], "coded_value", None)
+
+    def build_service_indexes(self):
+        """
+Build the lookup tables of the diagnostic services.
+
+* ``services_by_name``: service name -> service
+* ``services_by_sid``: service id -> list of services
+* ``services_by_did``: service id -> DID -> service, for ReadDataByIdentifier, WriteDataByIdentifier and InputOutputControlByIdentifier
+* ``services_by_routine``: (routine id, control type) -> service
+* ``did_by_name``: service name -> DID
+* ``routine_by_name``: service name -> (routine id, control type)
+
+If several services share a DID or routine, the one with a positive response is preferred.
+The tables are built when one of them is accessed the first time, so loading a PDX file
+for a few lookups does not pay for indexing all of its services.
+        """
+        services_by_name = {}
+        services_by_sid = {}
+        services_by_did = {}
+        services_by_routine = {}
+        did_by_name = {}
+        routine_by_name = {}
+
+        for service in self.diag_services:
+            services_by_name[service.short_name] = service
+            sid = self.get_request_coded_value(service, 0)
+            if sid is None:
+                continue
+            services_by_sid.setdefault(sid, []).append(service)
+
+            if sid in DiagnosticServices.DID_SERVICE_IDS:
+                did = self.get_request_coded_value(service, 1)
+                if did is not None:
+                    did_by_name[service.short_name] = did
+                    did_services = services_by_did.setdefault(sid, {})
+                    if did not in did_services or not did_services[did].positive_responses:
+                        did_services[did] = service
+            elif sid == DiagnosticServices.ROUTINE_CONTROL_SID:
+                control_type = self.get_request_coded_value(service, 1)
+                routine_id = self.get_request_coded_value(service, 2)
+                if control_type is not None and routine_id is not None:
+                    routine = (routine_id, control_type)
+                    routine_by_name[service.short_name] = routine
+                    if routine not in services_by_routine or not services_by_routine[routine].positive_responses:
+                        services_by_routine[routine] = service
+
+        self._service_indexes = {
+            "services_by_name": services_by_name,
+            "services_by_sid": services_by_sid,
+            "services_by_did": services_by_did,
+            "services_by_routine": services_by_routine,
+            "did_by_name": did_by_name,
+            "routine_by_name": routine_by_name,
+        }
+
+    def get_service_index(self, name):
+        # The database is shared by the devices, so only the first of several concurrent lookups builds the indexes
+        if self._service_indexes is None:
+            with self.service_indexes_lock:
+                if self._service_indexes is None:
+                    self.build_service_indexes()
+        return self._service_indexes[name]
+
+    services_by_name = property(lambda self: self.get_service_index("services_by_name"))
+    services_by_sid = property(lambda self: self.get_service_index("services_by_sid"))
+    services_by_did = property(lambda self: self.get_service_index("services_by_did"))
+    services_by_routine = property(lambda self: self.get_service_index("services_by_routine"))
+    did_by_name = property(lambda self: self.get_service_index("did_by_name"))
+    routine_by_name = property(lambda self: self.get_service_index("routine_by_name"))
+
+    def get_service_indexes(self):
+        """
+Retrieve a summary of the service lookup tables for introspection.
+
+**Returns:**
+
+* ``service_indexes``
 
   / *Type*: dict /
 
-  The dictionary of request parameters with the correct data types.
+  The service names per service id, the DIDs and routines with their service names.
+        """
+        return {
+            "services_by_sid": {sid: [service.short_name for service in services] for sid, services in self.services_by_sid.items()},
+            "services_by_did": {sid: {did: service.short_name for did, service in did_services.items()} for sid, did_services in self.services_by_did.items()},
+            "services_by_routine": {routine: service.short_name for routine, service in self.services_by_routine.items()},
+        }
+
+    def get_diag_service(self, service_name):
+        """
+Retrieve a diagnostic service by its name.
+
+**Arguments:**
+
+* ``service_name``
+
+  / *Condition*: required / *Type*: str /
+
+  The service's name
+
+**Returns:**
+
+* ``diag_service``
+
+  / *Type*: object /
+
+  The diagnostic service.
+        """
+        try:
+            return self.services_by_name[service_name]
+        except KeyError:
+            raise Exception(f"Diagnostic services does not contain an item named {service_name}")
+
+    def get_did_by_name(self, service_name):
+        """
+Retrieve the DID of a ReadDataByIdentifier, WriteDataByIdentifier or InputOutputControlByIdentifier service.
+
+**Arguments:**
+
+* ``service_name``
+
+  / *Condition*: required / *Type*: str /
+
+  The service's name
+
+**Returns:**
+
+* ``did``
+
+  / *Type*: int /
+
+  The data identifier of the service.
         """
         try:
-            org_val = req_sub_param[odx_param.short_name]
-            # process byte / byte string data
-            if isinstance(org_val, bytes):
-                # convert byte to hex data
-                org_val = org_val.hex()
-            elif isinstance(org_val, str):
-                match = re.match(r"^b['\"](.*)['\"]$", org_val, re.DOTALL)
-                if match:
-                    #convert byte string to hex data
-                    org_val = bytes(match.group(1), "latin1").hex()
-        except:
-            raise Exception(f"required parameter {odx_param.short_name} is missing")
-        
-        if odx_param.dop and hasattr(odx_param.dop, "parameters"):
-            for sub_param in odx_param.dop.parameters:
-                print(f"{odx_param.short_name} - {sub_param.short_name}")
-                req_sub_param[odx_param.short_name][sub_param.short_name] = DiagnosticServices.convert_sub_param(sub_param, org_val)
-            return req_sub_param[odx_param.short_name]
+            return self.did_by_name[service_name]
+        except KeyError:
+            self.get_diag_service(service_name)
+            raise Exception(f"Diagnostic service {service_name} does not have a data identifier")
+
+    def get_routine_by_name(self, service_name):
+        """
+Retrieve the routine identifier and control type of a RoutineControl service.
+
+**Arguments:**
+
+* ``service_name``
+
+  / *Condition*: required / *Type*: str /
+
+  The service's name
+
+**Returns:**
+
+* ``routine``
+
+  / *Type*: tuple /
+
+  The routine identifier and the control type.
+        """
+        try:
+            return self.routine_by_name[service_name]
+        except KeyError:
+            self.get_diag_service(service_name)
+            raise Exception(f"Diagnostic service {service_name} is not a routine control service")
+
+    @staticmethod
+    def create_db(use_weakrefs=True):
+        """
+Create an empty ODX database, odxtools versions without weak reference support always use strong references.
+        """
+        try:
+            return Database(use_weakrefs=use_weakrefs)
+        except TypeError:
+            return Database()
+
+    @staticmethod
+    def load_pdx_db(pdx_file, use_weakrefs=True):
+        """
+Load all diag layers of a PDX file.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``use_weakrefs``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If False, the ODX objects reference each other strongly, so a diag layer stays usable without the database.
+
+**Returns:**
+
+* ``odx_db``
+
+  / *Type*: Database /
+
+  The ODX database.
+        """
+        odx_db = DiagnosticServices.create_db(use_weakrefs)
+        odx_db.add_pdx_file(str(pdx_file))
+        odx_db.refresh()
+        return odx_db
+
+    @staticmethod
+    def get_object_graph_size(root):
+        """
+Calculate the memory of all objects reachable from an object, classes, modules and functions are not counted.
+
+**Arguments:**
+
+* ``root``
+
+  / *Condition*: required / *Type*: object /
+
+  The root object.
+
+**Returns:**
+
+* ``size``
+
+  / *Type*: int /
+
+  The size in bytes.
+        """
+        visited = set()
+        pending = [root]
+        size = 0
+        while pending:
+            obj = pending.pop()
+            if id(obj) in visited or isinstance(obj, (type, ModuleType, FunctionType)):
+                continue
+            visited.add(id(obj))
+            size += sys.getsizeof(obj)
+            pending.extend(gc.get_referents(obj))
+        return size
+
+    @staticmethod
+    def get_process_memory():
+        """
+Retrieve the resident memory of the process in bytes, or None if it is not available on this platform.
+        """
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss
+        except ImportError:
+            pass
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, AttributeError, ValueError):
+            return None
+
+    def prune(self):
+        """
+Release everything except the selected variant and the objects its services use.
+
+The ODX database with all other variants, the comparam specifications and the auxiliary
+files of the archive are dropped. The variant has resolved its inherited services, DOPs and
+comparams when the database was refreshed, so its parent layers are detached as well.
+They hold most of the memory, e.g. of the 22.4 MB retained by CTS_STLA_V1_15_2.pdx only
+5.6 MB are kept. Lookups through the parent layers, like the protocols of the variant, are
+not available anymore. This library does not use them.
+
+The resident memory of the process before and after pruning is logged and stored in ``memory_report``.
+It hardly shrinks right after pruning, because the Python allocator keeps the freed memory for the
+following loads. The option pays off when several databases are held, e.g. the process holding
+two copies of both bundled PDX files needs 181 MB instead of 251 MB.
+        """
+        process_before = self.get_process_memory()
+        self.odx_db = None
+        for parent_ref in getattr(self.diag_layer.diag_layer_raw, "parent_refs", []):
+            parent_ref._layer = None
+        gc.collect()
+        process_after = self.get_process_memory()
+        self.memory_report = {
+            "process_before": process_before,
+            "process_after": process_after,
+        }
+        logger.info(f"Pruned PDX {self.pdx_file} ({self.variant}): process {self.format_memory(process_before)} -> "
+                    f"{self.format_memory(process_after)}")
+
+    @staticmethod
+    def format_memory(size):
+        return "n/a" if size is None else f"{size / (1024 * 1024):.1f} MB"
+
+    def get_memory_report(self):
+        """
+Retrieve the memory of a database loaded in low memory mode.
+
+The retained size is calculated when the report is requested, walking the object graph takes
+too long to do it during every load.
+
+**Returns:**
+
+* ``memory_report``
+
+  / *Type*: dict /
+
+  The resident memory of the process before and after pruning (``process_before``, ``process_after``,
+  None if not available) and the size in bytes of the objects held by the database (``retained``),
+  or None if the database was not pruned.
+        """
+        if self.memory_report is None:
+            return None
+        return dict(self.memory_report, retained=self.get_object_graph_size(self.diag_layer))
+
+    @staticmethod
+    def load_variant_scoped_db(pdx_file, variant, use_weakrefs=True):
+        """
+Load a PDX file, but only build and resolve the diag layers the given variant inherits from.
+
+All other ECU variants, base variants and functional groups are removed from the
+XML trees before the ODX objects are created. Protocols, ECU shared data and
+comparam specifications are always kept. Auxiliary files of the archive are not loaded.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``use_weakrefs``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If False, the ODX objects reference each other strongly, so a diag layer stays usable without the database.
+
+**Returns:**
+
+* ``odx_db``
+
+  / *Type*: Database /
+
+  The ODX database which contains the selected variant and its parent layers.
+        """
+        odx_db = DiagnosticServices.create_db(use_weakrefs)
+        odx_trees = []
+        with ZipFile(pdx_file) as pdx_zip:
+            for zip_member in pdx_zip.namelist():
+                member_name = zip_member.lower().rsplit("/", 1)[-1]
+                if "." in member_name and member_name.rsplit(".", 1)[-1].startswith("odx"):
+                    odx_trees.append(ElementTree.parse(pdx_zip.open(zip_member)).getroot())
+                elif member_name == "index.xml":
+                    odx_db.short_name = ElementTree.parse(pdx_zip.open(zip_member)).getroot().findtext("SHORT-NAME")
+
+        # collect all diag layers with the IDs of their parents
+        layers = {}
+        variant_id = None
+        for odx_tree in odx_trees:
+            for group_tag in DiagnosticServices.VARIANT_LAYER_GROUPS:
+                for layer_group in odx_tree.findall(f"DIAG-LAYER-CONTAINER/{group_tag}"):
+                    for layer in layer_group:
+                        parent_ids = [parent_ref.get("ID-REF") for parent_ref in layer.findall("PARENT-REFS/PARENT-REF")]
+                        layers[layer.get("ID")] = (layer_group, layer, parent_ids)
+                        if layer.tag == "ECU-VARIANT" and layer.findtext("SHORT-NAME") == variant:
+                            variant_id = layer.get("ID")
+
+        if variant_id is None:
+            raise Exception(f"Variant {variant} does not exist in {pdx_file}")
+
+        # resolve the inheritance chain of the variant
+        required_ids = set()
+        pending_ids = [variant_id]
+        while pending_ids:
+            layer_id = pending_ids.pop()
+            if layer_id in required_ids or layer_id not in layers:
+                continue
+            required_ids.add(layer_id)
+            pending_ids.extend(layers[layer_id][2])
+
+        # A PDX file with a single variant has nothing to drop, its trees are used as they are
+        if len(required_ids) == len(layers):
+            logger.info(f"Load all {len(layers)} variant layers from {pdx_file}, the variant inherits from all of them")
         else:
-            return odx_param.physical_type.base_data_type.from_string(org_val)
-    
+            for layer_id, (layer_group, layer, _) in layers.items():
+                if layer_id not in required_ids:
+                    layer_group.remove(layer)
+            logger.info(f"Load {len(required_ids)} of {len(layers)} variant layers from {pdx_file}")
+
+        for odx_tree in odx_trees:
+            odx_db.add_odx_xml_tree(odx_tree)
+        odx_db.refresh()
+        return odx_db
+
     @staticmethod
     def convert_request_data_type(service, parameter_dict):
         """
@@ -81,7 +553,7 @@ Convert given request parameters (dictionary) to correct data type
 
   / *Condition*: required / *Type*: dict /
 
-  The dictionary of request parameter.
+  The dictionary of request parameter, it is not modified.
 
 **Returns:**
 
@@ -89,18 +561,19 @@ Convert given request parameters (dictionary) to correct data type
 
   / *Type*: dict /
 
-  The dictionary of request parameters with the correct data types.
+  A new dictionary of request parameters with the correct data types.
         """
-        request_parameters = service.request.parameters
-
-        # The parameters from the Robot test are strings, so they are converted to the right types.
-        for param in request_parameters:
-            # Just "VALUE" parameter are required for encode message
-            if param.parameter_type == "VALUE":
-                converted_param = DiagnosticServices.convert_sub_param(param, parameter_dict)
-                parameter_dict[param.short_name] = converted_param
+        return RequestConverter(service).convert(parameter_dict)
 
-        return parameter_dict
+    def get_request_converter(self, service):
+        """
+Retrieve the request parameter converter of a service, it is built once per service.
+        """
+        converter = self.request_converters.get(service.short_name)
+        if converter is None:
+            converter = RequestConverter(service)
+            self.request_converters[service.short_name] = converter
+        return converter
 
     def get_diag_service_by_name(self, service_name_list):
         """
@@ -124,15 +597,345 @@ Retrieve the list of diagnostic services from a PDX file using a specified list
         """
         diag_service_list = []
         for service_name in service_name_list:
-            try:
-                logger.info(f"Get {service_name} service")
-                diag_service = getattr(self.diag_services, service_name)
+            diag_service = self.services_by_name.get(service_name)
+            if diag_service is not None:
                 diag_service_list.append(diag_service)
-            except:
+            else:
                 logger.error(f"Diagnostic services does not contain an item named {service_name}")
 
         return diag_service_list
 
+    def set_compiled_codec_mode(self, mode):
+        """
+Select how requests and responses with a static layout are encoded and decoded.
+
+* ``off``: always use odxtools.
+* ``on``: use the compiled plans, other services are handled by odxtools.
+* ``verify``: use the compiled plans and cross-check every result against odxtools.
+  On a mismatch the odxtools result is used and the plan of the service is discarded.
+
+**Arguments:**
+
+* ``mode``
+
+  / *Condition*: required / *Type*: str /
+
+  One of ``off``, ``on`` or ``verify``.
+        """
+        mode = str(mode).lower()
+        if mode not in DiagnosticServices.COMPILED_CODEC_MODES:
+            raise ValueError(f"Invalid compiled codec mode {mode}, expected one of {', '.join(DiagnosticServices.COMPILED_CODEC_MODES)}")
+        self.compiled_codec_mode = mode
+
+    def get_compiled_request(self, service):
+        """
+Retrieve the compiled request of a service, or None if its layout is not static.
+        """
+        try:
+            return self.compiled_requests[service.short_name]
+        except KeyError:
+            compiled_request = ServiceCompiler.compile_message(service.request)
+            self.compiled_requests[service.short_name] = compiled_request
+            return compiled_request
+
+    def get_compiled_response(self, service):
+        """
+Retrieve the compiled positive response of a service, or None if its layout is not static.
+        """
+        try:
+            return self.compiled_responses[service.short_name]
+        except KeyError:
+            compiled_response = None
+            if service.positive_responses:
+                compiled_response = ServiceCompiler.compile_message(service.positive_responses[0])
+            self.compiled_responses[service.short_name] = compiled_response
+            return compiled_response
+
+    def encode_request(self, service, parameter_dict):
+        """
+Encode the request of a service, using the compiled plan if possible.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: required / *Type*: object /
+
+  The diagnostic service.
+
+* ``parameter_dict``
+
+  / *Condition*: required / *Type*: dict /
+
+  The request parameters with the correct data types.
+
+**Returns:**
+
+* ``encode_message``
+
+  / *Type*: bytes /
+
+  The encoded request.
+        """
+        latency_context = LatencyStatistics.get_context()
+        start = time.perf_counter() if latency_context is not None else None
+        encode_message = None
+        if self.compiled_codec_mode != "off":
+            compiled_request = self.get_compiled_request(service)
+            if compiled_request is not None:
+                encode_message = compiled_request.encode(parameter_dict)
+
+        if encode_message is None or self.compiled_codec_mode == "verify":
+            odx_message = bytes(service.encode_request(**parameter_dict))
+            if encode_message is not None and encode_message != odx_message:
+                logger.error(f"Compiled request of {service.short_name} differs from odxtools: {encode_message.hex()} != {odx_message.hex()}")
+                self.compiled_requests[service.short_name] = None
+            encode_message = odx_message
+
+        if latency_context is not None:
+            latency_context.record("encode", time.perf_counter() - start, service.short_name)
+        return encode_message
+
+    def decode_response(self, service, raw_message):
+        """
+Decode a response of a service, using the compiled plan of the positive response if possible.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: required / *Type*: object /
+
+  The diagnostic service.
+
+* ``raw_message``
+
+  / *Condition*: required / *Type*: bytes /
+
+  The complete response message.
+
+**Returns:**
+
+* ``decode_message``
+
+  / *Type*: dict /
+
+  The decoded parameters.
+        """
+        latency_context = LatencyStatistics.get_context()
+        start = time.perf_counter() if latency_context is not None else None
+        decode_message = None
+        if self.compiled_codec_mode != "off":
+            compiled_response = self.get_compiled_response(service)
+            # Longer messages are left to odxtools, which decides how to handle the trailing data
+            if compiled_response is not None and len(raw_message) == compiled_response.byte_length:
+                decode_message = compiled_response.decode(raw_message)
+
+        if decode_message is None or self.compiled_codec_mode == "verify":
+            odx_message = service.decode_message(raw_message).param_dict
+            if decode_message is not None and decode_message != odx_message:
+                logger.error(f"Compiled response of {service.short_name} differs from odxtools: {decode_message} != {odx_message}")
+                self.compiled_responses[service.short_name] = None
+            decode_message = odx_message
+
+        if latency_context is not None:
+            latency_context.record("decode", time.perf_counter() - start, service.short_name)
+        return decode_message
+
+    def compile_services(self):
+        """
+Compile the requests and positive responses of all services in advance, instead of on first use.
+        """
+        for service in self.diag_services:
+            self.get_compiled_request(service)
+            self.get_compiled_response(service)
+
+    def get_dtc_texts(self):
+        """
+Retrieve the texts of all diagnostic trouble codes of the variant.
+
+**Returns:**
+
+* ``dtc_texts``
+
+  / *Type*: dict /
+
+  The ``display_trouble_code`` and ``text`` per trouble code.
+        """
+        if self.dtc_texts is None:
+            dtc_texts = {}
+            dtc_dops = getattr(self.diag_layer.diag_data_dictionary_spec, "dtc_dops", None) or []
+            for dtc_dop in dtc_dops:
+                for dtc in dtc_dop.dtcs:
+                    # The text is a plain string in older odxtools versions
+                    text = getattr(dtc.text, "text", dtc.text)
+                    dtc_texts[dtc.trouble_code] = {"display_trouble_code": dtc.display_trouble_code, "text": text}
+            self.dtc_texts = dtc_texts
+        return self.dtc_texts
+
+    @staticmethod
+    def get_request_cache_key(service_name, parameter_dict):
+        """
+Build the request cache key of a service and its (not yet converted) parameters.
+
+Dictionaries are ordered by their keys and lists are converted to tuples, the
+type of every other value is part of the key, so e.g. ``1`` and ``"1"`` do not
+share an entry.
+
+**Arguments:**
+
+* ``service_name``
+
+  / *Condition*: required / *Type*: str /
+
+  The service's name
+
+* ``parameter_dict``
+
+  / *Condition*: required / *Type*: dict /
+
+  The dictionary of request parameter.
+
+**Returns:**
+
+* ``cache_key``
+
+  / *Type*: tuple /
+
+  The cache key, or None if the parameters can not be used as a key.
+        """
+        def canonicalize(value):
+            if isinstance(value, dict):
+                return (dict, tuple(sorted((key, canonicalize(item)) for key, item in value.items())))
+            if isinstance(value, (list, tuple)):
+                return (list, tuple(canonicalize(item) for item in value))
+            if isinstance(value, bytearray):
+                return (bytes, bytes(value))
+            return (type(value), value)
+
+        try:
+            cache_key = (service_name, canonicalize(parameter_dict))
+            hash(cache_key)
+        except TypeError:
+            return None
+        return cache_key
+
+    def get_cached_request(self, cache_key):
+        """
+Retrieve an encoded request from the request cache, or None if it is not cached.
+        """
+        with self.request_cache_lock:
+            encode_message = self.request_cache.get(cache_key)
+            if encode_message is None:
+                self.request_cache_misses += 1
+            else:
+                self.request_cache_hits += 1
+                self.request_cache.move_to_end(cache_key)
+            return encode_message
+
+    def cache_request(self, cache_key, encode_message):
+        """
+Store an encoded request in the request cache, the least recently used entries are evicted.
+        """
+        with self.request_cache_lock:
+            if self.request_cache_size <= 0:
+                return
+            self.request_cache[cache_key] = bytes(encode_message)
+            self.request_cache.move_to_end(cache_key)
+            while len(self.request_cache) > self.request_cache_size:
+                self.request_cache.popitem(last=False)
+
+    def set_request_cache_size(self, size):
+        """
+Set the maximum number of entries of the request cache, ``0`` disables the cache.
+
+**Arguments:**
+
+* ``size``
+
+  / *Condition*: required / *Type*: int /
+
+  The maximum number of cached requests.
+        """
+        size = int(size)
+        if size < 0:
+            raise ValueError(f"Invalid request cache size {size}")
+        with self.request_cache_lock:
+            self.request_cache_size = size
+            while len(self.request_cache) > size:
+                self.request_cache.popitem(last=False)
+
+    def clear_request_cache(self):
+        """
+Remove all entries from the request cache and reset its counters.
+        """
+        with self.request_cache_lock:
+            self.request_cache.clear()
+            self.request_cache_hits = 0
+            self.request_cache_misses = 0
+
+    def get_request_cache_info(self):
+        """
+Retrieve the state of the request cache.
+
+**Returns:**
+
+* ``cache_info``
+
+  / *Type*: dict /
+
+  The number of ``entries``, the ``max_size`` and the ``hits`` and ``misses`` counters.
+        """
+        with self.request_cache_lock:
+            return {
+                "entries": len(self.request_cache),
+                "max_size": self.request_cache_size,
+                "hits": self.request_cache_hits,
+                "misses": self.request_cache_misses,
+            }
+
+    def get_encoded_request(self, service, parameter_dict):
+        """
+Convert the parameters and encode the request of a service, using the request cache.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: required / *Type*: object /
+
+  The diagnostic service.
+
+* ``parameter_dict``
+
+  / *Condition*: required / *Type*: dict /
+
+  The dictionary of request parameter as given by the test.
+
+**Returns:**
+
+* ``encode_message``
+
+  / *Type*: bytes /
+
+  The encoded request.
+        """
+        cache_key = None
+        if self.request_cache_size > 0:
+            # The key has to be built before the parameters are converted
+            cache_key = self.get_request_cache_key(service.short_name, parameter_dict)
+            if cache_key is not None:
+                encode_message = self.get_cached_request(cache_key)
+                if encode_message is not None:
+                    return encode_message
+
+        # Convert the parameter data type to the correct type
+        parameter_dict = self.get_request_converter(service).convert(parameter_dict)
+        encode_message = self.encode_request(service, parameter_dict)
+        if cache_key is not None:
+            self.cache_request(cache_key, encode_message)
+        return encode_message
+
     def get_encoded_request_message(self, service_name, parameter_dict):
         """
 Retrieve the encode request message from parameters dictionary.
@@ -159,16 +962,14 @@ Retrieve the encode request message from parameters dictionary.
 
   The encoded message.
         """
-        service = getattr(self.diag_services, service_name)
+        service = self.get_diag_service(service_name)
         logger.info(f"Encode {service.short_name} message")
         encode_message = None
         try:
             if not parameter_dict:
-                encode_message = service.encode_request()
+                encode_message = self.encode_request(service, {})
             else:
-                # Convert the parameter data type to the correct type
-                parameter_dict = self.convert_request_data_type(service, parameter_dict)
-                encode_message = bytes(service.encode_request(**parameter_dict))
+                encode_message = self.get_encoded_request(service, parameter_dict)
                 logger.info(f"Full encode message: {encode_message}")
         except Exception as e:
             logger.error(f"Failed to encode {service.short_name} message.")
@@ -202,11 +1003,11 @@ Retrieve the encode request message from parameters dictionary.
 
   The decoded message.
         """
-        service = getattr(self.diag_services, service_name)
+        service = self.get_diag_service(service_name)
         logger.info(f"Decode {service.short_name} message")
         decode_message = None
 
-        decode_message = service.decode_message(raw_message).param_dict
+        decode_message = self.decode_response(service, raw_message)
         return decode_message
 
     def get_full_positive_response_data(self, service_name, data: bytes):
@@ -235,10 +1036,54 @@ Retrieve the complete byte data from the response, as the UDS removes the servic
 
   The complete byte data from the response.
         """
-        diag_service = self.get_diag_service_by_name([service_name])[0]
-        positive_response_data = bytes.fromhex(hex(diag_service.positive_responses[0].parameters.SID_PR.coded_value).replace('0x','') + data.hex())
+        response_prefix = self.response_prefixes.get(service_name)
+        if response_prefix is None:
+            diag_service = self.get_diag_service(service_name)
+            if not diag_service.positive_responses:
+                raise ValueError(f"Positive response of service '{service_name}' does not exists in the PDX file.")
+            response_prefix = self.get_response_prefix(diag_service.positive_responses[0], 1)
+            self.response_prefixes[service_name] = response_prefix
+
+        positive_response_data = response_prefix + data
         return positive_response_data
 
+    @staticmethod
+    def get_response_prefix(response, param_count):
+        """
+Retrieve the bytes of the leading constant parameters of a response, e.g. the SID and DID.
+
+**Arguments:**
+
+* ``response``
+
+  / *Condition*: required / *Type*: object /
+
+  The ODX response.
+
+* ``param_count``
+
+  / *Condition*: required / *Type*: int /
+
+  The number of leading constant parameters.
+
+**Returns:**
+
+* ``response_prefix``
+
+  / *Type*: bytes /
+
+  The encoded parameters.
+        """
+        if len(response.parameters) < param_count:
+            raise ValueError(f"Response '{response.short_name}' has {len(response.parameters)} parameters, expected at least {param_count}.")
+        response_prefix = bytearray()
+        for param in response.parameters[:param_count]:
+            if getattr(param, "coded_value", None) is None:
+                raise ValueError(f"Parameter '{param.short_name}' of response '{response.short_name}' is not a constant, the response prefix can not be built.")
+            byte_length = (param.diag_coded_type.bit_length + 7) >> 3
+            response_prefix += param.coded_value.to_bytes(byte_length, "big")
+        return bytes(response_prefix)
+
     def get_did_codec(self, service_id):
         """
 Retrieves a dictionary of DID codecs for a given diagnostic service ID.
@@ -259,25 +1104,65 @@ Retrieves a dictionary of DID codecs for a given diagnostic service ID.
 
   A dictionary where the keys are DIDs
         """
-        did_codec = {}
+        # The codecs are built once per service id, the database is shared by all devices using this PDX
+        did_codec = self.did_codecs.get(service_id)
+        if did_codec is None:
+            did_codec = {}
+            for did, diag_service in self.services_by_did.get(service_id, {}).items():
+                did_codec[did] = PDXCodec(diag_service, self, service_id, did)
+            self.did_codecs[service_id] = did_codec
+
+        return did_codec
+
+    def get_read_write_did_codec(self):
+        """
+Retrieves a dictionary of DID codecs for both ReadDataByIdentifier and WriteDataByIdentifier.
 
-        diag_services = self.diag_layer.service_groups[service_id]
-        for diag_service in diag_services:
-            did = diag_service.request.parameters[1].coded_value
-            did_codec[did] = PDXCodec(diag_service)
+The client config has one codec per DID, so a DID which can be read and written gets a codec
+which decodes with the ReadDataByIdentifier service and encodes with the WriteDataByIdentifier service.
+
+**Returns:**
+
+* ``did_codec``
+
+  / *Type*: dict /
+
+  A dictionary where the keys are DIDs
+        """
+        did_codec = self.did_codecs.get(ReadWriteCodec.SERVICE_IDS)
+        if did_codec is None:
+            read_codecs = self.get_did_codec(ReadWriteCodec.SERVICE_IDS[0])
+            write_codecs = self.get_did_codec(ReadWriteCodec.SERVICE_IDS[1])
+            did_codec = {did: ReadWriteCodec(read_codecs.get(did), write_codecs.get(did))
+                         for did in read_codecs.keys() | write_codecs.keys()}
+            self.did_codecs[ReadWriteCodec.SERVICE_IDS] = did_codec
 
         return did_codec
 
 class PDXCodec(DidCodec):
-    def __init__(self, service):
+    def __init__(self, service, diag_service_db=None, service_id=None, did=None):
         self.service = service
+        self.diag_service_db = diag_service_db
+        self.response_length = None
+        # The SID and DID of the positive response, the UDS library passes only the data behind them to decode()
+        self.response_prefix = None
+        if service.positive_responses:
+            try:
+                self.response_prefix = DiagnosticServices.get_response_prefix(service.positive_responses[0], 2)
+            except ValueError as e:
+                # E.g. a DID parameter matching the request, the UDS library has already checked the SID and DID
+                # of the response, so they are taken from the request. Other DIDs are not affected.
+                if service_id is None or did is None:
+                    raise
+                logger.debug(f"{e} Use the SID and DID of the request instead.")
+                self.response_prefix = bytes([service_id + 0x40]) + did.to_bytes(2, "big")
 
     def decode(self, string_bin: bytes):
-        parameters = self.service.positive_responses[0].parameters
-        response_prefix_hex = "".join([hex(parameters[0].coded_value).replace("0x", ""), hex(parameters[1].coded_value).replace("0x", "")])
-
-        string_hex = "".join([response_prefix_hex, string_bin.hex()])
-        response = self.service.decode_message(bytearray.fromhex(string_hex)).param_dict
+        if self.response_prefix is None:
+            raise ValueError(f"Positive response of service '{self.service.short_name}' does not exists in the PDX file, the DID data can not be decoded.")
+        if self.diag_service_db is not None:
+            return self.diag_service_db.decode_response(self.service, self.response_prefix + string_bin)
+        response = self.service.decode_message(self.response_prefix + string_bin).param_dict
         return response
 
     def encode(self, parameter_dict):
@@ -287,11 +1172,13 @@ class PDXCodec(DidCodec):
             if not parameter_dict:
                 encode_message = self.service.encode_request()
             else:
-                # Convert the parameter data type to the correct type
-                parameter_dict = DiagnosticServices.convert_request_data_type(self.service, parameter_dict)
-
                 # Remove the first 3 bytes since the UDS library automatically adds the first 3 bytes for the DID.
-                encode_message = bytes(self.service.encode_request(**parameter_dict))[3:]
+                if self.diag_service_db is not None:
+                    encode_message = self.diag_service_db.get_encoded_request(self.service, parameter_dict)[3:]
+                else:
+                    # Convert the parameter data type to the correct type
+                    parameter_dict = DiagnosticServices.convert_request_data_type(self.service, parameter_dict)
+                    encode_message = bytes(self.service.encode_request(**parameter_dict))[3:]
                 logger.info(f"Encode message: {encode_message}")
         except Exception as e:
             logger.error(f"Failed to encode {self.service.short_name} message.")
@@ -300,8 +1187,34 @@ class PDXCodec(DidCodec):
         return encode_message
 
     def __len__(self) -> int:
-        bit_length = self.service.positive_responses[0].get_static_bit_length()
-        if bit_length:
-            return (bit_length >> 3) - 3
+        if self.response_length is None:
+            if not self.service.positive_responses:
+                raise ValueError(f"Positive response of service '{self.service.short_name}' does not exists in the PDX file, the DID data length is unknown.")
+            bit_length = self.service.positive_responses[0].get_static_bit_length()
+            self.response_length = (bit_length >> 3) - 3 if bit_length else 0
+        if self.response_length:
+            return self.response_length
         else:
             raise DidCodec.ReadAllRemainingData
+
+class ReadWriteCodec(DidCodec):
+    # ReadDataByIdentifier and WriteDataByIdentifier
+    SERVICE_IDS = (0x22, 0x2E)
+
+    def __init__(self, read_codec, write_codec):
+        self.read_codec = read_codec
+        self.write_codec = write_codec
+
+    def decode(self, string_bin: bytes):
+        return self.get_codec(self.read_codec, self.write_codec).decode(string_bin)
+
+    def encode(self, parameter_dict):
+        return self.get_codec(self.write_codec, self.read_codec).encode(parameter_dict)
+
+    def __len__(self) -> int:
+        return len(self.get_codec(self.read_codec, self.write_codec))
+
+    @staticmethod
+    def get_codec(codec, fallback):
+        # Not "codec or fallback", the truth value of a codec calls __len__, which may raise ReadAllRemainingData
+        return codec if codec is not None else fallback
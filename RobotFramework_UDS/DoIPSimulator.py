@@ -0,0 +1,651 @@
+from robot.api import logger
+from doipclient.messages import (DiagnosticMessage, DiagnosticMessageNegativeAcknowledgement, DiagnosticMessagePositiveAcknowledgement,
+                                 DiagnosticPowerModeRequest, DiagnosticPowerModeResponse, DoipEntityStatusRequest, EntityStatusResponse,
+                                 GenericDoIPNegativeAcknowledge, RoutingActivationRequest, RoutingActivationResponse,
+                                 VehicleIdentificationRequest, VehicleIdentificationRequestWithEID, VehicleIdentificationRequestWithVIN,
+                                 VehicleIdentificationResponse, payload_message_to_type, payload_type_to_message)
+from odxtools.dataobjectproperty import DataObjectProperty
+from odxtools.exceptions import DecodeError
+from odxtools.minmaxlengthtype import MinMaxLengthType
+from odxtools.odxtypes import DataType
+from odxtools.standardlengthtype import StandardLengthType
+from odxtools.structure import Structure
+from .DiagnosticServices import DiagnosticServices
+import asyncio
+import struct
+import threading
+import warnings
+
+
+class VehicleIdentificationProtocol(asyncio.DatagramProtocol):
+    """
+Answers the UDP requests of the vehicle discovery for a ``DoIPSimulator``.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        try:
+            protocol_version, message = DoIPSimulator.unpack(data)
+        except ValueError:
+            return
+        response = self.simulator.get_udp_response(message)
+        if response is not None:
+            self.transport.sendto(DoIPSimulator.pack(protocol_version, response), address)
+
+
+class DoIPSimulator:
+    """
+Local DoIP entity which simulates one ECU with the diagnostic services of a PDX variant.
+
+The simulator answers vehicle identification, entity status and diagnostic power mode requests
+on UDP, and routing activation and diagnostic messages on TCP. It listens on localhost with an
+ephemeral port by default, so it runs without privileges and many simulators can run at once.
+
+A request is answered with the positive response of the PDX service whose request decodes it.
+Parameters which are copied from the request are taken from it, the other parameters get their
+default value or the lowest value of their data type, unless they are configured with
+``configure_service``. ReadDataByIdentifier requests with several DIDs are answered from the
+services of the single DIDs.
+
+The block transfer services RequestDownload, RequestUpload, TransferData and RequestTransferExit
+are emulated with a memory, whose content can not be described by a PDX. Downloaded data is
+stored by its address and returned by uploads of the same address, other uploads return zeros.
+    """
+    HEADER_FORMAT = "!BBHL"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    ROUTING_SUCCESSFULLY_ACTIVATED = 0x10
+    # Negative acknowledge codes of diagnostic messages and of the DoIP header
+    NACK_INVALID_SOURCE_ADDRESS = 0x02
+    NACK_UNKNOWN_TARGET_ADDRESS = 0x03
+    NACK_UNKNOWN_PAYLOAD_TYPE = 0x01
+    NODE_TYPE_DOIP_NODE = 0x01
+    POWER_MODE_READY = 0x01
+    MAX_CONCURRENT_SOCKETS = 16
+
+    NEGATIVE_RESPONSE_SID = 0x7F
+    NRC_GENERAL_REJECT = 0x10
+    NRC_SERVICE_NOT_SUPPORTED = 0x11
+    NRC_SUBFUNCTION_NOT_SUPPORTED = 0x12
+    NRC_INCORRECT_MESSAGE_LENGTH = 0x13
+    NRC_REQUEST_SEQUENCE_ERROR = 0x24
+    NRC_REQUEST_OUT_OF_RANGE = 0x31
+    NRC_TRANSFER_DATA_SUSPENDED = 0x71
+    NRC_WRONG_BLOCK_SEQUENCE_COUNTER = 0x73
+    NRC_RESPONSE_PENDING = 0x78
+    # Services whose second byte is a subfunction with the suppressPosRspMsgIndicationBit
+    SUBFUNCTION_SIDS = (0x10, 0x11, 0x27, 0x28, 0x29, 0x31, 0x3E, 0x85, 0x87)
+    READ_DATA_BY_IDENTIFIER_SID = 0x22
+    TESTER_PRESENT_SID = 0x3E
+    TRANSFER_SIDS = (0x34, 0x35, 0x36, 0x37)
+    # maxNumberOfBlockLength of the RequestDownload and RequestUpload responses
+    DEFAULT_MAX_BLOCK_LENGTH = 0x0FFF
+    RESPONSE_CACHE_SIZE = 4096
+
+    def __init__(self, diag_service_db, ecu_logical_address, host="127.0.0.1", port=0, vin="SIMULATED00000000",
+                 eid=bytes(6), gid=bytes(6), max_block_length=DEFAULT_MAX_BLOCK_LENGTH):
+        self.diag_service_db = diag_service_db
+        self.ecu_logical_address = ecu_logical_address
+        self.host = host
+        self.port = port
+        self.udp_port = None
+        self.vin = vin
+        self.eid = eid
+        self.gid = gid
+        self.max_block_length = max_block_length
+        # Configured behaviour by service name, service id, or None for all requests
+        self.behaviours = {}
+        self.responses = {}
+        self.memory = {}
+        self.transfer = None
+        self.request_count = 0
+        self.open_sockets = 0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.server = None
+        self.udp_transport = None
+        self.thread = None
+        self.started = threading.Event()
+        self.start_error = None
+
+    @staticmethod
+    def pack(protocol_version, message):
+        payload = message.pack()
+        return struct.pack(DoIPSimulator.HEADER_FORMAT, protocol_version, 0xFF ^ protocol_version,
+                           payload_message_to_type[type(message)], len(payload)) + payload
+
+    @staticmethod
+    def unpack(data):
+        """
+Unpack a DoIP message of a UDP datagram, return the protocol version and the message.
+        """
+        if len(data) < DoIPSimulator.HEADER_SIZE:
+            raise ValueError("DoIP header is incomplete")
+        protocol_version, _, payload_type, payload_length = struct.unpack_from(DoIPSimulator.HEADER_FORMAT, data)
+        message_class = payload_type_to_message.get(payload_type)
+        if message_class is None:
+            return protocol_version, None
+        return protocol_version, message_class.unpack(data[DoIPSimulator.HEADER_SIZE:], payload_length)
+
+    def start(self):
+        """
+Start the simulator in its own thread and event loop.
+
+**Returns:**
+
+* ``port``
+
+  / *Type*: int /
+
+  The TCP port of the simulator, the UDP port for the vehicle discovery is ``udp_port``.
+        """
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+                self.port = self.server.sockets[0].getsockname()[1]
+                try:
+                    self.udp_transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+                        lambda: VehicleIdentificationProtocol(self), local_addr=(self.host, self.port)))
+                except OSError:
+                    # The UDP port of the same number is taken, the discovery uses another one
+                    self.udp_transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+                        lambda: VehicleIdentificationProtocol(self), local_addr=(self.host, 0)))
+                self.udp_port = self.udp_transport.get_extra_info("sockname")[1]
+            except Exception as e:
+                self.start_error = e
+                self.started.set()
+                self.loop.close()
+                return
+            self.started.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name=f"DoIPSimulator-0x{self.ecu_logical_address:X}", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.start_error is not None:
+            raise Exception(f"Unable to start DoIP simulator on {self.host}:{self.port}. Reason: {self.start_error}")
+        return self.port
+
+    def stop(self):
+        if self.loop is None or not self.loop.is_running():
+            return
+
+        async def shutdown():
+            self.server.close()
+            self.udp_transport.close()
+            # Connections which are still open are closed with their handlers
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
+        self.thread.join()
+
+    def configure_service(self, service=None, nrc=None, delay=0.0, response_pending=False, parameters=None,
+                          disconnect=False, after=0, count=None):
+        """
+Configure the behaviour of the simulator for a service.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: optional / *Type*: str or int / *Default*: None /
+
+  The name of a PDX service, a service id for all services of this id, or None for all requests.
+
+* ``nrc``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The negative response code to answer with, instead of the positive response.
+
+* ``delay``
+
+  / *Condition*: optional / *Type*: float / *Default*: 0.0 /
+
+  The processing time in seconds before the response is sent.
+
+* ``response_pending``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, a responsePending negative response is sent before the delay.
+
+* ``parameters``
+
+  / *Condition*: optional / *Type*: dict / *Default*: None /
+
+  Physical values of parameters of the positive response, the others get their default value.
+
+* ``disconnect``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, the TCP connection is closed instead of answering, like a connection loss.
+  The request is not processed.
+
+* ``after``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0 /
+
+  The number of matching requests which are answered normally before the behaviour applies.
+
+* ``count``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The number of matching requests the behaviour applies to, afterwards they are answered normally.
+  By default the behaviour applies until it is reset.
+        """
+        service_key = self.get_service_key(service)
+        behaviour = {
+            "nrc": int(nrc) if nrc is not None else None,
+            "delay": float(delay) if delay else 0.0,
+            "response_pending": bool(response_pending),
+            "parameters": dict(parameters) if parameters else None,
+            "disconnect": bool(disconnect),
+            "after": int(after),
+            "count": int(count) if count is not None else None,
+            "matched": 0,
+        }
+        if behaviour["parameters"] is not None:
+            if not isinstance(service_key, str):
+                raise ValueError("Response parameters can only be configured for a service given by name")
+            # Fail here instead of on the first request
+            diag_service = self.diag_service_db.get_diag_service(service_key)
+            self.encode_positive_response(diag_service, bytes(self.encode_default_request(diag_service)), behaviour["parameters"])
+        with self.lock:
+            self.behaviours[service_key] = behaviour
+            self.responses.clear()
+
+    def reset_services(self):
+        """
+Remove the configured behaviour of all services.
+        """
+        with self.lock:
+            self.behaviours.clear()
+            self.responses.clear()
+
+    def get_service_key(self, service):
+        if service is None or isinstance(service, int):
+            return service
+        if service in self.diag_service_db.services_by_name:
+            return service
+        try:
+            return int(service, 0)
+        except ValueError:
+            self.diag_service_db.get_diag_service(service)
+
+    def get_behaviour(self, diag_service, sid):
+        if diag_service is not None and diag_service.short_name in self.behaviours:
+            behaviour = self.behaviours[diag_service.short_name]
+        elif sid in self.behaviours:
+            behaviour = self.behaviours[sid]
+        else:
+            behaviour = self.behaviours.get(None)
+        if behaviour is None:
+            return None
+        # Only the matching requests from "after" on, and at most "count" of them, get the behaviour
+        behaviour["matched"] += 1
+        if behaviour["matched"] <= behaviour["after"]:
+            return None
+        if behaviour["count"] is not None and behaviour["matched"] > behaviour["after"] + behaviour["count"]:
+            return None
+        return behaviour
+
+    @staticmethod
+    def get_internal_default_value(dop):
+        """
+Get the lowest internal value of the coded type of a data object property.
+        """
+        diag_coded_type = dop.diag_coded_type
+        base_data_type = diag_coded_type.base_data_type
+        if isinstance(diag_coded_type, StandardLengthType):
+            byte_length = diag_coded_type.bit_length // 8
+        elif isinstance(diag_coded_type, MinMaxLengthType):
+            byte_length = diag_coded_type.min_length
+        else:
+            byte_length = 0
+
+        if base_data_type in (DataType.A_FLOAT32, DataType.A_FLOAT64):
+            return 0.0
+        if base_data_type == DataType.A_BYTEFIELD:
+            return bytes(byte_length)
+        if base_data_type in (DataType.A_ASCIISTRING, DataType.A_UTF8STRING):
+            return " " * byte_length
+        if base_data_type == DataType.A_UNICODE2STRING:
+            return " " * (byte_length // 2)
+        return 0
+
+    @staticmethod
+    def get_default_value(parameter):
+        """
+Get a physical value of a parameter which can be encoded: its default value, the value of the
+lowest internal value, or the lowest value of the first scale of a text table.
+        """
+        physical_default_value = getattr(parameter, "physical_default_value", None)
+        if physical_default_value is not None:
+            return physical_default_value
+        dop = getattr(parameter, "dop", None)
+        if isinstance(dop, DataObjectProperty):
+            compu_method = dop.compu_method
+            try:
+                return compu_method.convert_internal_to_physical(DoIPSimulator.get_internal_default_value(dop))
+            except Exception:
+                compu_internal_to_phys = getattr(compu_method, "compu_internal_to_phys", None)
+                for compu_scale in (compu_internal_to_phys.compu_scales if compu_internal_to_phys is not None else []):
+                    if compu_scale.lower_limit is not None and compu_scale.lower_limit.value is not None:
+                        return compu_method.convert_internal_to_physical(compu_scale.lower_limit.value)
+                raise
+        if isinstance(dop, Structure):
+            return {child.short_name: DoIPSimulator.get_default_value(child) for child in dop.parameters if child.is_required}
+        # Fields repeat their structure, an empty field is valid
+        return []
+
+    def encode_default_request(self, diag_service):
+        return diag_service.request.encode(**{parameter.short_name: self.get_default_value(parameter)
+                                              for parameter in diag_service.request.parameters if parameter.is_required})
+
+    def encode_positive_response(self, diag_service, request, parameters=None):
+        positive_response = diag_service.positive_responses[0]
+        values = {parameter.short_name: self.get_default_value(parameter)
+                  for parameter in positive_response.parameters if parameter.is_required}
+        if parameters:
+            values.update(parameters)
+        return bytes(positive_response.encode(request, **values))
+
+    @staticmethod
+    def decodes_request(diag_service, request):
+        if diag_service.request is None:
+            return False
+        with warnings.catch_warnings():
+            # Mismatching constants are only reported as warning when the odxtools strict mode is off
+            warnings.simplefilter("error", DecodeError)
+            try:
+                diag_service.request.decode(request)
+                return True
+            except Exception:
+                return False
+
+    def find_service(self, request):
+        """
+Find the PDX service of a request, a service with positive response is preferred.
+        """
+        db = self.diag_service_db
+        sid = request[0]
+        candidates = []
+        # The indexes of DIDs and routines give the likely service first
+        if sid in db.services_by_did and len(request) >= 3:
+            candidates.append(db.services_by_did[sid].get(int.from_bytes(request[1:3], "big")))
+        elif sid == DiagnosticServices.ROUTINE_CONTROL_SID and len(request) >= 4:
+            candidates.append(db.services_by_routine.get((int.from_bytes(request[2:4], "big"), request[1])))
+        candidates.extend(db.services_by_sid.get(sid, []))
+
+        found = None
+        for diag_service in candidates:
+            if diag_service is None or not self.decodes_request(diag_service, request):
+                continue
+            if diag_service.positive_responses:
+                return diag_service
+            if found is None:
+                found = diag_service
+        return found
+
+    @staticmethod
+    def negative_response(sid, nrc):
+        return bytes([DoIPSimulator.NEGATIVE_RESPONSE_SID, sid, nrc])
+
+    def get_response(self, request):
+        """
+Get the response of the simulated ECU to a request.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: bytes /
+
+  The response, None if no response is sent.
+
+* ``delay``
+
+  / *Type*: float /
+
+  The processing time in seconds before the response is sent.
+
+* ``response_pending``
+
+  / *Type*: bool /
+
+  True if a responsePending negative response is sent before the delay.
+
+* ``disconnect``
+
+  / *Type*: bool /
+
+  True if the connection is closed instead of answering.
+        """
+        with self.lock:
+            self.request_count += 1
+            return self.__get_response(bytes(request))
+
+    def __get_response(self, request):
+        sid = request[0]
+        suppress_positive_response = False
+        if sid in DoIPSimulator.SUBFUNCTION_SIDS and len(request) > 1 and request[1] & 0x80:
+            suppress_positive_response = True
+            request = bytes([sid, request[1] & 0x7F]) + request[2:]
+
+        if sid == DoIPSimulator.READ_DATA_BY_IDENTIFIER_SID and len(request) > 3 and len(request) % 2 == 1:
+            return self.__read_data_by_identifiers(request)
+
+        if sid in DoIPSimulator.TRANSFER_SIDS:
+            diag_service = None
+            behaviour = self.get_behaviour(None, sid)
+        else:
+            diag_service = self.find_service(request)
+            behaviour = self.get_behaviour(diag_service, sid)
+        if behaviour is not None and behaviour["disconnect"]:
+            return None, behaviour["delay"], behaviour["response_pending"], True
+
+        if behaviour is not None and behaviour["nrc"] is not None:
+            response = self.negative_response(sid, behaviour["nrc"])
+        elif sid in DoIPSimulator.TRANSFER_SIDS:
+            response = self.__transfer(request)
+        elif diag_service is not None:
+            response = self.__get_positive_response(diag_service, request, behaviour)
+        elif sid == DoIPSimulator.TESTER_PRESENT_SID and len(request) == 2:
+            response = bytes([sid + 0x40, request[1]])
+        elif sid in self.diag_service_db.services_by_sid and sid in DoIPSimulator.SUBFUNCTION_SIDS and sid != DiagnosticServices.ROUTINE_CONTROL_SID:
+            response = self.negative_response(sid, DoIPSimulator.NRC_SUBFUNCTION_NOT_SUPPORTED)
+        elif sid in self.diag_service_db.services_by_sid:
+            response = self.negative_response(sid, DoIPSimulator.NRC_REQUEST_OUT_OF_RANGE)
+        else:
+            response = self.negative_response(sid, DoIPSimulator.NRC_SERVICE_NOT_SUPPORTED)
+
+        if suppress_positive_response and response is not None and response[0] != DoIPSimulator.NEGATIVE_RESPONSE_SID:
+            response = None
+        if behaviour is None:
+            return response, 0.0, False, False
+        return response, behaviour["delay"], behaviour["response_pending"], False
+
+    def __get_positive_response(self, diag_service, request, behaviour):
+        if not diag_service.positive_responses:
+            return None
+        response = self.responses.get(request)
+        if response is None:
+            try:
+                response = self.encode_positive_response(diag_service, request, behaviour["parameters"] if behaviour else None)
+            except Exception as e:
+                logger.warn(f"Unable to encode the positive response of {diag_service.short_name} to {request.hex()}. Reason: {e}")
+                return self.negative_response(request[0], DoIPSimulator.NRC_GENERAL_REJECT)
+            if len(self.responses) >= DoIPSimulator.RESPONSE_CACHE_SIZE:
+                self.responses.clear()
+            self.responses[request] = response
+        return response
+
+    def __read_data_by_identifiers(self, request):
+        # Every DID is answered like a request of its own, the first negative response is returned
+        records = [bytes([request[0] + 0x40])]
+        delay = 0.0
+        response_pending = False
+        for position in range(1, len(request), 2):
+            response, did_delay, did_response_pending, disconnect = self.__get_response(request[:1] + request[position:position + 2])
+            delay = max(delay, did_delay)
+            response_pending = response_pending or did_response_pending
+            if disconnect or response is None or response[0] == DoIPSimulator.NEGATIVE_RESPONSE_SID:
+                return response, delay, response_pending, disconnect
+            records.append(response[1:])
+        return b"".join(records), delay, response_pending, False
+
+    @staticmethod
+    def parse_memory_request(request):
+        """
+Parse the address and size of a RequestDownload or RequestUpload.
+        """
+        if len(request) < 5:
+            raise ValueError("Invalid request length")
+        size_length = request[2] >> 4
+        address_length = request[2] & 0x0F
+        if len(request) != 3 + address_length + size_length:
+            raise ValueError("Invalid request length")
+        address = int.from_bytes(request[3:3 + address_length], "big")
+        size = int.from_bytes(request[3 + address_length:], "big")
+        return address, size
+
+    def __transfer(self, request):
+        sid = request[0]
+        if sid in (0x34, 0x35):
+            try:
+                address, size = self.parse_memory_request(request)
+            except ValueError:
+                return self.negative_response(sid, DoIPSimulator.NRC_INCORRECT_MESSAGE_LENGTH)
+            data = bytearray() if sid == 0x34 else bytearray(self.read_memory(address, size))
+            self.transfer = {"sid": sid, "address": address, "size": size, "data": data, "offset": 0, "sequence_counter": 1, "last_block": None}
+            return bytes([sid + 0x40, 0x20]) + self.max_block_length.to_bytes(2, "big")
+
+        transfer = self.transfer
+        if transfer is None:
+            return self.negative_response(sid, DoIPSimulator.NRC_REQUEST_SEQUENCE_ERROR)
+        if sid == 0x37:
+            if transfer["sid"] == 0x34:
+                self.memory[transfer["address"]] = bytes(transfer["data"])
+            self.transfer = None
+            return bytes([0x77])
+
+        if len(request) < 2:
+            return self.negative_response(sid, DoIPSimulator.NRC_INCORRECT_MESSAGE_LENGTH)
+        sequence_counter = request[1]
+        if sequence_counter == (transfer["sequence_counter"] - 1) & 0xFF and transfer["last_block"] is not None:
+            # The block is repeated because its response was lost
+            return transfer["last_block"]
+        if sequence_counter != transfer["sequence_counter"]:
+            return self.negative_response(sid, DoIPSimulator.NRC_WRONG_BLOCK_SEQUENCE_COUNTER)
+
+        block_length = self.max_block_length - 2
+        if transfer["sid"] == 0x34:
+            if len(transfer["data"]) + len(request) - 2 > transfer["size"]:
+                return self.negative_response(sid, DoIPSimulator.NRC_TRANSFER_DATA_SUSPENDED)
+            transfer["data"] += request[2:]
+            response = bytes([0x76, sequence_counter])
+        else:
+            offset = transfer["offset"]
+            if offset >= transfer["size"]:
+                return self.negative_response(sid, DoIPSimulator.NRC_REQUEST_SEQUENCE_ERROR)
+            response = bytes([0x76, sequence_counter]) + bytes(transfer["data"][offset:offset + block_length])
+            transfer["offset"] = offset + block_length
+        transfer["sequence_counter"] = (sequence_counter + 1) & 0xFF
+        transfer["last_block"] = response
+        return response
+
+    def read_memory(self, address, size):
+        """
+Read the downloaded data of a memory area, memory which was not downloaded reads as zeros.
+        """
+        data = bytearray(size)
+        for start, content in self.memory.items():
+            begin = max(start, address)
+            end = min(start + len(content), address + size)
+            if begin < end:
+                data[begin - address:end - address] = content[begin - start:end - start]
+        return bytes(data)
+
+    def get_udp_response(self, message):
+        if isinstance(message, VehicleIdentificationRequestWithEID) and bytes(message.eid) != bytes(self.eid):
+            return None
+        if isinstance(message, VehicleIdentificationRequestWithVIN) and message.vin != self.vin:
+            return None
+        if isinstance(message, (VehicleIdentificationRequest, VehicleIdentificationRequestWithEID, VehicleIdentificationRequestWithVIN)):
+            return VehicleIdentificationResponse(self.vin, self.ecu_logical_address, self.eid, self.gid, 0)
+        if isinstance(message, DoipEntityStatusRequest):
+            return EntityStatusResponse(DoIPSimulator.NODE_TYPE_DOIP_NODE, DoIPSimulator.MAX_CONCURRENT_SOCKETS, self.open_sockets)
+        if isinstance(message, DiagnosticPowerModeRequest):
+            return DiagnosticPowerModeResponse(DoIPSimulator.POWER_MODE_READY)
+        return None
+
+    async def handle_connection(self, reader, writer):
+        self.open_sockets += 1
+        tester_address = None
+        try:
+            while True:
+                header = await reader.readexactly(DoIPSimulator.HEADER_SIZE)
+                protocol_version, _, payload_type, payload_length = struct.unpack(DoIPSimulator.HEADER_FORMAT, header)
+                payload = await reader.readexactly(payload_length)
+                message_class = payload_type_to_message.get(payload_type)
+                if message_class is None:
+                    writer.write(self.pack(protocol_version, GenericDoIPNegativeAcknowledge(DoIPSimulator.NACK_UNKNOWN_PAYLOAD_TYPE)))
+                    await writer.drain()
+                    continue
+                message = message_class.unpack(payload, payload_length)
+
+                if isinstance(message, RoutingActivationRequest):
+                    tester_address = message.source_address
+                    writer.write(self.pack(protocol_version, RoutingActivationResponse(
+                        tester_address, self.ecu_logical_address, DoIPSimulator.ROUTING_SUCCESSFULLY_ACTIVATED)))
+                elif isinstance(message, DiagnosticMessage):
+                    await self.handle_diagnostic_message(protocol_version, message, tester_address, writer)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # A cancelled handler ends normally, the stream callback of asyncio logs cancelled tasks as errors
+            pass
+        finally:
+            self.open_sockets -= 1
+            writer.close()
+
+    async def handle_diagnostic_message(self, protocol_version, message, tester_address, writer):
+        if message.source_address != tester_address:
+            nack_code = DoIPSimulator.NACK_INVALID_SOURCE_ADDRESS
+        elif message.target_address != self.ecu_logical_address:
+            nack_code = DoIPSimulator.NACK_UNKNOWN_TARGET_ADDRESS
+        else:
+            nack_code = None
+        if nack_code is not None:
+            writer.write(self.pack(protocol_version, DiagnosticMessageNegativeAcknowledgement(
+                message.target_address, message.source_address, nack_code)))
+            return
+
+        request = bytes(message.user_data)
+        writer.write(self.pack(protocol_version, DiagnosticMessagePositiveAcknowledgement(self.ecu_logical_address, tester_address, 0)))
+        if not request:
+            return
+        response, delay, response_pending, disconnect = self.get_response(request)
+        if response_pending:
+            writer.write(self.pack(protocol_version, DiagnosticMessage(
+                self.ecu_logical_address, tester_address, self.negative_response(request[0], DoIPSimulator.NRC_RESPONSE_PENDING))))
+        if delay:
+            await writer.drain()
+            await asyncio.sleep(delay)
+        if disconnect:
+            # handle_connection closes the connection
+            raise ConnectionResetError("Connection closed by configured behaviour")
+        if response is not None:
+            writer.write(self.pack(protocol_version, DiagnosticMessage(self.ecu_logical_address, tester_address, response)))
@@ -0,0 +1,234 @@
+from contextlib import contextmanager
+import csv
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+
+
+class LatencyHistogram:
+    """
+Histogram of durations with logarithmic buckets.
+
+The buckets grow by 5 % from 1 us to about 1000 s, so a percentile is accurate to 5 % and
+recording a duration costs one logarithm, independent of the number of recorded durations.
+    """
+    MIN_VALUE = 1e-6
+    GROWTH = 1.05
+    BUCKET_COUNT = int(math.log(1e9) / math.log(GROWTH)) + 2
+    LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.counts = [0] * LatencyHistogram.BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        if seconds <= LatencyHistogram.MIN_VALUE:
+            index = 0
+        else:
+            index = min(int(math.log(seconds / LatencyHistogram.MIN_VALUE) / LatencyHistogram.LOG_GROWTH) + 1,
+                        LatencyHistogram.BUCKET_COUNT - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def get_percentile(self, percentile):
+        """
+Get the upper bound of the bucket of a percentile, limited to the recorded minimum and maximum.
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(self.count * percentile / 100), 1)
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                upper_bound = LatencyHistogram.MIN_VALUE * LatencyHistogram.GROWTH ** index
+                return min(max(upper_bound, self.min), self.max)
+        return self.max
+
+    def get_summary(self, percentiles):
+        summary = {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+        }
+        for percentile in percentiles:
+            summary[LatencyStatistics.get_percentile_name(percentile)] = self.get_percentile(percentile)
+        return summary
+
+
+class LatencyContext:
+    """
+The measurement of one keyword: its service and the time of the phases measured inside it.
+    """
+    __slots__ = ("statistics", "service", "measured")
+
+    def __init__(self, statistics, service):
+        self.statistics = statistics
+        self.service = service
+        self.measured = 0.0
+
+    def record(self, phase, seconds, service=None, measured=True):
+        """
+Record the duration of a phase, by default for the service of the keyword.
+
+Phases which are part of another phase, like the responsePending wait of the response, are
+recorded with ``measured`` False, so they are not subtracted twice from the keyword overhead.
+        """
+        self.statistics.record(service or self.service, phase, seconds)
+        if measured:
+            self.measured += seconds
+
+
+class LatencyStatistics:
+    """
+Latency histograms of a device per service and phase.
+
+* ``keyword``: the complete keyword
+* ``overhead``: the keyword without the phases below, i.e. the time spent in the keyword layer and udsoncan
+* ``encode``, ``decode``: encoding a request and decoding a response with the PDX, per PDX service
+* ``send``: sending the request on the transport, with DoIP until the ECU acknowledged the diagnostic message
+* ``response``: from the request being sent until the final response is received, including responsePending waits
+* ``response_pending``: from the first responsePending until the final response
+
+Keywords are measured with the decorator ``measure_keyword``, which activates a ``LatencyContext``
+for the calling thread. The client and the PDX database record their phases into the active context,
+requests outside of a keyword, like the background TesterPresent, are recorded by their udsoncan service.
+    """
+    PHASES = ("keyword", "overhead", "encode", "send", "response", "response_pending", "decode")
+    DEFAULT_PERCENTILES = (50, 90, 95, 99)
+    active = threading.local()
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.enabled = True
+
+    @staticmethod
+    def get_percentile_name(percentile):
+        return f"p{float(percentile):g}"
+
+    @staticmethod
+    def get_context():
+        """
+Get the context of the keyword measured in the calling thread, or None.
+        """
+        return getattr(LatencyStatistics.active, "context", None)
+
+    def create_context(self, service):
+        """
+Create a context which is not active, for requests which are not sent by a measured keyword.
+        """
+        return LatencyContext(self, service) if self.enabled else None
+
+    @contextmanager
+    def measure(self, service):
+        """
+Measure a keyword and activate its context for the calling thread while the block is executed.
+        """
+        context = LatencyContext(self, service)
+        LatencyStatistics.active.context = context
+        start = time.perf_counter()
+        try:
+            yield context
+        finally:
+            elapsed = time.perf_counter() - start
+            LatencyStatistics.active.context = None
+            self.record(service, "keyword", elapsed)
+            self.record(service, "overhead", max(elapsed - context.measured, 0.0))
+
+    def record(self, service, phase, seconds):
+        with self.lock:
+            histogram = self.histograms.get((service, phase))
+            if histogram is None:
+                histogram = self.histograms[(service, phase)] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def reset(self, service=None):
+        with self.lock:
+            if service is None:
+                self.histograms.clear()
+            else:
+                self.histograms = {key: histogram for key, histogram in self.histograms.items() if key[0] != service}
+
+    def get_report(self, service=None, phase=None, percentiles=DEFAULT_PERCENTILES):
+        """
+Get the summary of the histograms, optionally of one service and/or phase.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  Per service and phase the ``count``, ``mean``, ``min``, ``max`` and the percentiles like ``p50`` in seconds.
+        """
+        report = {}
+        with self.lock:
+            for (histogram_service, histogram_phase), histogram in sorted(self.histograms.items(),
+                                                                          key=lambda item: (str(item[0][0]), LatencyStatistics.PHASES.index(item[0][1]))):
+                if service is not None and histogram_service != service:
+                    continue
+                if phase is not None and histogram_phase != phase:
+                    continue
+                report.setdefault(histogram_service, {})[histogram_phase] = histogram.get_summary(percentiles)
+        return report
+
+    @staticmethod
+    def write_report(reports, file_path, percentiles=DEFAULT_PERCENTILES):
+        """
+Write the reports of several devices to a JSON file, or a CSV file with one row per device, service and phase.
+        """
+        if str(file_path).lower().endswith(".csv"):
+            percentile_names = [LatencyStatistics.get_percentile_name(percentile) for percentile in percentiles]
+            with open(file_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["device", "service", "phase", "count", "mean", "min", "max"] + percentile_names)
+                for device_name, report in reports.items():
+                    for service, phases in report.items():
+                        for phase, summary in phases.items():
+                            writer.writerow([device_name, service, phase] + [summary[key] for key in ["count", "mean", "min", "max"] + percentile_names])
+        else:
+            with open(file_path, "w") as f:
+                json.dump(reports, f, indent=2)
+
+
+def measure_keyword(method):
+    """
+Measure a keyword of ``UDSKeywords`` in the latency statistics of the device it is run on.
+
+Keywords which are called by a measured keyword are part of the outer keyword and not measured on their own.
+    """
+    parameters = inspect.signature(method).parameters
+    # Position of device_name in the positional arguments, without self
+    device_name_position = list(parameters).index("device_name") - 1
+    default_device_name = parameters["device_name"].default
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if LatencyStatistics.get_context() is not None:
+            return method(self, *args, **kwargs)
+        if "device_name" in kwargs:
+            device_name = kwargs["device_name"]
+        elif len(args) > device_name_position:
+            device_name = args[device_name_position]
+        else:
+            device_name = default_device_name
+        uds_device = self.uds_manager.uds_device.get(device_name)
+        if uds_device is None or not uds_device.latency_statistics.enabled:
+            return method(self, *args, **kwargs)
+        with uds_device.latency_statistics.measure(getattr(wrapper, "robot_name", None) or method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
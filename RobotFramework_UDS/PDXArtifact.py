@@ -0,0 +1,192 @@
+from robot.api import logger
+import odxtools
+import os
+import pickle
+import struct
+import tempfile
+import zlib
+
+
+class PDXArtifact:
+    """
+Precompiled service catalog of one PDX variant, as created by ``python -m RobotFramework_UDS.PDXCompiler``.
+
+The artifact consists of a header and two zlib compressed pickle sections:
+
+* the catalog with the service indexes, the DID and routine maps and the DTC texts
+  as plain data, which can be read in milliseconds without odxtools objects, and
+* the diag layer together with the compiled encoders/decoders of its services.
+
+The odxtools objects are only compatible with the odxtools version which created
+them. The version is stored in the header, so an artifact of another version is
+rejected before anything is unpickled and has to be compiled again.
+
+The sections are pickled, and unpickling can execute arbitrary code. Artifacts
+must therefore only be loaded from trusted sources, e.g. compiled by the own
+build pipeline, never from a download or a directory writable by others.
+    """
+    MAGIC = b"RFUDSPDX"
+    FORMAT_VERSION = 2
+    # Magic, format version, odxtools version and the lengths of the catalog and layer sections
+    HEADER_FORMAT = ">8sH32sQQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    FILE_EXTENSION = ".pdxc"
+    COMPRESSION_LEVEL = 6
+
+    @staticmethod
+    def is_artifact(file_path):
+        """
+Check whether a file is a precompiled PDX artifact.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path to the file.
+
+**Returns:**
+
+* ``is_artifact``
+
+  / *Type*: bool /
+
+  True if the file starts with the artifact header.
+        """
+        try:
+            with open(file_path, "rb") as f:
+                return f.read(len(PDXArtifact.MAGIC)) == PDXArtifact.MAGIC
+        except OSError:
+            return False
+
+    @staticmethod
+    def save(file_path, catalog, layer_data):
+        """
+Write an artifact.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path of the artifact, an existing file is replaced.
+
+* ``catalog``
+
+  / *Condition*: required / *Type*: dict /
+
+  The service catalog as plain data.
+
+* ``layer_data``
+
+  / *Condition*: required / *Type*: dict /
+
+  The diag layer and the compiled encoders/decoders.
+        """
+        catalog_section = zlib.compress(pickle.dumps(catalog, protocol=pickle.HIGHEST_PROTOCOL), PDXArtifact.COMPRESSION_LEVEL)
+        layer_section = zlib.compress(pickle.dumps(layer_data, protocol=pickle.HIGHEST_PROTOCOL), PDXArtifact.COMPRESSION_LEVEL)
+        header = struct.pack(PDXArtifact.HEADER_FORMAT, PDXArtifact.MAGIC, PDXArtifact.FORMAT_VERSION,
+                             odxtools.__version__.encode("utf-8"), len(catalog_section), len(layer_section))
+
+        # Write to a temporary file first, so that a runner never reads a partial artifact
+        output_dir = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(catalog_section)
+                f.write(layer_section)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def __read_header(f, file_path):
+        header = f.read(PDXArtifact.HEADER_SIZE)
+        if header[:len(PDXArtifact.MAGIC)] != PDXArtifact.MAGIC:
+            raise Exception(f"{file_path} is not a precompiled PDX artifact")
+        format_version = struct.unpack_from(">H", header, len(PDXArtifact.MAGIC))[0]
+        if format_version != PDXArtifact.FORMAT_VERSION or len(header) != PDXArtifact.HEADER_SIZE:
+            raise Exception(f"Artifact format version {format_version} of {file_path} is not supported, expected {PDXArtifact.FORMAT_VERSION}. "
+                            f"Please compile the PDX file again.")
+        _, _, odxtools_version, catalog_length, layer_length = struct.unpack(PDXArtifact.HEADER_FORMAT, header)
+        return odxtools_version.rstrip(b"\0").decode("utf-8"), catalog_length, layer_length
+
+    @staticmethod
+    def load_catalog(file_path):
+        """
+Read the service catalog of an artifact, without loading the diag layer.
+
+The catalog is plain data, so it is read also if the artifact was compiled with another odxtools version.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path of the artifact.
+
+**Returns:**
+
+* ``catalog``
+
+  / *Type*: dict /
+
+  The service catalog.
+        """
+        with open(file_path, "rb") as f:
+            _, catalog_length, _ = PDXArtifact.__read_header(f, file_path)
+            return pickle.loads(zlib.decompress(f.read(catalog_length)))
+
+    @staticmethod
+    def load(file_path, variant=None):
+        """
+Read the service catalog and the diag layer of an artifact.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path of the artifact.
+
+* ``variant``
+
+  / *Condition*: optional / *Type*: str / *Default*: None /
+
+  The expected variant name, it is not checked if None.
+
+**Returns:**
+
+* ``catalog``
+
+  / *Type*: dict /
+
+  The service catalog.
+
+* ``layer_data``
+
+  / *Type*: dict /
+
+  The diag layer and the compiled encoders/decoders.
+        """
+        with open(file_path, "rb") as f:
+            odxtools_version, catalog_length, layer_length = PDXArtifact.__read_header(f, file_path)
+            if odxtools_version != odxtools.__version__:
+                raise Exception(f"Artifact {file_path} was compiled with odxtools {odxtools_version}, "
+                                f"but odxtools {odxtools.__version__} is installed. Please compile the PDX file again.")
+            catalog = pickle.loads(zlib.decompress(f.read(catalog_length)))
+
+            if variant is not None and catalog["variant"] != variant:
+                raise Exception(f"Artifact {file_path} was compiled for variant {catalog['variant']}, not for {variant}")
+
+            layer_data = pickle.loads(zlib.decompress(f.read(layer_length)))
+
+        logger.info(f"Loaded precompiled {catalog['pdx_file']} ({catalog['variant']}) from {file_path}")
+        return catalog, layer_data
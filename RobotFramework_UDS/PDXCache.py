@@ -0,0 +1,279 @@
+from robot.api import logger
+import hashlib
+import odxtools
+import os
+import pickle
+import struct
+import tempfile
+
+
+class PDXCache:
+    """
+Persistent on-disk cache of loaded PDX variants.
+
+Every entry holds the pickled diag layer of one variant. An entry is keyed by
+the SHA-256 hash of the PDX file, the odxtools version and the variant name, so
+it is invalidated automatically as soon as one of them changes. The total size
+of the cache directory is limited, the least recently used entries are evicted
+first.
+
+Every entry starts with a header holding the odxtools version which created it,
+an entry of another version is discarded before it is unpickled.
+
+The entries are pickle files, and unpickling a file can execute arbitrary code.
+The cache directory must therefore only be writable by trusted users, never
+point ``cache_dir`` or ``ROBOTFRAMEWORK_UDS_CACHE_DIR`` to a shared or
+downloaded directory.
+    """
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "RobotFramework_UDS", "pdx")
+    DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024 # 2 GB
+    CACHE_FILE_EXTENSION = ".pdxcache"
+    HASH_CHUNK_SIZE = 1024 * 1024
+    MAGIC = b"RFUDSPDC"
+    # Magic and the odxtools version of the pickled diag layer
+    HEADER_FORMAT = ">8s32s"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+    def __init__(self, cache_dir=None, max_size=None, enabled=True):
+        self.cache_dir = cache_dir if cache_dir else os.environ.get("ROBOTFRAMEWORK_UDS_CACHE_DIR", PDXCache.DEFAULT_CACHE_DIR)
+        self.max_size = int(max_size) if max_size is not None else PDXCache.DEFAULT_MAX_SIZE
+        self.enabled = enabled
+        self.__file_hashes = {}
+
+    @staticmethod
+    def get_file_hash(file_path):
+        """
+Calculate the SHA-256 hash of a file.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path to the file.
+
+**Returns:**
+
+* ``file_hash``
+
+  / *Type*: str /
+
+  The hex digest of the file content.
+        """
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(PDXCache.HASH_CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def __get_entry_prefix(self, pdx_file, variant):
+        # All entries of the same file path and variant share this prefix, so stale entries can be found again.
+        source = f"{os.path.abspath(pdx_file)}|{variant}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+    def get_pdx_hash(self, pdx_file):
+        """
+Retrieve the SHA-256 hash of a PDX file, it is only recalculated when the file has been modified.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+**Returns:**
+
+* ``file_hash``
+
+  / *Type*: str /
+
+  The hex digest of the file content.
+        """
+        stat = os.stat(pdx_file)
+        file_id = (os.path.abspath(pdx_file), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self.__file_hashes:
+            self.__file_hashes[file_id] = self.get_file_hash(pdx_file)
+        return self.__file_hashes[file_id]
+
+    def get_entry_path(self, pdx_file, variant):
+        """
+Retrieve the path of the cache entry for a PDX file and variant.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+**Returns:**
+
+* ``entry_path``
+
+  / *Type*: str /
+
+  The path of the cache entry (which does not have to exist).
+        """
+        # Hashing large files is expensive, so the hash is only recalculated when the file has been modified
+        cache_key = hashlib.sha256(f"{self.get_pdx_hash(pdx_file)}|{odxtools.__version__}|{variant}".encode("utf-8")).hexdigest()
+        file_name = f"{self.__get_entry_prefix(pdx_file, variant)}-{cache_key}{PDXCache.CACHE_FILE_EXTENSION}"
+        return os.path.join(self.cache_dir, file_name)
+
+    def load(self, pdx_file, variant):
+        """
+Load the diag layer of a variant from the cache.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+**Returns:**
+
+* ``diag_layer``
+
+  / *Type*: DiagLayer /
+
+  The cached diag layer, or None if there is no valid entry.
+        """
+        if not self.enabled:
+            return None
+
+        entry_path = self.get_entry_path(pdx_file, variant)
+        if not os.path.isfile(entry_path):
+            logger.info(f"No PDX cache entry for {pdx_file} ({variant})")
+            return None
+
+        try:
+            with open(entry_path, "rb") as f:
+                magic, odxtools_version = struct.unpack(PDXCache.HEADER_FORMAT, f.read(PDXCache.HEADER_SIZE))
+                odxtools_version = odxtools_version.rstrip(b"\0").decode("utf-8")
+                if magic != PDXCache.MAGIC:
+                    raise Exception("Invalid header")
+                if odxtools_version != odxtools.__version__:
+                    raise Exception(f"Entry was created with odxtools {odxtools_version}, but odxtools {odxtools.__version__} is installed")
+                diag_layer = pickle.load(f)
+        except Exception as e:
+            logger.warn(f"Discard invalid PDX cache entry {entry_path}. Reason: {e}")
+            self.__remove(entry_path)
+            return None
+
+        # Refresh the access time which is used for the LRU eviction
+        os.utime(entry_path)
+        logger.info(f"Loaded {pdx_file} ({variant}) from PDX cache {entry_path}")
+        return diag_layer
+
+    def store(self, pdx_file, variant, diag_layer):
+        """
+Store the diag layer of a variant in the cache.
+
+Older entries of the same PDX file and variant are removed, afterwards the
+least recently used entries are evicted until the size limit is kept.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``diag_layer``
+
+  / *Condition*: required / *Type*: DiagLayer /
+
+  The loaded diag layer.
+        """
+        if not self.enabled:
+            return
+
+        entry_path = self.get_entry_path(pdx_file, variant)
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first, so that concurrent runs never read a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack(PDXCache.HEADER_FORMAT, PDXCache.MAGIC, odxtools.__version__.encode("utf-8")))
+                pickle.dump(diag_layer, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            logger.warn(f"Unable to store {pdx_file} ({variant}) in PDX cache. Reason: {e}")
+            if tmp_path is not None:
+                self.__remove(tmp_path)
+            return
+
+        prefix = self.__get_entry_prefix(pdx_file, variant)
+        for stale_path in self.__get_entries():
+            if os.path.basename(stale_path).startswith(prefix) and stale_path != entry_path:
+                logger.info(f"Remove outdated PDX cache entry {stale_path}")
+                self.__remove(stale_path)
+
+        self.evict()
+
+    def evict(self):
+        """
+Evict the least recently used entries until the cache fits into ``max_size``.
+        """
+        entries = []
+        for entry_path in self.__get_entries():
+            try:
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+            except OSError:
+                pass
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.info(f"Evict PDX cache entry {entry_path}")
+            self.__remove(entry_path)
+            total_size -= size
+
+    def clear(self):
+        """
+Remove all entries from the cache.
+        """
+        if os.path.isdir(self.cache_dir):
+            for entry_path in self.__get_entries():
+                self.__remove(entry_path)
+            logger.info(f"PDX cache {self.cache_dir} cleared")
+
+    def __get_entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, file_name) for file_name in os.listdir(self.cache_dir)
+                if file_name.endswith(PDXCache.CACHE_FILE_EXTENSION)]
+
+    @staticmethod
+    def __remove(entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
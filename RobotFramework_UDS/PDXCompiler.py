@@ -0,0 +1,165 @@
+"""
+Compile a PDX file and variant into a precompiled artifact, which can be given to ``Load PDX`` instead of the PDX file.
+
+Usage::
+
+   python -m RobotFramework_UDS.PDXCompiler <pdx file> <variant> [-o <artifact>] [--variant-scoped]
+   python -m RobotFramework_UDS.PDXCompiler --info <artifact>
+"""
+from RobotFramework_UDS.DiagnosticServices import DiagnosticServices
+from RobotFramework_UDS.PDXArtifact import PDXArtifact
+from RobotFramework_UDS.PDXCache import PDXCache
+from datetime import datetime, timezone
+import argparse
+import odxtools
+import os
+import sys
+import time
+
+
+class PDXCompiler:
+    @staticmethod
+    def get_default_output(pdx_file, variant):
+        """
+Retrieve the default artifact path, next to the PDX file.
+        """
+        pdx_name = os.path.splitext(pdx_file)[0]
+        return f"{pdx_name}_{variant}{PDXArtifact.FILE_EXTENSION}"
+
+    @staticmethod
+    def get_catalog(diag_service_db):
+        """
+Collect the service catalog of a loaded PDX variant as plain data.
+
+**Arguments:**
+
+* ``diag_service_db``
+
+  / *Condition*: required / *Type*: DiagnosticServices /
+
+  The loaded PDX variant.
+
+**Returns:**
+
+* ``catalog``
+
+  / *Type*: dict /
+
+  The service indexes, the DID and routine maps and the DTC texts.
+        """
+        service_indexes = diag_service_db.get_service_indexes()
+        return {
+            "pdx_file": os.path.basename(diag_service_db.pdx_file),
+            "pdx_sha256": PDXCache.get_file_hash(diag_service_db.pdx_file),
+            "variant": diag_service_db.variant,
+            "odxtools_version": odxtools.__version__,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "services": list(diag_service_db.services_by_name),
+            "services_by_sid": service_indexes["services_by_sid"],
+            "services_by_did": service_indexes["services_by_did"],
+            "services_by_routine": service_indexes["services_by_routine"],
+            "did_by_name": dict(diag_service_db.did_by_name),
+            "routine_by_name": dict(diag_service_db.routine_by_name),
+            "compiled_services": sorted(name for name, compiled_message in diag_service_db.compiled_responses.items()
+                                        if compiled_message is not None),
+            "dtc_texts": diag_service_db.get_dtc_texts(),
+        }
+
+    @staticmethod
+    def compile(pdx_file, variant, output_file=None, variant_scoped=False):
+        """
+Compile a PDX file and variant into an artifact.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``output_file``
+
+  / *Condition*: optional / *Type*: str / *Default*: None /
+
+  Path of the artifact, by default ``<pdx file>_<variant>.pdxc`` next to the PDX file.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  Only load the diag layers the variant inherits from.
+
+**Returns:**
+
+* ``output_file``
+
+  / *Type*: str /
+
+  Path of the written artifact.
+        """
+        if output_file is None:
+            output_file = PDXCompiler.get_default_output(pdx_file, variant)
+
+        diag_service_db = DiagnosticServices(pdx_file, variant, variant_scoped=variant_scoped)
+        diag_service_db.compile_services()
+
+        catalog = PDXCompiler.get_catalog(diag_service_db)
+        layer_data = {
+            "diag_layer": diag_service_db.diag_layer,
+            "compiled_requests": diag_service_db.compiled_requests,
+            "compiled_responses": diag_service_db.compiled_responses,
+        }
+        PDXArtifact.save(output_file, catalog, layer_data)
+        return output_file
+
+    @staticmethod
+    def print_info(artifact_file):
+        """
+Print a summary of the catalog of an artifact.
+        """
+        catalog = PDXArtifact.load_catalog(artifact_file)
+        print(f"Artifact:          {artifact_file}")
+        print(f"PDX file:          {catalog['pdx_file']} (sha256 {catalog['pdx_sha256']})")
+        print(f"Variant:           {catalog['variant']}")
+        print(f"odxtools version:  {catalog['odxtools_version']}")
+        print(f"Created:           {catalog['created']}")
+        print(f"Services:          {len(catalog['services'])}")
+        print(f"DIDs:              {len(catalog['did_by_name'])}")
+        print(f"Routines:          {len(catalog['routine_by_name'])}")
+        print(f"Compiled services: {len(catalog['compiled_services'])}")
+        print(f"DTC texts:         {len(catalog['dtc_texts'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m RobotFramework_UDS.PDXCompiler",
+                                     description="Compile a PDX file and variant into a precompiled artifact for 'Load PDX'.")
+    parser.add_argument("pdx_file", nargs="?", help="PDX file path")
+    parser.add_argument("variant", nargs="?", help="variant name")
+    parser.add_argument("-o", "--output", help=f"artifact path (default: <pdx file>_<variant>{PDXArtifact.FILE_EXTENSION})")
+    parser.add_argument("--variant-scoped", action="store_true", help="only load the diag layers the variant inherits from")
+    parser.add_argument("--info", metavar="ARTIFACT", help="print the catalog summary of an artifact and exit")
+    args = parser.parse_args(argv)
+
+    if args.info:
+        PDXCompiler.print_info(args.info)
+        return 0
+
+    if not args.pdx_file or not args.variant:
+        parser.error("the PDX file and the variant are required")
+
+    start = time.perf_counter()
+    output_file = PDXCompiler.compile(args.pdx_file, args.variant, args.output, args.variant_scoped)
+    print(f"Compiled {args.pdx_file} ({args.variant}) to {output_file} "
+          f"({os.path.getsize(output_file)} bytes) in {time.perf_counter() - start:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+from robot.api import logger
+from odxtools.dataobjectproperty import DataObjectProperty
+from odxtools.standardlengthtype import StandardLengthType
+import struct
+
+
+class CompiledParameter:
+    """
+Precomputed layout of one parameter of a diagnostic message.
+    """
+    __slots__ = ("short_name", "kind", "byte_position", "byte_length", "bit_position", "bit_length",
+                 "mask", "reverse", "signed", "value_type", "coded_value", "dop", "identical")
+
+    # Kinds of compiled parameters
+    CONST = 0
+    VALUE = 1
+    RESERVED = 2
+
+    def __init__(self, short_name, kind, byte_position, bit_position, bit_length):
+        self.short_name = short_name
+        self.kind = kind
+        self.byte_position = byte_position
+        self.bit_position = bit_position
+        self.bit_length = bit_length
+        self.byte_length = (bit_length + bit_position + 7) >> 3
+        self.mask = (1 << bit_length) - 1
+        self.reverse = False
+        self.signed = False
+        self.value_type = "A_UINT32"
+        self.coded_value = None
+        self.dop = None
+        self.identical = True
+
+    def extract(self, data):
+        """
+Extract the internal value of the parameter from a message, or return None if it is not decodable.
+        """
+        end = self.byte_position + self.byte_length
+        if end > len(data):
+            return None
+        chunk = data[self.byte_position:end]
+        if self.reverse:
+            chunk = bytes(chunk)[::-1]
+        raw = (int.from_bytes(chunk, "big") >> self.bit_position) & self.mask
+
+        value_type = self.value_type
+        if value_type == "A_UINT32":
+            return raw
+        if value_type == "A_INT32":
+            if raw >> (self.bit_length - 1):
+                raw -= 1 << self.bit_length
+            return raw
+        if value_type == "A_BYTEFIELD":
+            return raw.to_bytes((self.bit_length + 7) >> 3, "big")
+        if value_type == "A_FLOAT32":
+            return struct.unpack(">f", raw.to_bytes(4, "big"))[0]
+        return struct.unpack(">d", raw.to_bytes(8, "big"))[0]
+
+    def insert(self, buffer, internal_value):
+        """
+Insert the internal value of the parameter into a message buffer. Returns False if the value does not fit.
+        """
+        value_type = self.value_type
+        if value_type == "A_UINT32":
+            if not isinstance(internal_value, int) or internal_value < 0 or internal_value > self.mask:
+                return False
+            raw = internal_value
+        elif value_type == "A_INT32":
+            if not isinstance(internal_value, int) or not -(1 << (self.bit_length - 1)) <= internal_value < (1 << (self.bit_length - 1)):
+                return False
+            raw = internal_value & self.mask
+        elif value_type == "A_BYTEFIELD":
+            if not isinstance(internal_value, (bytes, bytearray)) or len(internal_value) != (self.bit_length + 7) >> 3:
+                return False
+            raw = int.from_bytes(internal_value, "big") & self.mask
+        elif value_type == "A_FLOAT32":
+            raw = int.from_bytes(struct.pack(">f", internal_value), "big")
+        else:
+            raw = int.from_bytes(struct.pack(">d", internal_value), "big")
+
+        chunk = (raw << self.bit_position).to_bytes(self.byte_length, "big")
+        if self.reverse:
+            chunk = chunk[::-1]
+        start = self.byte_position
+        for i in range(self.byte_length):
+            buffer[start + i] |= chunk[i]
+        return True
+
+
+class CompiledMessage:
+    """
+Specialized encoder/decoder of a diagnostic request or response with a static bit layout.
+
+``encode`` and ``decode`` return None whenever a message or value does not match the
+compiled layout, the caller then falls back to odxtools which also reports the error.
+    """
+    def __init__(self, short_name, parameters, byte_length):
+        self.short_name = short_name
+        self.parameters = parameters
+        self.byte_length = byte_length
+        self.value_count = sum(1 for param in parameters if param.kind == CompiledParameter.VALUE)
+        template = bytearray(byte_length)
+        for param in parameters:
+            if param.kind == CompiledParameter.CONST:
+                param.insert(template, param.coded_value)
+        self.template = bytes(template)
+
+    def decode(self, data):
+        """
+Decode a complete message into the parameter dictionary.
+
+**Arguments:**
+
+* ``data``
+
+  / *Condition*: required / *Type*: bytes /
+
+  The message including its leading constant parameters.
+
+**Returns:**
+
+* ``param_dict``
+
+  / *Type*: dict /
+
+  The decoded parameters, or None if the message does not match the compiled layout.
+        """
+        if len(data) < self.byte_length:
+            return None
+        param_dict = {}
+        for param in self.parameters:
+            kind = param.kind
+            if kind == CompiledParameter.RESERVED:
+                continue
+            value = param.extract(data)
+            if kind == CompiledParameter.CONST:
+                if value != param.coded_value:
+                    return None
+            elif not param.identical:
+                compu_method = param.dop.compu_method
+                if not compu_method.is_valid_internal_value(value):
+                    return None
+                value = compu_method.convert_internal_to_physical(value)
+            param_dict[param.short_name] = value
+        return param_dict
+
+    def encode(self, parameter_dict):
+        """
+Encode the parameter dictionary into a complete message.
+
+**Arguments:**
+
+* ``parameter_dict``
+
+  / *Condition*: required / *Type*: dict /
+
+  The physical values of all value parameters.
+
+**Returns:**
+
+* ``message``
+
+  / *Type*: bytes /
+
+  The encoded message, or None if the values do not fit the compiled layout.
+        """
+        # Unknown parameters are reported by odxtools
+        if len(parameter_dict) != self.value_count:
+            return None
+        buffer = bytearray(self.template)
+        for param in self.parameters:
+            if param.kind != CompiledParameter.VALUE:
+                continue
+            if param.short_name not in parameter_dict:
+                return None
+            value = parameter_dict[param.short_name]
+            if not param.dop.is_valid_physical_value(value):
+                return None
+            if not param.identical:
+                value = param.dop.compu_method.convert_physical_to_internal(value)
+            if not param.insert(buffer, value):
+                return None
+        return bytes(buffer)
+
+
+class ServiceCompiler:
+    """
+Compiles diagnostic messages with a static bit layout into ``CompiledMessage`` plans.
+
+Supported are constant, reserved and value parameters whose data object property
+has a standard length coded type without bit mask. Integer, float and byte field
+types with the default encodings are supported, the compu method of a value is
+applied as defined in the PDX. Messages with any other parameter are not compiled.
+    """
+    SUPPORTED_ENCODINGS = {
+        "A_UINT32": (None, "NONE"),
+        "A_INT32": (None, "2C"),
+        "A_BYTEFIELD": (None, "NONE"),
+        "A_FLOAT32": (None, "NONE"),
+        "A_FLOAT64": (None, "NONE"),
+    }
+    NUMERIC_TYPES = ("A_UINT32", "A_INT32", "A_FLOAT32", "A_FLOAT64")
+
+    @staticmethod
+    def __get_enum_value(value):
+        return getattr(value, "value", value)
+
+    @staticmethod
+    def compile_parameter(param, byte_position):
+        """
+Compile the layout of one parameter, or return None if it is not static.
+        """
+        parameter_type = param.parameter_type
+        bit_position = param.bit_position or 0
+
+        if parameter_type == "RESERVED":
+            bit_length = getattr(param, "bit_length", None)
+            if not bit_length:
+                return None
+            return CompiledParameter(param.short_name, CompiledParameter.RESERVED, byte_position, bit_position, bit_length)
+
+        if parameter_type == "CODED-CONST":
+            diag_coded_type = param.diag_coded_type
+            dop = None
+            kind = CompiledParameter.CONST
+        elif parameter_type == "VALUE":
+            dop = getattr(param, "dop", None)
+            # The DOP may be a weak proxy, isinstance() sees through it
+            if not isinstance(dop, DataObjectProperty):
+                return None
+            diag_coded_type = dop.diag_coded_type
+            kind = CompiledParameter.VALUE
+        else:
+            return None
+
+        if not isinstance(diag_coded_type, StandardLengthType) or diag_coded_type.bit_mask is not None \
+           or getattr(diag_coded_type, "is_condensed_raw", None):
+            return None
+
+        value_type = ServiceCompiler.__get_enum_value(diag_coded_type.base_data_type)
+        encoding = ServiceCompiler.__get_enum_value(diag_coded_type.base_type_encoding)
+        if encoding not in ServiceCompiler.SUPPORTED_ENCODINGS.get(value_type, ()):
+            return None
+        bit_length = diag_coded_type.bit_length
+        if not bit_length or (value_type == "A_FLOAT32" and bit_length != 32) or (value_type == "A_FLOAT64" and bit_length != 64):
+            return None
+
+        compiled_param = CompiledParameter(param.short_name, kind, byte_position, bit_position, bit_length)
+        compiled_param.value_type = value_type
+        compiled_param.reverse = not diag_coded_type.is_highlow_byte_order and value_type in ServiceCompiler.NUMERIC_TYPES
+        compiled_param.signed = value_type == "A_INT32"
+        if kind == CompiledParameter.CONST:
+            compiled_param.coded_value = param.coded_value
+        else:
+            compiled_param.dop = dop
+            compiled_param.identical = ServiceCompiler.__get_enum_value(dop.compu_method.category) == "IDENTICAL"
+        return compiled_param
+
+    @staticmethod
+    def compile_message(message):
+        """
+Compile a request or response into a ``CompiledMessage``.
+
+**Arguments:**
+
+* ``message``
+
+  / *Condition*: required / *Type*: object /
+
+  The ODX request or response.
+
+**Returns:**
+
+* ``compiled_message``
+
+  / *Type*: CompiledMessage /
+
+  The compiled message, or None if the message does not have a static layout.
+        """
+        if message is None:
+            return None
+
+        parameters = []
+        cursor = 0
+        byte_length = 0
+        for param in message.parameters:
+            byte_position = param.byte_position if param.byte_position is not None else cursor
+            compiled_param = ServiceCompiler.compile_parameter(param, byte_position)
+            if compiled_param is None:
+                logger.debug(f"{message.short_name} is not compiled, parameter {param.short_name} has a dynamic layout")
+                return None
+            parameters.append(compiled_param)
+            cursor = byte_position + compiled_param.byte_length
+            byte_length = max(byte_length, cursor)
+
+        return CompiledMessage(message.short_name, parameters, byte_length)
+
+
+class RequestConverter:
+    """
+Converts the request parameters given by a Robot test to the physical types of a service.
+
+The parameter tree of the service is walked once, the result is a flat list of
+steps. Each step holds the path of a parameter and either the converter of its
+physical base data type, or None for a structure whose dictionary is copied,
+so the caller's dictionary is never modified.
+    """
+    def __init__(self, service):
+        self.service_name = service.short_name
+        self.steps = []
+        if service.request is not None:
+            self.__add_steps(service.request.parameters, ())
+
+    def __add_steps(self, parameters, parent_path):
+        # Only VALUE parameters are given by the test, constants are encoded from the PDX
+        for param in parameters:
+            if param.parameter_type != "VALUE":
+                continue
+            path = parent_path + (param.short_name,)
+            required = getattr(param, "is_required", True)
+            dop = param.dop
+            sub_parameters = getattr(dop, "parameters", None)
+            if sub_parameters is not None:
+                self.steps.append((path, required, None))
+                self.__add_steps(sub_parameters, path)
+            else:
+                physical_type = getattr(dop, "physical_type", None)
+                converter = RequestConverter.get_converter(physical_type.base_data_type) if physical_type is not None else None
+                # Values of fields without physical type are passed to odxtools as they are
+                if converter is not None:
+                    self.steps.append((path, required, converter))
+
+    @staticmethod
+    def get_converter(base_data_type):
+        """
+Retrieve the function which converts a value to the given base data type.
+
+Values which already have the right type are returned as they are. Bytes and
+byte string literals like ``b'...'`` are handled as hex data, all other values
+are parsed like values in the PDX.
+        """
+        from_string = base_data_type.from_string
+        value_type = getattr(base_data_type, "value", base_data_type)
+
+        def to_string(value):
+            if isinstance(value, (bytes, bytearray)):
+                return value.hex()
+            if isinstance(value, str):
+                if len(value) >= 3 and value[0] == "b" and value[1] in "'\"" and value[-1] in "'\"":
+                    return bytes(value[2:-1], "latin1").hex()
+                return value
+            return str(value)
+
+        if value_type in ("A_INT32", "A_UINT32"):
+            def convert(value):
+                if isinstance(value, int) and not isinstance(value, bool):
+                    return value
+                return from_string(to_string(value))
+        elif value_type in ("A_FLOAT32", "A_FLOAT64"):
+            def convert(value):
+                if isinstance(value, float):
+                    return value
+                if isinstance(value, int) and not isinstance(value, bool):
+                    return float(value)
+                return from_string(to_string(value))
+        elif value_type == "A_BYTEFIELD":
+            def convert(value):
+                if isinstance(value, (bytes, bytearray)):
+                    return bytearray(value)
+                return from_string(to_string(value))
+        else:
+            def convert(value):
+                return from_string(to_string(value))
+        return convert
+
+    def convert(self, parameter_dict):
+        """
+Convert the request parameters to the physical types of the service.
+
+**Arguments:**
+
+* ``parameter_dict``
+
+  / *Condition*: required / *Type*: dict /
+
+  The dictionary of request parameter, it is not modified.
+
+**Returns:**
+
+* ``converted_dict``
+
+  / *Type*: dict /
+
+  A new dictionary of request parameters with the correct data types.
+        """
+        if not isinstance(parameter_dict, dict):
+            raise ValueError(f"Parameters of {self.service_name} must be a dictionary, got {type(parameter_dict).__name__}")
+
+        converted_dict = dict(parameter_dict)
+        for path, required, converter in self.steps:
+            container = converted_dict
+            for name in path[:-1]:
+                container = container.get(name)
+                # The parameters of an omitted optional structure are skipped as well
+                if container is None:
+                    break
+            if container is None:
+                continue
+            name = path[-1]
+            if name not in container:
+                if required:
+                    raise ValueError(f"required parameter {'.'.join(path)} is missing")
+                continue
+
+            value = container[name]
+            if converter is None:
+                if not isinstance(value, dict):
+                    raise ValueError(f"parameter {'.'.join(path)} is a structure and requires a dictionary, got {value!r}")
+                container[name] = dict(value)
+                continue
+            try:
+                container[name] = converter(value)
+            except Exception as e:
+                raise ValueError(f"invalid value {value!r} of parameter {'.'.join(path)}: {e}")
+
+        return converted_dict
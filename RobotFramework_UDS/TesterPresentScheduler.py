@@ -0,0 +1,136 @@
+from udsoncan import services
+from udsoncan.Request import Request
+import threading
+import time
+
+
+class TesterPresentScheduler:
+    """
+Sends TesterPresent in a background thread to keep a non-default session of a device alive.
+
+Every request resets the S3 timer of the ECU, so a TesterPresent is only due one interval
+after the last request of the client. When a request of the test flow is in progress at that
+time, the beat is skipped instead of waiting for the request lock, so the scheduler never
+delays the test flow. The lateness of every beat against its deadline is recorded as jitter,
+a beat which is later than the tolerance or fails is counted as missed deadline.
+    """
+    def __init__(self, client, interval=2.0, suppress_positive_response=True, tolerance=None):
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError(f"Tester present interval must be positive, got {interval}")
+        self.client = client
+        self.interval = interval
+        self.suppress_positive_response = suppress_positive_response
+        self.tolerance = float(tolerance) if tolerance is not None else interval / 10
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.reset_report()
+
+    def reset_report(self):
+        """
+Reset the counters and the jitter statistics.
+        """
+        with self.stats_lock:
+            self.sent = 0
+            self.skipped = 0
+            self.errors = 0
+            self.missed_deadlines = 0
+            self.jitter_min = None
+            self.jitter_max = None
+            self.jitter_sum = 0.0
+            self.last_error = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """
+Start the background thread.
+        """
+        if self.is_running():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__run, name="TesterPresentScheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+Stop the background thread, a TesterPresent which is being sent is completed first.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def __run(self):
+        request = Request(services.TesterPresent, subfunction=0, suppress_positive_response=self.suppress_positive_response)
+        deferred_until = 0.0
+        while not self.stop_event.is_set():
+            deadline = max(self.client.last_activity + self.interval, deferred_until)
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                # Woken up early by stop, or the deadline moved because of another request
+                self.stop_event.wait(remaining)
+                continue
+
+            if not self.client.request_lock.acquire(blocking=False):
+                # A request of the test flow is in progress and keeps the session alive
+                with self.stats_lock:
+                    self.skipped += 1
+                deferred_until = time.monotonic() + self.interval
+                continue
+
+            error = None
+            try:
+                sent_time = time.monotonic()
+                self.client.send_request(request)
+            except Exception as e:
+                error = e
+            finally:
+                self.client.request_lock.release()
+            deferred_until = 0.0
+            self.__record(sent_time - deadline, error)
+
+    def __record(self, jitter, error):
+        with self.stats_lock:
+            if error is not None:
+                self.errors += 1
+                self.missed_deadlines += 1
+                self.last_error = str(error)
+                return
+            self.sent += 1
+            self.jitter_sum += jitter
+            self.jitter_min = jitter if self.jitter_min is None else min(self.jitter_min, jitter)
+            self.jitter_max = jitter if self.jitter_max is None else max(self.jitter_max, jitter)
+            if jitter > self.tolerance:
+                self.missed_deadlines += 1
+
+    def get_report(self):
+        """
+Get the statistics of the scheduler.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  ``running``, ``interval`` and ``tolerance``, the number of ``sent`` beats, of beats ``skipped``
+  because of a request in progress and of ``errors``, the number of ``missed_deadlines`` and the
+  ``jitter_min``, ``jitter_max`` and ``jitter_mean`` of the sent beats in seconds, and the ``last_error``.
+        """
+        with self.stats_lock:
+            return {
+                "running": self.is_running(),
+                "interval": self.interval,
+                "tolerance": self.tolerance,
+                "sent": self.sent,
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "missed_deadlines": self.missed_deadlines,
+                "jitter_min": self.jitter_min,
+                "jitter_max": self.jitter_max,
+                "jitter_mean": self.jitter_sum / self.sent if self.sent else None,
+                "last_error": self.last_error,
+            }
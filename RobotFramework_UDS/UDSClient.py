@@ -0,0 +1,258 @@
+from doipclient.connectors import DoIPClientUDSConnector
+from udsoncan import Response, services
+from udsoncan.client import Client
+from udsoncan.connections import IsoTPSocketConnection, SocketConnection
+from udsoncan.exceptions import InvalidResponseException, NegativeResponseException, TimeoutException, UnexpectedResponseException
+from .LatencyStatistics import LatencyStatistics
+import threading
+import time
+
+
+class TimedConnection:
+    """
+Wrapper of a connection during one request, which takes the times of sending the request,
+of the first responsePending and of receiving the final response.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.send_start = None
+        self.send_end = None
+        self.pending_start = None
+        self.receive_end = None
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def send(self, payload):
+        self.send_start = time.perf_counter()
+        self.conn.send(payload)
+        self.send_end = time.perf_counter()
+
+    def wait_frame(self, *args, **kwargs):
+        frame = self.conn.wait_frame(*args, **kwargs)
+        self.receive_end = time.perf_counter()
+        if self.pending_start is None and frame is not None and len(frame) >= 3 and frame[0] == 0x7F and frame[2] == UDSClient.RESPONSE_PENDING:
+            self.pending_start = self.receive_end
+        return frame
+
+    def record(self, context):
+        """
+Record the phases of the request into a latency context.
+        """
+        if self.send_end is None:
+            return
+        context.record("send", self.send_end - self.send_start)
+        if self.receive_end is not None and self.receive_end > self.send_end:
+            context.record("response", self.receive_end - self.send_end)
+            if self.pending_start is not None:
+                context.record("response_pending", self.receive_end - self.pending_start, measured=False)
+
+
+class ResponseTiming:
+    """
+Timing and validation of the responses to one request, independent of how the frames are received.
+
+It applies the rules of ``udsoncan.Client.send_request``, so the threaded client and the asyncio
+client behave the same:
+
+* The P2 and P2* timeouts are the ones reported by the server in the last diagnosticSessionControl
+  response if ``use_server_timing`` is set, else ``p2_timeout`` and ``p2_star_timeout`` of the config.
+* A responsePending of the request switches to P2* and calls ``nrc78_callback`` of the config.
+* Without an explicit timeout, the request is limited to ``request_timeout`` of the config;
+  an explicit timeout limits every single wait like in udsoncan.
+    """
+    def __init__(self, payload, config, session_timing, timeout=-1):
+        self.service_id = payload[0]
+        self.config = config
+        self.p2_timeout = config['p2_timeout'] if session_timing.p2_server_max is None else session_timing.p2_server_max
+        self.p2_star_timeout = config['p2_star_timeout'] if session_timing.p2_star_server_max is None else session_timing.p2_star_server_max
+        self.overall_timeout = config['request_timeout'] if timeout < 0 else timeout
+        self.deadline = time.monotonic() + self.overall_timeout if self.overall_timeout is not None else None
+        self.single_timeout = self.p2_timeout if timeout < 0 else timeout
+        if self.overall_timeout is not None:
+            self.single_timeout = min(self.single_timeout, self.overall_timeout)
+        self.overall_timeout_used = False
+        self.response_pending = False
+
+    def get_wait_timeout(self):
+        """
+Get the time to wait for the next response, limited by the overall deadline.
+        """
+        self.overall_timeout_used = self.deadline is not None and time.monotonic() + self.single_timeout >= self.deadline
+        if self.overall_timeout_used:
+            return max(self.deadline - time.monotonic(), 0)
+        return self.single_timeout
+
+    def get_timeout_exception(self):
+        """
+Get the exception for a response which has not been received in time, worded like udsoncan.
+        """
+        if self.overall_timeout_used:
+            name, timeout = "Global request timeout", self.overall_timeout
+        else:
+            name, timeout = ("P2* timeout" if self.response_pending else "P2 timeout"), self.single_timeout
+        return TimeoutException(f"Did not receive response in time. {name} time has expired (timeout={timeout:.3f} sec)")
+
+    def is_response_pending(self, response_data):
+        """
+Check whether a response is a responsePending of the request, in which case the P2* timeout is applied from now on.
+        """
+        if len(response_data) >= 3 and response_data[0] == 0x7F and response_data[1] == self.service_id \
+                and response_data[2] == UDSClient.RESPONSE_PENDING:
+            if self.config.get('nrc78_callback') is not None:
+                self.config['nrc78_callback']()
+            if not self.response_pending:
+                self.response_pending = True
+                self.single_timeout = self.p2_star_timeout
+            return True
+        return False
+
+    def check(self, response_data):
+        """
+Validate a final response like ``send_request``.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: udsoncan.Response /
+
+  The positive response.
+        """
+        response = Response.from_payload(response_data)
+        if not response.valid:
+            raise InvalidResponseException(response)
+        if response.service is None or response.service.request_id() != self.service_id:
+            raise UnexpectedResponseException(response, f"Response given by server is for another service than the one requested. Requested 0x{self.service_id:02X}")
+        if not response.positive:
+            raise NegativeResponseException(response)
+        return response
+
+    def update_session_timing(self, response, session_timing):
+        """
+Take over the P2 and P2* timings reported in a positive diagnosticSessionControl response, like ``diagnostic_session_control`` does.
+        """
+        if response.service is not services.DiagnosticSessionControl or not self.config['use_server_timing'] \
+                or self.config['standard_version'] <= 2006:
+            return
+        services.DiagnosticSessionControl.interpret_response(response, standard_version=self.config['standard_version'])
+        session_timing.p2_server_max = response.service_data.p2_server_max
+        session_timing.p2_star_server_max = response.service_data.p2_star_server_max
+
+
+class UDSClient(Client):
+    """
+UDS client which serializes the requests of several threads on the same connection.
+
+Every request holds the request lock from sending until its response is received, so
+background requests like TesterPresent never interleave with a request of the test flow.
+The time of the last request is tracked to schedule such background requests only when
+the connection has been idle.
+
+If ``latency_statistics`` is set, the send and response times of every request are recorded,
+for the keyword measured in the calling thread or else for the udsoncan service of the request.
+    """
+    # Connections which have copied the payload when sending returns, so a reused buffer can be sent
+    COPYING_CONNECTIONS = (DoIPClientUDSConnector, SocketConnection, IsoTPSocketConnection)
+    RESPONSE_PENDING = 0x78
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request_lock = threading.RLock()
+        self.last_activity = time.monotonic()
+        self.latency_statistics = None
+
+    def get_latency_context(self, service):
+        """
+Get the latency context of the keyword measured in the calling thread, or of a service outside of a keyword.
+        """
+        context = LatencyStatistics.get_context()
+        if context is None and self.latency_statistics is not None:
+            context = self.latency_statistics.create_context(service)
+        return context
+
+    def send_request(self, request, timeout=-1):
+        with self.request_lock:
+            self.last_activity = time.monotonic()
+            context = self.get_latency_context(request.service.get_name() if request.service is not None else None)
+            if context is None:
+                try:
+                    return super().send_request(request, timeout)
+                finally:
+                    self.last_activity = time.monotonic()
+
+            conn = self.conn
+            timed_conn = self.conn = TimedConnection(conn)
+            try:
+                return super().send_request(request, timeout)
+            finally:
+                self.conn = conn
+                timed_conn.record(context)
+                self.last_activity = time.monotonic()
+
+    def can_send_buffer(self):
+        """
+Check whether ``exchange`` can be given a buffer which is reused for the next request.
+        """
+        return isinstance(self.conn, UDSClient.COPYING_CONNECTIONS)
+
+    def exchange(self, payload, timeout=-1):
+        """
+Send a raw request and wait for its final response, without building request and response objects.
+
+The P2 and P2* timeouts are applied by ``ResponseTiming`` like ``send_request``, responsePending responses are skipped.
+This is used for bulk transfers, where each block should cost as little as possible.
+
+**Arguments:**
+
+* ``payload``
+
+  / *Condition*: required / *Type*: bytes or memoryview /
+
+  The complete request. A buffer which is reused afterwards may only be given if ``can_send_buffer`` is True.
+
+* ``timeout``
+
+  / *Condition*: optional / *Type*: float / *Default*: -1 /
+
+  The overall timeout in seconds, by default ``request_timeout`` of the config.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: bytes /
+
+  The complete response, positive or negative.
+        """
+        with self.request_lock:
+            self.last_activity = time.monotonic()
+            try:
+                timing = ResponseTiming(payload, self.config, self.session_timing, timeout)
+
+                self.conn.empty_rxqueue()
+                # The connection's send() formats every payload as hex for its debug log, which is skipped here
+                self.conn.check_connection_opened()
+                context = self.get_latency_context(f"0x{payload[0]:02X}")
+                send_start = time.perf_counter() if context is not None else None
+                self.conn.specific_send(payload)
+                send_end = time.perf_counter() if context is not None else None
+                pending_start = None
+
+                while True:
+                    response = self.conn.wait_frame(timeout=timing.get_wait_timeout(), exception=False)
+                    if response is None:
+                        raise timing.get_timeout_exception()
+                    if timing.is_response_pending(response):
+                        if context is not None and pending_start is None:
+                            pending_start = time.perf_counter()
+                        continue
+                    if context is not None:
+                        receive_end = time.perf_counter()
+                        context.record("send", send_end - send_start)
+                        context.record("response", receive_end - send_end)
+                        if pending_start is not None:
+                            context.record("response_pending", receive_end - pending_start, measured=False)
+                    return response
+            finally:
+                self.last_activity = time.monotonic()
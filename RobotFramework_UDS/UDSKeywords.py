@@ -1,16 +1,29 @@
 from robot.api.deco import keyword
 from robot.api import logger
 from robot.libraries.BuiltIn import BuiltIn
+from robot.output import librarylogger
+from robot.running.arguments import PythonArgumentParser
 from doipclient.connectors import DoIPClientUDSConnector
 from udsoncan import CommunicationType, DynamicDidDefinition, IOMasks, IOValues, MemoryLocation
-from udsoncan.client import Client
+from udsoncan.Request import Request
 from udsoncan.Response import Response
+from udsoncan.exceptions import NegativeResponseException, TimeoutException, UnexpectedResponseException, InvalidResponseException
 from typing import Optional, Union, Dict, List, Any, cast
 from udsoncan.common.Filesize import Filesize
 from udsoncan.common.Baudrate import Baudrate
 from udsoncan.common.DataFormatIdentifier import DataFormatIdentifier
 from udsoncan.common.dtc import Dtc
 from .DiagnosticServices import DiagnosticServices
+from .PDXCache import PDXCache
+from .DiagnosticDatabase import DiagnosticDatabase
+from .VariantIdentifier import VariantIdentifier
+from .UDSClient import UDSClient
+from .TesterPresentScheduler import TesterPresentScheduler
+from .DIDBatcher import DIDBatcher
+from .DataTransfer import DataTransfer, TransferCheckpoint, TransferStatistics
+from .Compression import CompressionMethods, CompressingReader, DecompressingWriter
+from .DoIPSimulator import DoIPSimulator
+from .LatencyStatistics import LatencyStatistics, measure_keyword
 from udsoncan.configs import default_client_config
 from udsoncan import latest_standard
 from typing import cast
@@ -18,6 +31,12 @@ from udsoncan.typing import ClientConfig
 from doipclient import DoIPClient, constants, messages
 from udsoncan.connections import PythonIsoTpConnection
 import udsoncan
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import inspect
+import os
+import threading
+import time
 
 class UDSDeviceManager:
     def __init__(self):
@@ -29,19 +48,271 @@ class UDSDeviceManager:
             return True
         return False
 
+class PDXRegistry:
+    """
+Process-wide registry of loaded diagnostic databases.
+
+Devices which load the same PDX file and variant in the same mode share one
+``DiagnosticServices`` object. The services are read-only, the settings changed by
+``Set PDX Compiled Codec Mode``, ``Set PDX Request Cache Size`` and ``Clear PDX Request Cache``
+apply to every user of the shared database. The registry counts the devices using
+each database and drops it when the last one releases it.
+
+A database is keyed by the path, the SHA-256 hash of the PDX file, the variant
+and the load mode, so a modified file or a variant scoped or low memory load
+never gets a database loaded in another mode.
+
+Databases are loaded by a pool of worker threads, so a PDX file can be parsed
+while the connection to the ECU is set up. A database which is requested while
+it is still loading is shared as well.
+    """
+    def __init__(self):
+        self.diag_service_dbs = {}
+        self.ref_counts = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(thread_name_prefix="PDXLoader")
+        # Only used for the file hashes, which are recalculated when a file is modified
+        self.pdx_hashes = PDXCache(enabled=False)
+
+    def get_key(self, pdx_file, variant, variant_scoped=False, low_memory=False):
+        """
+Get the key of a PDX file, variant and load mode in the registry.
+        """
+        return (os.path.abspath(pdx_file), variant, self.pdx_hashes.get_pdx_hash(pdx_file), bool(variant_scoped), bool(low_memory))
+
+    def acquire(self, pdx_file, variant, pdx_cache=None, variant_scoped=False, low_memory=False):
+        """
+Get the shared diagnostic database of a PDX file and variant, start loading it in background if it is not registered yet.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``pdx_cache``
+
+  / *Condition*: optional / *Type*: PDXCache /
+
+  The persistent PDX cache used when the database has to be loaded.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool /
+
+  If True, only the diag layers the variant inherits from are loaded.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool /
+  If True, everything except the variant and the objects its services use is released after loading.
+  If True, everything except the variant and its parent layers is released after loading.
+
+**Returns:**
+
+* ``diag_service_db``
+
+  / *Type*: Future /
+
+  The handle of the shared diagnostic database, ``result()`` waits until it is loaded.
+
+* ``key``
+
+  / *Type*: tuple /
+
+  The key of the database, which has to be passed to ``release``.
+        """
+        key = self.get_key(pdx_file, variant, variant_scoped, low_memory)
+        submitted = False
+        with self.lock:
+            diag_service_db = self.diag_service_dbs.get(key)
+            if diag_service_db is None:
+                diag_service_db = self.executor.submit(DiagnosticServices, pdx_file, variant, pdx_cache, variant_scoped, low_memory)
+                self.diag_service_dbs[key] = diag_service_db
+                self.ref_counts[key] = 0
+                submitted = True
+            else:
+                logger.info(f"Reuse loaded PDX {pdx_file} ({variant})")
+            self.ref_counts[key] += 1
+        # Registered outside of the lock, the callback is run immediately if the load has already failed
+        if submitted:
+            diag_service_db.add_done_callback(lambda handle: self.__remove_failed(key, handle))
+        return diag_service_db, key
+
+    def __remove_failed(self, key, handle):
+        # A failed load is not shared, the next request loads the PDX file again.
+        # The devices holding the failed handle do not release it, see UDSDevice.release_diag_service_db.
+        if handle.exception() is None:
+            return
+        with self.lock:
+            if self.diag_service_dbs.get(key) is handle:
+                del self.diag_service_dbs[key]
+                del self.ref_counts[key]
+
+    def register(self, pdx_file, variant, diag_service_db, variant_scoped=False, low_memory=False):
+        """
+Register a diagnostic database which has already been loaded, e.g. during the variant identification.
+
+If the PDX file and variant are registered already in the same mode, the registered database is shared instead.
+
+**Returns:**
+
+* ``diag_service_db``
+
+  / *Type*: Future /
+
+  The handle of the shared diagnostic database.
+
+* ``key``
+
+  / *Type*: tuple /
+
+  The key of the database, which has to be passed to ``release``.
+        """
+        key = self.get_key(pdx_file, variant, variant_scoped, low_memory)
+        with self.lock:
+            handle = self.diag_service_dbs.get(key)
+            if handle is None:
+                handle = Future()
+                handle.set_result(diag_service_db)
+                self.diag_service_dbs[key] = handle
+                self.ref_counts[key] = self.ref_counts.get(key, 0)
+            self.ref_counts[key] += 1
+            return handle, key
+
+    def release(self, key):
+        """
+Release one reference to a shared diagnostic database. The database is dropped with its last reference.
+
+**Arguments:**
+
+* ``key``
+
+  / *Condition*: required / *Type*: tuple /
+
+  The key of the database, as returned by ``acquire`` or ``register``.
+        """
+        with self.lock:
+            if key not in self.ref_counts:
+                return
+            self.ref_counts[key] -= 1
+            if self.ref_counts[key] <= 0:
+                logger.info(f"Release PDX {key[0]} ({key[1]})")
+                del self.diag_service_dbs[key]
+                del self.ref_counts[key]
+
+class WorkerLogBuffer:
+    """
+Collect the messages which keywords log with ``robot.api.logger`` in worker threads.
+
+Robot Framework only writes messages of the main thread to the log, so the messages of a keyword
+run in a worker thread are collected while ``capture`` is active and written by ``replay`` in the
+main thread afterwards.
+    """
+    active = threading.local()
+    lock = threading.Lock()
+    original_write = None
+
+    @staticmethod
+    def install():
+        with WorkerLogBuffer.lock:
+            if WorkerLogBuffer.original_write is not None:
+                return
+            original_write = WorkerLogBuffer.original_write = librarylogger.write
+
+            def write(msg, level="INFO", html=False, *args):
+                messages = getattr(WorkerLogBuffer.active, "messages", None)
+                if messages is None:
+                    return original_write(msg, level, html, *args)
+                messages.append((msg, level, html) + args)
+
+            librarylogger.write = write
+
+    @staticmethod
+    @contextmanager
+    def capture():
+        WorkerLogBuffer.install()
+        messages = WorkerLogBuffer.active.messages = []
+        try:
+            yield messages
+        finally:
+            WorkerLogBuffer.active.messages = None
+
+    @staticmethod
+    def replay(messages):
+        for message in messages:
+            WorkerLogBuffer.original_write(*message)
+
 class UDSDevice:
     def __init__(self):
         self.name = None
         self.diag_service_db = None
+        self.diag_service_db_key = None
         self.config = None
         self.uds_connector = None
         self.client = None
         self.connector = None
+        self.logical_address = None
+        self.ip_address = None
         self.available = False
+        self.tester_present_scheduler = None
+        # Limits of the DIDs per ReadDataByIdentifier request, learned from the ECU's negative responses
+        self.did_batcher = DIDBatcher()
+        # Held by every keyword run through "Run Keyword On Devices", which may send several requests
+        self.lock = threading.RLock()
+        # The PDX database and config of the DID codecs attached to the client config
+        self.did_codec_state = None
+        # Latency histograms of the keywords and requests, kept when the device is reconnected
+        self.latency_statistics = LatencyStatistics()
+
+    @property
+    def diag_service_db(self):
+        return self.wait_diag_service_db()
+
+    def wait_diag_service_db(self, timeout=None):
+        # A PDX which is still loading in background is waited for on first use
+        if isinstance(self._diag_service_db, Future):
+            self._diag_service_db = self._diag_service_db.result(timeout)
+        return self._diag_service_db
+
+    @diag_service_db.setter
+    def diag_service_db(self, diag_service_db):
+        self._diag_service_db = diag_service_db
+
+    def stop_tester_present(self):
+        if self.tester_present_scheduler is not None:
+            self.tester_present_scheduler.stop()
+
+    def release_diag_service_db(self):
+        # The registry has already removed a database which failed to load
+        failed = isinstance(self._diag_service_db, Future) and self._diag_service_db.done() \
+            and self._diag_service_db.exception() is not None
+        if self.diag_service_db_key is not None and not failed:
+            UDSKeywords.pdx_registry.release(self.diag_service_db_key)
+        self.diag_service_db = None
+        self.diag_service_db_key = None
 
 class UDSKeywords:
+    pdx_registry = PDXRegistry()
+
+    # Default number of worker threads of "Run Keyword On Devices"
+    DEFAULT_FANOUT_WORKERS = 16
+
     def __init__(self):
         self.uds_manager = UDSDeviceManager()
+        self.pdx_cache = PDXCache()
+        self.diag_database = DiagnosticDatabase()
+        self.variant_identifier = VariantIdentifier()
+        # Simulated ECUs by name, with the registry key of their diagnostic database
+        self.simulators = {}
 
     def __device_check(self, device_name):
         if self.uds_manager.is_device_exist(device_name):
@@ -53,15 +324,41 @@ class UDSKeywords:
         else:
             raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
 
+    @staticmethod
+    def __copy_config(config):
+        # Each device gets its own codec mapping, the DID codecs of its PDX are merged into it
+        config = dict(config)
+        config['data_identifiers'] = dict(config.get('data_identifiers') or {})
+        return config
+
+    def __attach_did_codec(self, uds_device):
+        """
+Attach the DID codecs of the device's PDX for reading and writing to the client config.
+
+The codecs are only merged into the config when the PDX or the config changed since
+they were attached the last time.
+        """
+        diag_service_db = uds_device.diag_service_db
+        did_codec_state = uds_device.did_codec_state
+        if did_codec_state is not None \
+           and did_codec_state[0] is diag_service_db \
+           and did_codec_state[1] is uds_device.config:
+            return
+
+        uds_device.config['data_identifiers'].update(diag_service_db.get_read_write_did_codec())
+        uds_device.client.set_configs(uds_device.config)
+        uds_device.did_codec_state = (diag_service_db, uds_device.config)
+
     @keyword("Connect UDS Connector")
     def connect_uds_connector(self, device_name="default", config=default_client_config, close_connection=False):
         if self.uds_manager.is_device_exist(device_name):
             if self.uds_manager.uds_device[device_name].available:
                 logger.info(f"Device {device_name} is available to be use.")
             else:
-                self.uds_manager.uds_device[device_name].config = config
+                self.uds_manager.uds_device[device_name].config = self.__copy_config(config)
                 self.uds_manager.uds_device[device_name].uds_connector = DoIPClientUDSConnector(self.uds_manager.uds_device[device_name].connector, device_name, close_connection)
-                self.uds_manager.uds_device[device_name].client = Client(self.uds_manager.uds_device[device_name].uds_connector, self.uds_manager.uds_device[device_name].config)
+                self.uds_manager.uds_device[device_name].client = UDSClient(self.uds_manager.uds_device[device_name].uds_connector, self.uds_manager.uds_device[device_name].config)
+                self.uds_manager.uds_device[device_name].client.latency_statistics = self.uds_manager.uds_device[device_name].latency_statistics
                 self.uds_manager.uds_device[device_name].available = True
         else:
             raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
@@ -117,6 +414,8 @@ class UDSKeywords:
         if self.uds_manager.is_device_exist(device_name):
             raise ValueError(f"Device with name '{device_name}' already exists.")
         connector = None
+        ecu_ip_address = None
+        ecu_logical_address = None
         if comunication_name.lower() == "doip":
             # Define required parameters
             required_params = ['ecu_ip_address', 'ecu_logical_address']
@@ -185,10 +484,141 @@ class UDSKeywords:
         uds_device = UDSDevice()
         uds_device.name = device_name
         uds_device.connector = connector
+        uds_device.logical_address = ecu_logical_address
+        uds_device.ip_address = ecu_ip_address
+        if comunication_name.lower() == "can":
+            uds_device.did_batcher.set_limits(max_response_length=DIDBatcher.ISOTP_MAX_RESPONSE_LENGTH)
         self.uds_manager.uds_device[device_name] = uds_device
 
+        # Bind the device to its ECU in the PDX database, if loaded
+        if ecu_logical_address is not None and self.diag_database.get_entry(ecu_logical_address) is not None:
+            self.__bind_database_entry(uds_device, ecu_logical_address)
+
+    def __bind_database_entry(self, uds_device, logical_address):
+        diag_service_db = self.diag_database.get_entry(logical_address)
+        if diag_service_db is None:
+            raise ValueError(f"PDX database does not contain an ECU with logical address {logical_address}. Please use keyword \"Load PDX Database\" to load it.")
+        uds_device.release_diag_service_db()
+        uds_device.diag_service_db = diag_service_db
+        logger.info(f"Device {uds_device.name} bound to {diag_service_db.pdx_file} ({diag_service_db.variant}) of logical address {logical_address}")
+
+    def __get_device_keyword(self, keyword_name):
+        normalized_name = keyword_name.lower().replace(" ", "").replace("_", "")
+        for attribute_name in dir(type(self)):
+            method = getattr(type(self), attribute_name, None)
+            robot_name = getattr(method, "robot_name", None)
+            if robot_name and robot_name.lower().replace(" ", "").replace("_", "") == normalized_name:
+                if "device_name" not in inspect.signature(method).parameters:
+                    raise ValueError(f"Keyword '{keyword_name}' has no argument 'device_name' and can not be run on devices.")
+                return getattr(self, attribute_name)
+        raise ValueError(f"Keyword '{keyword_name}' does not exists in {type(self).__name__}.")
+
+    @staticmethod
+    def __convert_keyword_arguments(method, keyword_name, args, kwargs, device_name):
+        # The method is called directly, so the arguments are converted by their types and defaults like Robot Framework does for a keyword call
+        spec = PythonArgumentParser().parse(method, keyword_name)
+        positional, named = spec.convert(list(args), list(kwargs.items()) + [("device_name", device_name)])
+        return positional, dict(named)
+
+    @staticmethod
+    def __run_device_keyword(uds_device, method, args, kwargs):
+        start = time.perf_counter()
+        with uds_device.lock, WorkerLogBuffer.capture() as messages:
+            try:
+                result = method(*args, **kwargs)
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+        return {"result": result, "error": error, "elapsed": time.perf_counter() - start, "messages": messages}
+
+    @keyword("Run Keyword On Devices")
+    def run_keyword_on_devices(self, device_names, keyword_name, *args, max_workers=None, fail_on_error=False, **kwargs):
+        """
+Run a keyword of this library on several devices at the same time.
+
+The keyword is run once per device in a pool of worker threads, with the given arguments and
+the device as ``device_name``. Each device is locked while the keyword runs on it, so keywords
+of concurrent fan-outs are run one after the other on a device.
+
+The arguments are converted by the argument types and defaults of the keyword before the workers
+start, like for a direct call of the keyword. The messages the keyword logs on a device are
+written to the log per device after all devices are handled.
+
+**Arguments:**
+
+* ``device_names``
+
+  / *Condition*: required / *Type*: list or str /
+
+  The names of the devices, as list or comma separated string.
+
+* ``keyword_name``
+
+  / *Condition*: required / *Type*: str /
+
+  The name of a keyword with argument ``device_name``, e.g. ``Read Data By Name`` or ``Diagnostic Session Control``.
+
+* ``args``, ``kwargs``
+
+  / *Condition*: optional /
+
+  The arguments of the keyword, without ``device_name``.
+
+* ``max_workers``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The maximum number of devices handled at the same time, by default 16.
+
+* ``fail_on_error``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, the keyword fails after all devices are handled when the keyword failed on any device.
+
+**Returns:**
+
+* ``results``
+
+  / *Type*: dict /
+
+  Per device name a dictionary with the ``result`` of the keyword, the ``error`` (the raised exception
+  or None) and the ``elapsed`` time in seconds.
+        """
+        if isinstance(device_names, str):
+            device_names = [device_name.strip() for device_name in device_names.split(",") if device_name.strip()]
+        device_names = list(dict.fromkeys(device_names))
+        uds_devices = [self.__device_check(device_name) for device_name in device_names]
+        method = self.__get_device_keyword(keyword_name)
+        if not uds_devices:
+            return {}
+
+        arguments = {uds_device.name: UDSKeywords.__convert_keyword_arguments(method, keyword_name, args, kwargs, uds_device.name)
+                     for uds_device in uds_devices}
+        max_workers = int(max_workers) if max_workers is not None else UDSKeywords.DEFAULT_FANOUT_WORKERS
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(uds_devices)), thread_name_prefix="UDSFanOut") as executor:
+            futures = {uds_device.name: executor.submit(UDSKeywords.__run_device_keyword, uds_device, method, *arguments[uds_device.name])
+                       for uds_device in uds_devices}
+            results = {device_name: future.result() for device_name, future in futures.items()}
+
+        failed_devices = [device_name for device_name, result in results.items() if result["error"] is not None]
+        for device_name, result in results.items():
+            messages = result.pop("messages")
+            if messages:
+                logger.info(f"Messages of {keyword_name} on {device_name}:")
+                WorkerLogBuffer.replay(messages)
+            status = f"FAIL ({result['error']})" if result["error"] is not None else "PASS"
+            logger.info(f"{keyword_name} on {device_name}: {status} in {result['elapsed'] * 1000:.1f} ms")
+        logger.info(f"{keyword_name} on {len(results)} device(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+        if fail_on_error and failed_devices:
+            BuiltIn().fail(f"{keyword_name} failed on device(s) {', '.join(failed_devices)}: "
+                           + "; ".join(f"{device_name}: {results[device_name]['error']}" for device_name in failed_devices))
+        return results
+
     @keyword("Load PDX")
-    def load_pdx(self, pdx_file, variant, device_name="default"):
+    def load_pdx(self, pdx_file, variant, device_name="default", use_cache=True, variant_scoped=False, low_memory=False):
         """
 Load PDX
 **Arguments:**
@@ -196,14 +626,350 @@ Load PDX
 
   / *Type*: str /
 
-  PDX file path
+  PDX file path, or the path of an artifact precompiled by
+  ``python -m RobotFramework_UDS.PDXCompiler <pdx file> <variant>``.
+  An artifact is loaded directly, the PDX cache and ``variant_scoped`` do not apply to it.
+  Artifacts are pickled and can execute code when they are loaded, so only load artifacts from trusted sources.
 
 * ``variant``
 
   / *Type*: str /
+
+* ``use_cache``
+
+  / *Condition*: optional / *Type*: bool /
+
+  If True (default), the variant is loaded from the persistent PDX cache when the PDX file has not been changed
+  and stored in it after parsing otherwise. Set to False to bypass the cache.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool /
+
+  If True, only the diag layers the variant inherits from are parsed and resolved.
+  This reduces load time and memory for PDX files with many variants.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool /
+
+  If True, the ODX database with all other variants, the comparam specifications, the auxiliary
+  files of the archive and the parent layers of the variant are released after loading, only the
+  variant with the services, DOPs and comparams it inherited is kept. This pays off when several
+  PDX files are held, right after loading the process hardly shrinks. The resident memory before
+  and after pruning is logged, ``Get PDX Memory Report`` returns it with the retained size of the database.
+
+Devices loading the same PDX file and variant share one read-only diagnostic database,
+it is parsed only once and released when the last device using it is removed by ``Remove UDS Connector``.
         """
         self.__device_check(device_name)
-        self.uds_manager.uds_device[device_name].diag_service_db = DiagnosticServices(pdx_file, variant)
+        self.load_pdx_in_background(pdx_file, variant, device_name, use_cache, variant_scoped, low_memory)
+        self.wait_for_pdx(device_name)
+
+    @keyword("Load PDX In Background")
+    def load_pdx_in_background(self, pdx_file, variant, device_name="default", use_cache=True, variant_scoped=False, low_memory=False):
+        """
+Start loading a PDX file in a worker thread and return immediately.
+
+The connection to the ECU can be set up meanwhile. Every keyword which needs the
+diagnostic database of the device waits until loading is finished, ``Wait For PDX``
+can be used to wait explicitly. Errors during loading are raised by the first keyword
+that needs the database.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path, or the path of a precompiled artifact (see ``Load PDX``).
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``use_cache``
+
+  / *Condition*: optional / *Type*: bool /
+
+  See ``Load PDX``.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool /
+
+  See ``Load PDX``.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool /
+
+  See ``Load PDX``.
+
+**Returns:**
+
+* ``handle``
+
+  / *Type*: Future /
+
+  The handle of the loading task.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
+        uds_device = self.uds_manager.uds_device[device_name]
+        pdx_cache = self.pdx_cache if use_cache else None
+        handle, key = UDSKeywords.pdx_registry.acquire(pdx_file, variant, pdx_cache, variant_scoped, low_memory)
+        uds_device.release_diag_service_db()
+        uds_device.diag_service_db = handle
+        uds_device.diag_service_db_key = key
+        return handle
+
+    @keyword("Wait For PDX")
+    def wait_for_pdx(self, device_name="default", timeout=None):
+        """
+Wait until the PDX file of a device which is loaded in background is ready.
+
+**Arguments:**
+
+* ``timeout``
+
+  / *Condition*: optional / *Type*: float /
+
+  Maximum time to wait in seconds. Default is to wait without limit.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
+        uds_device = self.uds_manager.uds_device[device_name]
+        return uds_device.wait_diag_service_db(float(timeout) if timeout is not None else None)
+
+    @keyword("Configure PDX Cache")
+    def configure_pdx_cache(self, cache_dir=None, max_size=None, enabled=True):
+        """
+Configure the persistent cache which stores parsed PDX variants between runs.
+
+**Arguments:**
+
+* ``cache_dir``
+
+  / *Condition*: optional / *Type*: str /
+
+  Directory of the cache. Default is the ``ROBOTFRAMEWORK_UDS_CACHE_DIR`` environment variable or ``~/.cache/RobotFramework_UDS/pdx``.
+  The entries are pickle files, which can execute code when they are loaded, so the directory must only be writable by trusted users.
+
+* ``max_size``
+
+  / *Condition*: optional / *Type*: int /
+
+  Maximum size of the cache in bytes. The least recently used entries are evicted when it is exceeded. Default is 2 GB.
+
+* ``enabled``
+
+  / *Condition*: optional / *Type*: bool /
+
+  Set to False to disable the cache for all following ``Load PDX`` calls.
+        """
+        self.pdx_cache = PDXCache(cache_dir, max_size, enabled)
+        self.pdx_cache.evict()
+
+    @keyword("Clear PDX Cache")
+    def clear_pdx_cache(self):
+        """
+Remove all entries from the persistent PDX cache.
+
+**Arguments:**
+
+* No specific arguments for this method.
+        """
+        self.pdx_cache.clear()
+
+    @staticmethod
+    def __send_raw_request(uds_device, payload):
+        # Returns the complete response, also a negative one, or None if the ECU does not respond properly
+        try:
+            response = uds_device.client.send_request(Request.from_payload(payload))
+        except NegativeResponseException as e:
+            response = e.response
+        except (TimeoutException, UnexpectedResponseException, InvalidResponseException) as e:
+            logger.warn(f"No valid response to identification request {payload.hex()}. Reason: {e}")
+            return None
+        return response.original_payload if response is not None else None
+
+    @keyword("Identify ECU Variant")
+    def identify_ecu_variant(self, pdx_file, device_name="default", use_cache=True, variant_scoped=False, low_memory=False, refresh=False):
+        """
+Identify the ECU variant with the variant patterns of the PDX file and load only this variant.
+
+The identification services referenced by the ECU variant patterns are sent to the ECU,
+the first variant whose patterns match the responses is loaded like by ``Load PDX``.
+The identified variant is cached per ECU (IP and logical address) and PDX file, following
+runs load the cached variant directly without identification requests.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the connected device.
+
+* ``use_cache``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If True, the identification cache and the PDX cache are used.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  See ``Load PDX``, only applies when the variant is known from the cache.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  See ``Load PDX``.
+
+* ``refresh``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, the variant is identified again even if it is cached.
+
+**Returns:**
+
+* ``variant``
+
+  / *Type*: str /
+
+  The name of the identified variant.
+        """
+        uds_device = self.__device_check(device_name)
+        pdx_hash = self.pdx_cache.get_pdx_hash(pdx_file)
+        ecu_key = VariantIdentifier.get_ecu_key(uds_device.ip_address, uds_device.logical_address, device_name)
+
+        variant = None
+        if use_cache and not refresh:
+            variant = self.variant_identifier.get_cached_variant(ecu_key, pdx_hash)
+        if variant is not None:
+            logger.info(f"Variant {variant} of {ecu_key} taken from the identification cache")
+            self.load_pdx(pdx_file, variant, device_name, use_cache, variant_scoped, low_memory)
+            return variant
+
+        # All variants are needed to evaluate their patterns
+        with DiagnosticServices.non_strict_mode():
+            odx_db = DiagnosticServices.load_pdx_db(pdx_file, use_weakrefs=not low_memory)
+        variant = VariantIdentifier.identify(odx_db, lambda payload: self.__send_raw_request(uds_device, payload))
+        if variant is None:
+            raise Exception(f"No ECU variant of {pdx_file} matches the responses of device {device_name}")
+        logger.info(f"Identified variant {variant} of {ecu_key}")
+        if use_cache:
+            self.variant_identifier.store_variant(ecu_key, pdx_hash, pdx_file, variant)
+            self.pdx_cache.store(pdx_file, variant, odx_db.ecus[variant])
+
+        # The already loaded database is used for the identified variant instead of parsing the PDX file again
+        diag_service_db = DiagnosticServices(pdx_file, variant, diag_layer=odx_db.ecus[variant])
+        diag_service_db.odx_db = odx_db
+        odx_db = None
+        if low_memory:
+            diag_service_db.prune()
+
+        handle, key = UDSKeywords.pdx_registry.register(pdx_file, variant, diag_service_db, low_memory=low_memory)
+        uds_device.release_diag_service_db()
+        uds_device.diag_service_db = handle
+        uds_device.diag_service_db_key = key
+        return variant
+
+    @keyword("Clear Variant Identification Cache")
+    def clear_variant_identification_cache(self):
+        """
+Remove all identified ECU variants from the identification cache.
+        """
+        self.variant_identifier.clear()
+
+    @keyword("Load PDX Database")
+    def load_pdx_database(self, pdx_entries, processes=None, use_cache=True, variant_scoped=False, low_memory=False):
+        """
+Load the PDX files of several ECUs in parallel worker processes into one diagnostic database.
+
+Every ECU is given by its PDX file, variant and logical address. Each PDX file and variant is
+parsed once, even if it is used by several ECUs. Devices created by ``Create UDS Connector``
+with the logical address of an entry are bound to it automatically, existing devices are bound
+when the database is loaded. ``Bind PDX Database Entry`` binds a device explicitly, e.g. a CAN device.
+
+**Arguments:**
+
+* ``pdx_entries``
+
+  / *Condition*: required / *Type*: list /
+
+  The ECUs, each as dictionary with ``pdx_file``, ``variant`` and ``logical_address`` or as list
+  ``[pdx_file, variant, logical_address]``.
+
+* ``processes``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The number of worker processes, by default one per CPU. With ``0`` or ``1``, or if there is
+  only one PDX file to parse, the PDX files are parsed in the Robot process.
+
+* ``use_cache``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  See ``Load PDX``.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  See ``Load PDX``.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  See ``Load PDX``.
+        """
+        pdx_cache = self.pdx_cache if use_cache else None
+        self.diag_database.load(pdx_entries, processes, pdx_cache, variant_scoped, low_memory)
+
+        for uds_device in self.uds_manager.uds_device.values():
+            if uds_device.logical_address is not None and self.diag_database.get_entry(uds_device.logical_address) is not None:
+                self.__bind_database_entry(uds_device, uds_device.logical_address)
+
+    @keyword("Bind PDX Database Entry")
+    def bind_pdx_database_entry(self, logical_address, device_name="default"):
+        """
+Bind a device to the diagnostic services of an ECU in the PDX database.
+
+**Arguments:**
+
+* ``logical_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The logical address of the ECU entry.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+        """
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
+        if isinstance(logical_address, str):
+            logical_address = int(logical_address)
+        self.__bind_database_entry(self.uds_manager.uds_device[device_name], logical_address)
 
     @keyword("Create UDS Config")
     def create_config(self,
@@ -396,7 +1162,10 @@ This method sets the UDS config.
   Returns the new UDS configuration created by `create_configure` or the default config if none is provided.
         '''
         uds_device = self.__device_check(device_name)
-        uds_device.client.set_configs(config)
+        new_config = dict(uds_device.client.config)
+        new_config.update(config)
+        uds_device.config = self.__copy_config(new_config)
+        uds_device.client.set_configs(uds_device.config)
 
     @keyword("Open uds connection")
     def connect(self, device_name="default"):
@@ -420,9 +1189,253 @@ Closes a UDS connection.
 * No specific arguments for this method.
         '''
         uds_device = self.__device_check(device_name)
+        uds_device.stop_tester_present()
         uds_device.uds_connector.close()
 
+    @keyword("Remove UDS Connector")
+    def remove_uds_connector(self, device_name="default"):
+        '''
+Closes the UDS connection of a device and removes the device. Its diagnostic database is released,
+it is freed when no other device uses it.
+
+**Arguments:**
+
+* No specific arguments for this method.
+        '''
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists.")
+        uds_device = self.uds_manager.uds_device.pop(device_name)
+        uds_device.stop_tester_present()
+        if uds_device.available:
+            uds_device.uds_connector.close()
+        if uds_device.connector is not None:
+            uds_device.connector.close()
+        uds_device.release_diag_service_db()
+
+    @keyword("Start DoIP Simulator")
+    def start_doip_simulator(self, pdx_file, variant, ecu_logical_address, simulator_name="default", host="127.0.0.1", port=0,
+                             vin="SIMULATED00000000", max_block_length=DoIPSimulator.DEFAULT_MAX_BLOCK_LENGTH,
+                             use_cache=True, variant_scoped=False, low_memory=False):
+        """
+Starts a local DoIP entity which simulates an ECU with the diagnostic services of a PDX variant.
+
+The simulator answers vehicle identification and routing activation, and every request with the
+positive response of its PDX service. Requests which match no service are answered with
+subFunctionNotSupported or requestOutOfRange, or serviceNotSupported if the PDX has no service
+of this service id. The block
+transfer services are emulated with a memory. A device connects to it with ``Create UDS Connector``
+with ``ecu_ip_address`` set to ``host`` and ``tcp_port`` set to the returned port.
+
+**Arguments:**
+
+* ``pdx_file``
+
+  / *Condition*: required / *Type*: str /
+
+  PDX file path.
+
+* ``variant``
+
+  / *Condition*: required / *Type*: str /
+
+  The variant name.
+
+* ``ecu_logical_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The logical address of the simulated ECU.
+
+* ``simulator_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the simulator.
+
+* ``host``
+
+  / *Condition*: optional / *Type*: str / *Default*: "127.0.0.1" /
+
+  The IP address to listen on.
+
+* ``port``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0 /
+
+  The TCP port to listen on, by default a free port. The vehicle identification is answered on the UDP port of the same number if it is free.
+
+* ``vin``
+
+  / *Condition*: optional / *Type*: str / *Default*: "SIMULATED00000000" /
+
+  The VIN of the vehicle identification response.
+
+* ``max_block_length``
+
+  / *Condition*: optional / *Type*: int / *Default*: 4095 /
+
+  The maxNumberOfBlockLength of the RequestDownload and RequestUpload responses.
+
+* ``use_cache``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If True, the PDX is loaded from the PDX cache if possible.
+
+* ``variant_scoped``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, only the diag layers the variant inherits from are loaded.
+
+* ``low_memory``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, everything except the variant and its parent layers is released after loading.
+
+**Returns:**
+
+* ``port``
+
+  / *Type*: int /
+
+  The TCP port of the simulator.
+        """
+        if simulator_name in self.simulators:
+            raise ValueError(f"Simulator with name '{simulator_name}' is already running. Please use keyword \"Stop DoIP Simulator\" to stop it.")
+        pdx_cache = self.pdx_cache if use_cache else None
+        # A database which fails to load is removed from the registry, so it is not released
+        handle, key = UDSKeywords.pdx_registry.acquire(pdx_file, variant, pdx_cache, variant_scoped, low_memory)
+        diag_service_db = handle.result()
+        try:
+            simulator = DoIPSimulator(diag_service_db, self.__to_int(ecu_logical_address), host, self.__to_int(port),
+                                      vin, max_block_length=self.__to_int(max_block_length))
+            port = simulator.start()
+        except Exception:
+            UDSKeywords.pdx_registry.release(key)
+            raise
+        self.simulators[simulator_name] = (simulator, key)
+        logger.info(f"Simulate {variant} of {pdx_file} as ECU 0x{simulator.ecu_logical_address:X} on {host}:{port}")
+        return port
+
+    @keyword("Configure Simulated Service")
+    def configure_simulated_service(self, service=None, nrc=None, delay=0.0, response_pending=False, parameters=None,
+                                    disconnect=False, after=0, count=None, simulator_name="default"):
+        """
+Configures how a simulated ECU answers a service.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: optional / *Type*: str or int / *Default*: None /
+
+  The name of a PDX service, a service id for all services of this id, or None for all requests.
+
+* ``nrc``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The negative response code to answer with, instead of the positive response.
+
+* ``delay``
+
+  / *Condition*: optional / *Type*: float / *Default*: 0.0 /
+
+  The processing time in seconds before the response is sent.
+
+* ``response_pending``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, a responsePending negative response is sent before the delay.
+
+* ``parameters``
+
+  / *Condition*: optional / *Type*: dict / *Default*: None /
+
+  Physical values of parameters of the positive response, only for a service given by name.
+
+* ``disconnect``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, the simulator closes the connection instead of answering, like a connection loss.
+
+* ``after``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0 /
+
+  The number of matching requests which are answered normally before the behaviour applies.
+
+* ``count``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The number of matching requests the behaviour applies to, by default all until it is reset.
+
+* ``simulator_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the simulator.
+        """
+        simulator = self.__simulator_check(simulator_name)
+        simulator.configure_service(service, self.__to_int(nrc) if nrc is not None else None, delay, response_pending, parameters,
+                                    disconnect, self.__to_int(after),
+                                    self.__to_int(count) if count is not None else None)
+
+    @keyword("Reset Simulated Services")
+    def reset_simulated_services(self, simulator_name="default"):
+        """
+Removes the configured behaviour of all services of a simulated ECU.
+
+**Arguments:**
+
+* ``simulator_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the simulator.
+        """
+        self.__simulator_check(simulator_name).reset_services()
+
+    @keyword("Stop DoIP Simulator")
+    def stop_doip_simulator(self, simulator_name="default"):
+        """
+Stops a simulated ECU and closes its connections. Its diagnostic database is released, it is freed
+when no device or simulator uses it.
+
+**Arguments:**
+
+* ``simulator_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the simulator.
+
+**Returns:**
+
+* ``request_count``
+
+  / *Type*: int /
+
+  The number of diagnostic requests the simulator has answered.
+        """
+        self.__simulator_check(simulator_name)
+        simulator, key = self.simulators.pop(simulator_name)
+        simulator.stop()
+        UDSKeywords.pdx_registry.release(key)
+        return simulator.request_count
+
+    def __simulator_check(self, simulator_name):
+        if simulator_name not in self.simulators:
+            raise ValueError(f"Simulator with name '{simulator_name}' does not exists. Please use keyword \"Start DoIP Simulator\" to start a new one.")
+        return self.simulators[simulator_name][0]
+
     @keyword("Access Timing Parameter")
+    @measure_keyword
     def access_timing_parameter(self, access_type: int, timing_param_record: Optional[bytes] = None, device_name="default"):
         """
 Sends a generic request for AccessTimingParameter service.
@@ -459,6 +1472,7 @@ Sends a generic request for AccessTimingParameter service.
         return response
 
     @keyword("Clear Dianostic Information")
+    @measure_keyword
     def clear_dianostic_infomation(self, group: int = 0xFFFFFF, memory_selection: Optional[int] = None, device_name="default"):
         """
 Requests the server to clear its active Diagnostic Trouble Codes.
@@ -493,6 +1507,7 @@ Requests the server to clear its active Diagnostic Trouble Codes.
         return response
 
     @keyword("Communication Control")
+    @measure_keyword
     def communication_control(self, control_type: int, communication_type: Union[int, bytes, CommunicationType], node_id: Optional[int] = None, device_name="default"):
         """
 Switches the transmission or reception of certain messages on/off with CommunicationControl service.
@@ -537,6 +1552,7 @@ Switches the transmission or reception of certain messages on/off with Communica
         return response
 
     @keyword("Control DTC Setting")
+    @measure_keyword
     def control_dtc_setting(self, setting_type: int, data: Optional[bytes] = None, device_name="default"):
         """
 Controls some settings related to the Diagnostic Trouble Codes by sending a ControlDTCSetting service request.
@@ -574,6 +1590,7 @@ It can enable/disable some DTCs or perform some ECU-specific configuration.
         return response
 
     @keyword("Diagnostic Session Control")
+    @measure_keyword
     def diagnostic_session_control(self, session_type, device_name="default"):
         """
 Requests the server to change the diagnostic session with a DiagnosticSessionControl service request.
@@ -606,6 +1623,7 @@ Requests the server to change the diagnostic session with a DiagnosticSessionCon
         return response
 
     @keyword("Dynamically Define Data Identifier")
+    @measure_keyword
     def dynamically_define_did(self, did: int, did_definition: Union[DynamicDidDefinition, MemoryLocation], device_name="default"):
         """
 Defines a dynamically defined DID.
@@ -637,6 +1655,7 @@ Defines a dynamically defined DID.
         return response
 
     @keyword("ECU Reset")
+    @measure_keyword
     def ecu_reset(self, reset_type: int, device_name="default"):
         """
 Requests the server to execute a reset sequence through the ECUReset service.
@@ -675,6 +1694,7 @@ Requests the server to execute a reset sequence through the ECUReset service.
         return response
 
     @keyword("Input Output Control By Identifier")
+    @measure_keyword
     def io_control(self,
                    did: int,
                    control_param: Optional[int] = None,
@@ -737,6 +1757,7 @@ Substitutes the value of an input signal or overrides the state of an output by
         return response
 
     @keyword("Link Control")
+    @measure_keyword
     def link_control(self, control_type: int, baudrate: Optional[Baudrate] = None, device_name="default"):
         """
 Controls the communication baudrate by sending a LinkControl service request.
@@ -772,6 +1793,7 @@ Controls the communication baudrate by sending a LinkControl service request.
         return response
 
     @keyword("Read Data By Identifier")
+    @measure_keyword
     def read_data_by_identifier(self, data_id_list: Union[int, List[int]], device_name="default"):
         """
 Requests a value associated with a data identifier (DID) through the ReadDataByIdentifier service.
@@ -793,14 +1815,8 @@ Requests a value associated with a data identifier (DID) through the ReadDataByI
   The response from the ReadDataByIdentifier service request.
         """
         uds_device = self.__device_check(device_name)
-        SID_RQ = 34 # The request id of read data by identifier
-
-        # Get the did_codec from pdx file
-        did_codec = uds_device.diag_service_db.get_did_codec(SID_RQ)
-
-        # Set it to uds config
-        uds_device.config['data_identifiers'].update(did_codec)
-        self.set_config(uds_device.config, device_name)
+        # Attach the did_codec from pdx file to uds config
+        self.__attach_did_codec(uds_device)
 
         response = uds_device.client.read_data_by_identifier(data_id_list)
         for i in range(0, len(data_id_list)):
@@ -808,6 +1824,7 @@ Requests a value associated with a data identifier (DID) through the ReadDataByI
         return response.service_data.values
 
     @keyword("Read DTC Information")
+    @measure_keyword
     def read_dtc_information(self,
                              subfunction: int,
                              status_mask: Optional[int] = None,
@@ -884,6 +1901,7 @@ Performs a ReadDiagnosticInformation service request.
         return response
 
     @keyword("Read Memory By Address")
+    @measure_keyword
     def read_memory_by_address(self, memory_location: MemoryLocation, device_name="default"):
         """
 Reads a block of memory from the server by sending a ReadMemoryByAddress service request.
@@ -909,6 +1927,7 @@ Reads a block of memory from the server by sending a ReadMemoryByAddress service
         return response
 
     @keyword("Request Download")
+    @measure_keyword
     def request_download(self, memory_location: MemoryLocation, dfi: Optional[DataFormatIdentifier] = None, device_name="default"):
         """
 Informs the server that the client wants to initiate a download from the client to the server by sending a RequestDownload service request.
@@ -925,46 +1944,394 @@ Informs the server that the client wants to initiate a download from the client
 
   / *Condition*: optional / *Type*: DataFormatIdentifier<DataFormatIdentifier> /
 
-  Optional defining the compression and encryption scheme of the data. If not specified, the default value of 00 will be used, specifying no encryption and no compression.
+  Optional defining the compression and encryption scheme of the data. If not specified, the default value of 00 will be used, specifying no encryption and no compression.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: Response /
+
+  The response from the RequestDownload service request.
+        """
+        uds_device = self.__device_check(device_name)
+        response = uds_device.client.request_download(memory_location, dfi)
+        return response
+    
+    @keyword("Request Transfer Exit")
+    @measure_keyword
+    def request_transfer_exit(self, data: Optional[bytes] = None, device_name="default"):
+        """
+Informs the server that the client wants to stop the data transfer by sending a RequestTransferExit service request.
+
+**Arguments:**
+
+* ``data``
+
+  / *Condition*: optional / *Type*: bytes /
+
+  Optional additional data to send to the server.
+
+**Returns:**
+
+* ``response``
+
+  / *Type*: Response /
+
+  The response from the RequestTransferExit service request.
+        """
+        uds_device = self.__device_check(device_name)
+        response = uds_device.client.request_transfer_exit(data)
+        return response
+
+    @staticmethod
+    def __to_int(value):
+        # Addresses and sizes from Robot files may be given as strings, e.g. "0x8000"
+        return int(value, 0) if isinstance(value, str) else int(value)
+
+    def __reconnect_device(self, uds_device, session=None, security_level=None):
+        """
+Re-establish the DoIP connection of a device with routing activation, then restore the
+diagnostic session and security level.
+        """
+        uds_device.connector.reconnect()
+        if session is not None:
+            uds_device.client.change_session(self.__to_int(session))
+        if security_level is not None:
+            uds_device.client.unlock_security_access(self.__to_int(security_level))
+
+    def __run_transfer(self, uds_device, memory_location, request_transfer, run_transfer, resumable,
+                       max_reconnects, session, security_level):
+        """
+Request a transfer and run it. After a connection loss, or when the ECU has lost the transfer
+because the DoIPClient reconnected by itself, the device is reconnected and the transfer
+is continued from its checkpoint with a new request for the remaining memory. If the ECU rejects
+this request or the transfer is not ``resumable``, it is restarted from the beginning.
+        """
+        checkpoint = TransferCheckpoint()
+        reconnects = 0
+        while True:
+            try:
+                if checkpoint.offset:
+                    remaining = MemoryLocation(memory_location.address + checkpoint.offset,
+                                               memory_location.memorysize - checkpoint.offset,
+                                               memory_location.address_format, memory_location.memorysize_format)
+                    try:
+                        response = request_transfer(remaining)
+                        logger.info(f"Resume transfer at block {checkpoint.block_index}, offset {checkpoint.offset} (0x{remaining.address:X})")
+                    except NegativeResponseException as e:
+                        logger.warn(f"ECU does not allow to resume the transfer at 0x{remaining.address:X}, restart it. Reason: {e}")
+                        checkpoint.restart()
+                        response = request_transfer(memory_location)
+                else:
+                    response = request_transfer(memory_location)
+                statistics = run_transfer(DataTransfer.get_block_length(response.service_data.max_length), checkpoint)
+                statistics.reconnects = reconnects
+                return statistics
+            except Exception as e:
+                # Only a DoIPClient can be reconnected, other connections fail with the original error
+                if not DataTransfer.is_interrupted(e) or reconnects >= max_reconnects or not isinstance(uds_device.connector, DoIPClient):
+                    raise
+                reconnects += 1
+                logger.warn(f"Connection lost after block {checkpoint.block_index} ({checkpoint.offset} bytes), "
+                            f"reconnect ({reconnects}/{max_reconnects}). Reason: {e}")
+                self.__reconnect_device(uds_device, session, security_level)
+                if resumable:
+                    checkpoint.resume()
+                else:
+                    checkpoint.restart()
+
+    @keyword("Download Binary")
+    @measure_keyword
+    def download_binary(self, file_path, memory_address, memory_size=None, address_format=32, memorysize_format=32,
+                        dfi: Optional[DataFormatIdentifier] = None, max_retries=3, compress=True, max_reconnects=0,
+                        session=None, security_level=None, device_name="default"):
+        """
+Downloads a binary file to the ECU with RequestDownload, TransferData and RequestTransferExit.
+
+The file is memory-mapped and sent in blocks of the maxNumberOfBlockLength of the RequestDownload
+response. The block sequence counter wraps from 0xFF to 0x00. A block which times out or is answered
+with busyRepeatRequest is sent again, up to ``max_retries`` times.
+
+If the compressionMethod of ``dfi`` is set, the file is compressed with this method while it is
+sent, see ``Compression.CompressionMethods`` for the registered methods (``0x1``: zlib).
+
+If the connection or the transfer state of the ECU is lost, a DoIP device is reconnected with routing
+activation up to ``max_reconnects`` times. The ``session`` and ``security_level`` are restored, then
+the transfer is resumed after the last acknowledged block with a new request for the remaining memory.
+If the ECU rejects this request, the transfer is restarted from the beginning. Compressed transfers
+are always restarted.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path of the binary file.
+
+* ``memory_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The start address of the memory to write.
+
+* ``memory_size``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The size of the memory to write, by default the size of the file.
+
+* ``address_format``
+
+  / *Condition*: optional / *Type*: int / *Default*: 32 /
+
+  The number of bits of the address (8, 16, 24, 32, 40).
+
+* ``memorysize_format``
+
+  / *Condition*: optional / *Type*: int / *Default*: 32 /
+
+  The number of bits of the size (8, 16, 24, 32).
+
+* ``dfi``
+
+  / *Condition*: optional / *Type*: DataFormatIdentifier<DataFormatIdentifier> / *Default*: None /
+
+  The compression and encryption scheme of the data.
+
+* ``max_retries``
+
+  / *Condition*: optional / *Type*: int / *Default*: 3 /
+
+  The maximum number of retries per block.
+
+* ``compress``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If False, the file is sent as it is also if ``dfi`` selects a compression method, e.g. because it is compressed already.
+
+* ``max_reconnects``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0 /
+
+  The maximum number of reconnects after a connection loss, only DoIP devices are reconnected.
+
+* ``session``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The diagnostic session to restore after a reconnect, e.g. 2 for programmingSession.
+
+* ``security_level``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The security level to unlock after a reconnect, with the ``security_algo`` of the config.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  The ``bytes`` of the file, the ``transferred_bytes`` in ``blocks`` within ``elapsed`` seconds,
+  the effective ``throughput`` of the file in bytes/s, the ``latency_min``, ``latency_mean``,
+  ``latency_p95`` and ``latency_max`` of the blocks in seconds, the number of ``retries``, the
+  ``block_retries`` by block index and the number of ``reconnects``.
+        """
+        uds_device = self.__device_check(device_name)
+        compression_method = dfi.compression if dfi is not None and compress else 0
+        compressor_factory = CompressionMethods.get(compression_method)[0] if compression_method else None
+        f, data = DataTransfer.map_file(file_path)
+        try:
+            memory_size = self.__to_int(memory_size) if memory_size is not None else len(data)
+            memory_location = MemoryLocation(self.__to_int(memory_address), memory_size,
+                                             self.__to_int(address_format), self.__to_int(memorysize_format))
+            data_length = len(data)
+            data_view = memoryview(data)
+            data_transfer = DataTransfer(uds_device.client, max_retries)
+
+            def request_download(location):
+                return uds_device.client.request_download(location, dfi)
+
+            def download(block_length, checkpoint):
+                logger.info(f"Download {file_path} ({data_length} bytes) to 0x{memory_location.address:X} in blocks of {block_length} bytes")
+                if compressor_factory is None:
+                    return data_transfer.download(data_view, block_length, checkpoint)
+                reader = CompressingReader(data_view, compressor_factory()).start()
+                try:
+                    return data_transfer.download_stream(reader, block_length, checkpoint)
+                finally:
+                    reader.close()
+
+            try:
+                statistics = self.__run_transfer(uds_device, memory_location, request_download, download,
+                                                 compressor_factory is None, self.__to_int(max_reconnects), session, security_level)
+            finally:
+                data_view.release()
+            uds_device.client.request_transfer_exit()
+        finally:
+            data.close()
+            f.close()
+
+        report = statistics.get_report(data_length)
+        if compressor_factory is not None:
+            logger.info(f"Compressed {report['bytes']} bytes to {report['transferred_bytes']} bytes with method 0x{compression_method:X}")
+        logger.info(TransferStatistics.format_report(report, "Downloaded"))
+        return report
+
+    @keyword("Upload To File")
+    @measure_keyword
+    def upload_to_file(self, file_path, memory_address, memory_size, address_format=32, memorysize_format=32,
+                       dfi: Optional[DataFormatIdentifier] = None, max_retries=3, max_reconnects=0,
+                       session=None, security_level=None, device_name="default"):
+        """
+Uploads a memory area of the ECU to a file with RequestUpload, TransferData and RequestTransferExit.
+
+The file is created with the size of the memory area and memory-mapped, every block is written
+directly to its position in the file, so the memory use does not depend on the size of the area.
+The block sequence counter of every response is verified, it wraps from 0xFF to 0x00. A block which
+times out or is answered with busyRepeatRequest is requested again, up to ``max_retries`` times.
+
+If the compressionMethod of ``dfi`` is set, the received data is decompressed with this method while
+it is received, see ``Compression.CompressionMethods`` for the registered methods (``0x1``: zlib).
+
+If the connection or the transfer state of the ECU is lost, a DoIP device is reconnected with routing
+activation up to ``max_reconnects`` times. The ``session`` and ``security_level`` are restored, then
+the transfer is resumed after the last acknowledged block with a new request for the remaining memory.
+If the ECU rejects this request, the transfer is restarted from the beginning. Compressed transfers
+are always restarted.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  Path of the output file, an existing file is replaced.
+
+* ``memory_address``
+
+  / *Condition*: required / *Type*: int /
+
+  The start address of the memory to read.
+
+* ``memory_size``
+
+  / *Condition*: required / *Type*: int /
+
+  The size of the memory to read.
+
+* ``address_format``
+
+  / *Condition*: optional / *Type*: int / *Default*: 32 /
+
+  The number of bits of the address (8, 16, 24, 32, 40).
+
+* ``memorysize_format``
+
+  / *Condition*: optional / *Type*: int / *Default*: 32 /
+
+  The number of bits of the size (8, 16, 24, 32).
+
+* ``dfi``
+
+  / *Condition*: optional / *Type*: DataFormatIdentifier<DataFormatIdentifier> / *Default*: None /
+
+  The compression and encryption scheme of the data.
+
+* ``max_retries``
+
+  / *Condition*: optional / *Type*: int / *Default*: 3 /
+
+  The maximum number of retries per block.
+
+* ``max_reconnects``
+
+  / *Condition*: optional / *Type*: int / *Default*: 0 /
+
+  The maximum number of reconnects after a connection loss, only DoIP devices are reconnected.
+
+* ``session``
 
-**Returns:**
+  / *Condition*: optional / *Type*: int / *Default*: None /
 
-* ``response``
+  The diagnostic session to restore after a reconnect, e.g. 2 for programmingSession.
 
-  / *Type*: Response /
+* ``security_level``
 
-  The response from the RequestDownload service request.
-        """
-        uds_device = self.__device_check(device_name)
-        response = uds_device.client.request_download(memory_location, dfi)
-        return response
-    
-    @keyword("Request Transfer Exit")
-    def request_transfer_exit(self, data: Optional[bytes] = None, device_name="default"):
-        """
-Informs the server that the client wants to stop the data transfer by sending a RequestTransferExit service request.
+  / *Condition*: optional / *Type*: int / *Default*: None /
 
-**Arguments:**
+  The security level to unlock after a reconnect, with the ``security_algo`` of the config.
 
-* ``data``
+* ``device_name``
 
-  / *Condition*: optional / *Type*: bytes /
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
 
-  Optional additional data to send to the server.
+  Name of the device.
 
 **Returns:**
 
-* ``response``
+* ``report``
 
-  / *Type*: Response /
+  / *Type*: dict /
 
-  The response from the RequestTransferExit service request.
+  The ``bytes`` of the memory area, the ``transferred_bytes`` in ``blocks`` within ``elapsed`` seconds,
+  the effective ``throughput`` of the memory area in bytes/s, the ``latency_min``, ``latency_mean``,
+  ``latency_p95`` and ``latency_max`` of the blocks in seconds, the number of ``retries``, the
+  ``block_retries`` by block index and the number of ``reconnects``.
         """
         uds_device = self.__device_check(device_name)
-        response = uds_device.client.request_transfer_exit(data)
-        return response
+        compression_method = dfi.compression if dfi is not None else 0
+        decompressor_factory = CompressionMethods.get(compression_method)[1] if compression_method else None
+        memory_location = MemoryLocation(self.__to_int(memory_address), self.__to_int(memory_size),
+                                         self.__to_int(address_format), self.__to_int(memorysize_format))
+        f, output = DataTransfer.create_output_file(file_path, memory_location.memorysize)
+        try:
+            output_view = memoryview(output)
+            data_transfer = DataTransfer(uds_device.client, max_retries)
+
+            def request_upload(location):
+                return uds_device.client.request_upload(location, dfi)
+
+            def upload(block_length, checkpoint):
+                logger.info(f"Upload {memory_location.memorysize} bytes from 0x{memory_location.address:X} to {file_path} in blocks of up to {block_length} bytes")
+                if decompressor_factory is None:
+                    return data_transfer.upload(output_view, block_length, checkpoint)
+                writer = DecompressingWriter(output_view, decompressor_factory()).start()
+                try:
+                    statistics = data_transfer.upload_stream(writer, block_length, checkpoint)
+                except Exception:
+                    writer.abort()
+                    raise
+                writer.finish()
+                return statistics
+
+            try:
+                statistics = self.__run_transfer(uds_device, memory_location, request_upload, upload,
+                                                 decompressor_factory is None, self.__to_int(max_reconnects), session, security_level)
+            finally:
+                output_view.release()
+            output.flush()
+        finally:
+            output.close()
+            f.close()
+        uds_device.client.request_transfer_exit()
+
+        report = statistics.get_report(memory_location.memorysize)
+        logger.info(TransferStatistics.format_report(report, "Uploaded"))
+        return report
 
     @keyword("Request Upload")
+    @measure_keyword
     def request_upload(self, memory_location: MemoryLocation, dfi: Optional[DataFormatIdentifier] = None, device_name="default"):
         """
 Informs the server that the client wants to initiate an upload from the server to the client by sending a RequestUpload service request.
@@ -996,6 +2363,7 @@ Informs the server that the client wants to initiate an upload from the server t
         return response
 
     @keyword("Routine Control")
+    @measure_keyword
     def routine_control(self, routine_id: int, control_type: int, data: Optional[bytes] = None, device_name="default"):
         """
 Sends a generic request for the RoutineControl service.
@@ -1072,6 +2440,7 @@ The key computation is done by calling config['security_algo'].
         return response
 
     @keyword("Tester Present")
+    @measure_keyword
     def tester_present(self, device_name="default"):
         """
 Sends a TesterPresent request to keep the session active.
@@ -1096,7 +2465,116 @@ Sends a TesterPresent request to keep the session active.
             BuiltIn().fail(f"Fail to send a TesterPresent request. Reason: {e}")
         return response
 
+    @keyword("Start Tester Present")
+    def start_tester_present(self, interval=2.0, suppress_positive_response=True, tolerance=None, device_name="default"):
+        """
+Start sending TesterPresent in background to keep the active diagnostic session of the device alive.
+
+A TesterPresent is sent when no other request has been sent for ``interval`` seconds. Requests of
+the test flow are never delayed, if one is in progress when a TesterPresent is due, the TesterPresent
+is skipped. A running scheduler of the device is restarted with the new settings.
+
+**Arguments:**
+
+* ``interval``
+
+  / *Condition*: optional / *Type*: float / *Default*: 2.0 /
+
+  The interval in seconds, it has to be less than the S3 timeout of the ECU (usually 5 seconds).
+
+* ``suppress_positive_response``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If True, the suppressPosRspMsgIndicationBit is set and no response is waited for.
+
+* ``tolerance``
+
+  / *Condition*: optional / *Type*: float / *Default*: None /
+
+  The lateness in seconds after which a TesterPresent counts as missed deadline, by default a tenth of the interval.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+        """
+        uds_device = self.__device_check(device_name)
+        uds_device.stop_tester_present()
+        uds_device.tester_present_scheduler = TesterPresentScheduler(uds_device.client, interval, suppress_positive_response, tolerance)
+        uds_device.tester_present_scheduler.start()
+        logger.info(f"Started TesterPresent of {device_name} every {uds_device.tester_present_scheduler.interval} s")
+
+    @keyword("Stop Tester Present")
+    def stop_tester_present(self, device_name="default"):
+        """
+Stop sending TesterPresent in background.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  The final report of the scheduler, see ``Get Tester Present Report``.
+        """
+        uds_device = self.__device_check(device_name)
+        if uds_device.tester_present_scheduler is None:
+            raise ValueError(f"TesterPresent of device '{device_name}' has not been started. Please use keyword \"Start Tester Present\" to start it.")
+        uds_device.stop_tester_present()
+        report = uds_device.tester_present_scheduler.get_report()
+        logger.info(f"Stopped TesterPresent of {device_name}: {report['sent']} sent, {report['skipped']} skipped, "
+                    f"{report['missed_deadlines']} missed deadline(s)")
+        return report
+
+    @keyword("Get Tester Present Report")
+    def get_tester_present_report(self, device_name="default", reset=False):
+        """
+Get the statistics of the background TesterPresent of a device.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+* ``reset``
+
+  / *Condition*: optional / *Type*: bool / *Default*: False /
+
+  If True, the statistics are reset after they are read.
+
+**Returns:**
+
+* ``report``
+
+  / *Type*: dict /
+
+  ``running``, ``interval`` and ``tolerance``, the number of ``sent`` TesterPresent requests, of ``skipped``
+  ones because a request was in progress and of ``errors``, the number of ``missed_deadlines``, and
+  ``jitter_min``, ``jitter_max`` and ``jitter_mean``, the lateness of the sent requests in seconds.
+        """
+        uds_device = self.__device_check(device_name)
+        if uds_device.tester_present_scheduler is None:
+            raise ValueError(f"TesterPresent of device '{device_name}' has not been started. Please use keyword \"Start Tester Present\" to start it.")
+        report = uds_device.tester_present_scheduler.get_report()
+        if reset:
+            uds_device.tester_present_scheduler.reset_report()
+        return report
+
     @keyword("Transfer Data")
+    @measure_keyword
     def transfer_data(self, sequence_number: int, data: Optional[bytes] = None, device_name="default"):
         """
 Transfers a block of data to/from the client to/from the server by sending a TransferData service request and returning the server response.
@@ -1128,6 +2606,7 @@ Transfers a block of data to/from the client to/from the server by sending a Tra
         return response
     
     @keyword("Write Data By Identifier")
+    @measure_keyword
     def write_data_by_identifier(self, did: int, value: Any, device_name="default"):
         """
 Requests to write a value associated with a data identifier (DID) through the WriteDataByIdentifier service.
@@ -1156,20 +2635,15 @@ Requests to write a value associated with a data identifier (DID) through the Wr
         """
         logger.info(f"Service DID: {did}")
         uds_device = self.__device_check(device_name)
-        SID_RQ = 46 # The request id of write data by identifier
-
-        # Get the did_codec from pdx file
-        did_codec = uds_device.diag_service_db.get_did_codec(SID_RQ)
-
-        # Set it to uds config
-        uds_device.config['data_identifiers'].update(did_codec)
-        self.set_config(uds_device.config, device_name)
+        # Attach the did_codec from pdx file to uds config
+        self.__attach_did_codec(uds_device)
 
         response = uds_device.client.write_data_by_identifier(did, value)
         logger.info(f"DID echo: {response.service_data.did_echo}")
         return response
 
     @keyword("Write Memory By Address")
+    @measure_keyword
     def write_memory_by_address(self, memory_location: MemoryLocation, data: bytes, device_name="default"):
         """
 Writes a block of memory in the server by sending a WriteMemoryByAddress service request.
@@ -1201,6 +2675,7 @@ Writes a block of memory in the server by sending a WriteMemoryByAddress service
         return response
 
     @keyword("Request File Transfer")
+    @measure_keyword
     def request_file_transfer(self, 
                               moop: int,
                               path: str = '',
@@ -1264,6 +2739,7 @@ Sends a RequestFileTransfer request
         return response
 
     @keyword("Authentication")
+    @measure_keyword
     def authentication(self,
                        authentication_task: int,
                        communication_configuration: Optional[int] = None,
@@ -1371,6 +2847,7 @@ Sends an Authentication request introduced in 2020 version of ISO-14229-1.
         return response
 
     @keyword("Routine Control By Name")
+    @measure_keyword
     def routine_control_by_name(self, routine_name, data = None, device_name="default"):
         """
 Sends a request for the RoutineControl service by routine name.
@@ -1391,11 +2868,9 @@ Sends a request for the RoutineControl service by routine name.
         """
         response = None
         uds_device = self.__device_check(device_name)
-        diag_services = uds_device.diag_service_db.get_diag_service_by_name([routine_name])
-        control_type = diag_services[0].request.parameters[1].coded_value
+        routine_id, control_type = uds_device.diag_service_db.get_routine_by_name(routine_name)
         if control_type != 1 and control_type != 2:
             control_type = 3
-        routine_id = diag_services[0].request.parameters[2].coded_value
 
         if data is not None:
             # Encoded data to bytes
@@ -1414,6 +2889,7 @@ Sends a request for the RoutineControl service by routine name.
         return decode_message
 
     @keyword("Read Data By Name")
+    @measure_keyword
     def read_data_by_name(self, service_name_list = [], parameters = None, device_name="default"):
         """
 Get diagnostic service list by a list of service names.
@@ -1433,25 +2909,96 @@ Get diagnostic service list by a list of service names.
   The server's response containing the diagnostic service list.
         """
         uds_device = self.__device_check(device_name)
-        diag_service_list = []
         data_id_list = []
-
-        diag_service_list = uds_device.diag_service_db.get_diag_service_by_name(service_name_list)
         did_mapping = {}
-        for diag_service in diag_service_list:
-            data_id = diag_service.request.parameters[1].coded_value
+        for service_name in service_name_list:
+            data_id = uds_device.diag_service_db.get_did_by_name(service_name)
             data_id_list.append(data_id)
-            did_mapping[data_id] = diag_service.short_name
-        response = self.read_data_by_identifier(data_id_list, device_name)
+            did_mapping[data_id] = service_name
+
+        # The DIDs are read in batches within the limits of the ECU, a rejected batch is split and read again
+        did_codec = uds_device.diag_service_db.get_did_codec(0x22)
+        did_batcher = uds_device.did_batcher
+        pending_batches = did_batcher.split(data_id_list, did_codec)
+        response = {}
+        while pending_batches:
+            batch = pending_batches.pop(0)
+            try:
+                response.update(self.read_data_by_identifier(batch, device_name))
+            except NegativeResponseException as e:
+                if not did_batcher.learn(batch, e.response.code, did_codec):
+                    raise
+                logger.info(f"ECU rejected {len(batch)} DIDs per request with NRC 0x{e.response.code:02X}, "
+                            f"learned DID batch limits {did_batcher.get_limits()}")
+                pending_batches[0:0] = DIDBatcher.split_rejected(batch)
 
         # return service name as key instead of did
         updated_response = {}
-        for did, did_res in response.items():
-            updated_response[did_mapping[did]] = did_res
+        for did in data_id_list:
+            updated_response[did_mapping[did]] = response[did]
 
         return updated_response
 
+    @keyword("Set DID Batch Limits")
+    def set_did_batch_limits(self, max_dids=None, max_response_length=None, device_name="default"):
+        """
+Set the limits of the DIDs which ``Read Data By Name`` reads with one ReadDataByIdentifier request.
+
+The DIDs of ``Read Data By Name`` are split into several requests when a limit would be exceeded,
+the results are merged. When the ECU rejects a request with the negative response
+incorrectMessageLengthOrInvalidFormat (0x13) or responseTooLong (0x14), the limits are lowered
+and kept for the device. By default, only the response length of CAN devices is limited to 4095 bytes.
+
+**Arguments:**
+
+* ``max_dids``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The maximum number of DIDs per request, None for no limit.
+
+* ``max_response_length``
+
+  / *Condition*: optional / *Type*: int / *Default*: None /
+
+  The maximum length of a response in bytes, None for no limit.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+        """
+        uds_device = self.__device_check(device_name)
+        uds_device.did_batcher.set_limits(max_dids, max_response_length)
+
+    @keyword("Get DID Batch Limits")
+    def get_did_batch_limits(self, device_name="default"):
+        """
+Get the limits of the DIDs per ReadDataByIdentifier request of a device.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``limits``
+
+  / *Type*: dict /
+
+  ``max_dids`` and ``max_response_length`` (None if not limited), and ``learned``,
+  True if the limits were lowered by negative responses of the ECU.
+        """
+        uds_device = self.__device_check(device_name)
+        return uds_device.did_batcher.get_limits()
+
     @keyword("Get Encoded Request Message")
+    @measure_keyword
     def get_encoded_request_message(self, service_name, parameters_dict=None, device_name="default"):
         """
 Get diagnostic service encoded request (bytes value).
@@ -1475,6 +3022,7 @@ Get diagnostic service encoded request (bytes value).
         return encoded_message
 
     @keyword("Get Decoded Response Message")
+    @measure_keyword
     def get_decoded_positive_response_message(self, service_name, response_data, device_name="default"):
         """
 Get diagnostic service decoded positive response message.
@@ -1502,7 +3050,314 @@ Get diagnostic service decoded positive response message.
         logger.info(f"Decode message: {decode_message}")
         return decode_message
 
+    @keyword("Get Service Indexes")
+    def get_service_indexes(self, device_name="default"):
+        """
+Get the service lookup tables which are built when the PDX file is loaded.
+
+**Returns:**
+
+* ``service_indexes``
+
+  / *Type*: dict /
+
+  The service names per service id (``services_by_sid``), per service id and DID (``services_by_did``)
+  and per routine identifier and control type (``services_by_routine``).
+        """
+        uds_device = self.__device_check(device_name)
+        return uds_device.diag_service_db.get_service_indexes()
+
+    @keyword("Get PDX Memory Report")
+    def get_pdx_memory_report(self, device_name="default"):
+        """
+Get the memory before and after pruning of a PDX file loaded with ``low_memory``.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``memory_report``
+
+  / *Type*: dict /
+
+  The resident memory of the process before and after pruning (``process_before``, ``process_after``,
+  None if not available) and the size in bytes of the objects held by the database (``retained``),
+  or None if the PDX file was not loaded with ``low_memory``.
+        """
+        uds_device = self.__device_check(device_name)
+        return uds_device.diag_service_db.get_memory_report()
+
+    @keyword("Set PDX Compiled Codec Mode")
+    def set_pdx_compiled_codec_mode(self, mode="on", device_name="default"):
+        """
+Select how the requests and responses of the PDX file loaded by a device are encoded and decoded.
+
+Services whose parameters have a static layout are compiled into precomputed plans of byte
+offsets, bit masks and scalings. All other services are always handled by odxtools.
+
+The mode is a setting of the shared diagnostic database, so it changes the encoding and decoding
+of all devices and simulators which loaded the same PDX file and variant in the same mode.
+
+**Arguments:**
+
+* ``mode``
+
+  / *Condition*: optional / *Type*: str / *Default*: "on" /
+
+  ``off`` to always use odxtools, ``on`` to use the compiled plans, or ``verify`` to cross-check
+  every compiled result against odxtools (a mismatch is logged and the odxtools result is used).
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device whose diagnostic database is changed.
+        """
+        uds_device = self.__device_check(device_name)
+        diag_service_db = uds_device.diag_service_db
+        diag_service_db.set_compiled_codec_mode(mode)
+        logger.info(f"Compiled codec mode of PDX {diag_service_db.pdx_file} ({diag_service_db.variant}) set to {mode}")
+
+    @keyword("Set PDX Request Cache Size")
+    def set_pdx_request_cache_size(self, size, device_name="default"):
+        """
+Set the maximum number of encoded requests which are cached for the PDX file loaded by a device.
+
+Requests of the ``... By Name`` keywords are cached by their service name and parameters,
+so repeated requests with the same parameters skip the conversion and encoding.
+The least recently used requests are evicted first.
+
+The cache belongs to the shared diagnostic database, so it is used and sized for all devices
+and simulators which loaded the same PDX file and variant in the same mode.
+
+**Arguments:**
+
+* ``size``
+
+  / *Condition*: required / *Type*: int /
+
+  The maximum number of cached requests, ``0`` disables the cache.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device whose diagnostic database is changed.
+        """
+        uds_device = self.__device_check(device_name)
+        diag_service_db = uds_device.diag_service_db
+        diag_service_db.set_request_cache_size(size)
+        logger.info(f"Request cache size of PDX {diag_service_db.pdx_file} ({diag_service_db.variant}) set to {size}")
+
+    @keyword("Clear PDX Request Cache")
+    def clear_pdx_request_cache(self, device_name="default"):
+        """
+Remove all encoded requests from the request cache of the PDX file loaded by a device and reset
+its hit and miss counters. The cache is cleared for all devices and simulators sharing the database.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device whose diagnostic database is changed.
+        """
+        uds_device = self.__device_check(device_name)
+        uds_device.diag_service_db.clear_request_cache()
+
+    @keyword("Get PDX Request Cache Info")
+    def get_pdx_request_cache_info(self, device_name="default"):
+        """
+Get the state of the request cache of the PDX file loaded by a device, which is shared by all
+devices and simulators using the same diagnostic database.
+
+**Arguments:**
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``cache_info``
+
+  / *Type*: dict /
+
+  The number of ``entries``, the ``max_size`` and the ``hits`` and ``misses`` counters.
+        """
+        uds_device = self.__device_check(device_name)
+        return uds_device.diag_service_db.get_request_cache_info()
+
+    def __latency_statistics_check(self, device_name):
+        # The statistics of a device stay available while it is disconnected
+        if not self.uds_manager.is_device_exist(device_name):
+            raise ValueError(f"Device with name '{device_name}' does not exists. Please use keyword \"Create UDS Connector\" to create a new one.")
+        return self.uds_manager.uds_device[device_name].latency_statistics
+
+    @staticmethod
+    def __get_percentiles(percentiles):
+        if percentiles is None:
+            return LatencyStatistics.DEFAULT_PERCENTILES
+        if isinstance(percentiles, str):
+            percentiles = [percentile for percentile in percentiles.split(",") if percentile.strip()]
+        percentiles = [float(percentile) for percentile in percentiles]
+        for percentile in percentiles:
+            if not 0 < percentile <= 100:
+                raise ValueError(f"Percentile must be in range 0 to 100, got {percentile}")
+        return percentiles
+
+    @keyword("Set Latency Instrumentation")
+    def set_latency_instrumentation(self, enabled: bool = True, device_name="default"):
+        """
+Enable or disable the latency histograms of a device. They are enabled by default.
+
+**Arguments:**
+
+* ``enabled``
+
+  / *Condition*: optional / *Type*: bool / *Default*: True /
+
+  If False, keywords and requests of the device are not measured. The recorded histograms are kept.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+        """
+        latency_statistics = self.__latency_statistics_check(device_name)
+        latency_statistics.enabled = enabled
+        logger.info(f"Latency instrumentation of {device_name} {'enabled' if latency_statistics.enabled else 'disabled'}")
+
+    @keyword("Reset Latency Statistics")
+    def reset_latency_statistics(self, service=None, device_name="default"):
+        """
+Remove the recorded latency histograms of a device.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: optional / *Type*: str / *Default*: None /
+
+  Only remove the histograms of this service, e.g. ``Read Data By Name`` or a PDX service name.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+        """
+        self.__latency_statistics_check(device_name).reset(service)
+
+    @keyword("Get Latency Statistics")
+    def get_latency_statistics(self, service=None, phase=None, percentiles=None, device_name="default"):
+        """
+Get the latency histograms of a device as percentiles per service and phase.
+
+Every keyword which communicates with the device is measured under its keyword name in the phases
+``keyword``, ``overhead`` (time not spent in one of the other phases), ``send`` (with DoIP until the
+diagnostic message is acknowledged), ``response``
+(until the final response, including responsePending waits) and ``response_pending``.
+Encoding and decoding with the PDX are measured under the PDX service name in the phases ``encode``
+and ``decode``. Requests outside of keywords, like the background TesterPresent, are measured
+under their UDS service name.
+
+**Arguments:**
+
+* ``service``
+
+  / *Condition*: optional / *Type*: str / *Default*: None /
+
+  Only get the histograms of this keyword or service.
+
+* ``phase``
+
+  / *Condition*: optional / *Type*: str / *Default*: None /
+
+  Only get the histograms of this phase.
+
+* ``percentiles``
+
+  / *Condition*: optional / *Type*: list or str / *Default*: None /
+
+  The percentiles, as list or comma separated string, by default 50, 90, 95 and 99.
+
+* ``device_name``
+
+  / *Condition*: optional / *Type*: str / *Default*: "default" /
+
+  Name of the device.
+
+**Returns:**
+
+* ``latency_statistics``
+
+  / *Type*: dict /
+
+  Per service and phase the ``count``, ``mean``, ``min``, ``max`` and the percentiles like ``p95``, in seconds.
+  The percentiles are accurate to 5 %.
+        """
+        if phase is not None and phase not in LatencyStatistics.PHASES:
+            raise ValueError(f"Invalid phase {phase}, expected one of {', '.join(LatencyStatistics.PHASES)}")
+        return self.__latency_statistics_check(device_name).get_report(service, phase, self.__get_percentiles(percentiles))
+
+    @keyword("Export Latency Statistics")
+    def export_latency_statistics(self, file_path, device_names=None, percentiles=None):
+        """
+Export the latency histograms of several devices to a file.
+
+**Arguments:**
+
+* ``file_path``
+
+  / *Condition*: required / *Type*: str /
+
+  A ``.csv`` file gets one row per device, service and phase, any other file is written as JSON
+  with the result of ``Get Latency Statistics`` per device.
+
+* ``device_names``
+
+  / *Condition*: optional / *Type*: list or str / *Default*: None /
+
+  The names of the devices, as list or comma separated string, by default all devices.
+
+* ``percentiles``
+
+  / *Condition*: optional / *Type*: list or str / *Default*: None /
+
+  The percentiles, by default 50, 90, 95 and 99.
+
+**Returns:**
+
+* ``file_path``
+
+  / *Type*: str /
+
+  The path of the written file.
+        """
+        if device_names is None:
+            device_names = list(self.uds_manager.uds_device)
+        elif isinstance(device_names, str):
+            device_names = [device_name.strip() for device_name in device_names.split(",") if device_name.strip()]
+        percentiles = self.__get_percentiles(percentiles)
+        reports = {device_name: self.__latency_statistics_check(device_name).get_report(percentiles=percentiles)
+                   for device_name in device_names}
+        LatencyStatistics.write_report(reports, file_path, percentiles)
+        logger.info(f"Latency statistics of {len(reports)} device(s) exported to {file_path}")
+        return file_path
+
     @keyword("Write Data By Name")
+    @measure_keyword
     def write_data_by_name(self, service_name = None, value = None, device_name = "default"):
         """
 Requests to write a value associated with a name of service through the WriteDataByName service.
@@ -1533,8 +3388,7 @@ Requests to write a value associated with a name of service through the WriteDat
         uds_device = self.__device_check(device_name)
 
         # Get service from name and verify the service is available
-        diag_service_list = uds_device.diag_service_db.get_diag_service_by_name([service_name])
-        data_id = diag_service_list[0].request.parameters[1].coded_value
+        data_id = uds_device.diag_service_db.get_did_by_name(service_name)
 
         response = self.write_data_by_identifier(data_id, value, device_name)
         logger.info(f"Write {service_name} successful")
@@ -0,0 +1,182 @@
+from robot.api import logger
+from .PDXCache import PDXCache
+from odxtools.exceptions import DecodeError
+from datetime import datetime, timezone
+import json
+import os
+import tempfile
+import threading
+import warnings
+
+try:
+    from odxtools.variantmatcher import VariantMatcher
+except ImportError:
+    # odxtools < 10
+    from odxtools.ecuvariantmatcher import EcuVariantMatcher as VariantMatcher
+
+
+class VariantIdentifier:
+    """
+Identifies the ECU variant of a PDX file with the variant patterns of its ECU variants.
+
+The identification services referenced by the patterns are sent to the ECU and their
+responses are matched against the expected values. The identified variant is stored
+in a JSON file per ECU and PDX file, so repeated runs skip the identification requests
+until the PDX file changes.
+    """
+    DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(PDXCache.DEFAULT_CACHE_DIR), "variant_identification.json")
+    # Sent to the matcher for an identification request without response
+    SERVICE_NOT_SUPPORTED = 0x11
+
+    def __init__(self, cache_file=None, enabled=True):
+        self.cache_file = cache_file if cache_file else os.environ.get("ROBOTFRAMEWORK_UDS_VARIANT_CACHE", VariantIdentifier.DEFAULT_CACHE_FILE)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_ecu_key(ip_address, logical_address, device_name):
+        """
+Build the key of an ECU in the identification cache, from its IP and logical address if they are known.
+        """
+        if ip_address is None and logical_address is None:
+            return f"device:{device_name}"
+        return f"{ip_address}:{logical_address}"
+
+    def __read(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warn(f"Discard corrupt variant identification cache {self.cache_file}. Reason: {e}")
+            return {}
+
+    def get_cached_variant(self, ecu_key, pdx_hash):
+        """
+Retrieve the identified variant of an ECU from the cache.
+
+**Arguments:**
+
+* ``ecu_key``
+
+  / *Condition*: required / *Type*: str /
+
+  The key of the ECU, see ``get_ecu_key``.
+
+* ``pdx_hash``
+
+  / *Condition*: required / *Type*: str /
+
+  The SHA-256 hash of the PDX file.
+
+**Returns:**
+
+* ``variant``
+
+  / *Type*: str /
+
+  The variant name, or None if the ECU has not been identified with this PDX file yet.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.__read().get(ecu_key)
+        if entry is None or entry.get("pdx_sha256") != pdx_hash:
+            return None
+        return entry.get("variant")
+
+    def store_variant(self, ecu_key, pdx_hash, pdx_file, variant):
+        """
+Store the identified variant of an ECU in the cache.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            entries = self.__read()
+            entries[ecu_key] = {
+                "pdx_file": os.path.basename(pdx_file),
+                "pdx_sha256": pdx_hash,
+                "variant": variant,
+                "identified": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            tmp_path = None
+            try:
+                cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, indent=2)
+                os.replace(tmp_path, self.cache_file)
+            except OSError as e:
+                logger.warn(f"Unable to store the variant of {ecu_key} in {self.cache_file}. Reason: {e}")
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def clear(self):
+        """
+Remove all identified variants from the cache.
+        """
+        with self.lock:
+            if os.path.isfile(self.cache_file):
+                os.remove(self.cache_file)
+
+    @staticmethod
+    def identify(odx_db, send_request):
+        """
+Identify the ECU variant by its variant patterns.
+
+**Arguments:**
+
+* ``odx_db``
+
+  / *Condition*: required / *Type*: Database /
+
+  The ODX database with all ECU variants of the PDX file.
+
+* ``send_request``
+
+  / *Condition*: required / *Type*: callable /
+
+  Sends an encoded request to the ECU and returns the complete response, or None if there is no response.
+
+**Returns:**
+
+* ``variant``
+
+  / *Type*: str /
+
+  The name of the identified variant, or None if no variant pattern matches.
+        """
+        ecu_variants = list(odx_db.ecus)
+        candidates = [ecu_variant for ecu_variant in ecu_variants if ecu_variant.ecu_variant_patterns]
+        if not candidates:
+            if len(ecu_variants) == 1:
+                logger.info(f"PDX file has the only ECU variant {ecu_variants[0].short_name}")
+                return ecu_variants[0].short_name
+            raise Exception("PDX file does not define any ECU variant patterns, the variant has to be given explicitly")
+
+        # The identification services are shared by the variants, so every request is sent only once.
+        # The cache of the matcher itself is not used because it fails for bytearray requests of odxtools.
+        responses = {}
+        matcher = VariantMatcher(candidates, use_cache=False)
+        with warnings.catch_warnings():
+            # odxtools only warns about mismatching constants, the matcher has to skip such responses
+            warnings.simplefilter("error", DecodeError)
+            for request in matcher.request_loop():
+                # Newer odxtools versions also yield the addressing mode
+                if isinstance(request, tuple):
+                    request = request[1]
+                request = bytes(request)
+                if request not in responses:
+                    response = send_request(request)
+                    if not response:
+                        response = bytes([0x7F, request[0], VariantIdentifier.SERVICE_NOT_SUPPORTED])
+                    responses[request] = bytes(response)
+                matcher.evaluate(responses[request])
+
+        if not matcher.has_match():
+            return None
+        if hasattr(matcher, "matching_variant"):
+            return matcher.matching_variant.short_name
+        return matcher.get_active_ecu_variant().short_name
@@ -12,5 +12,5 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-VERSION      = '0.1.8'
-VERSION_DATE = '18.10.2024'
+VERSION      = '0.2.0'
+VERSION_DATE = '18.10.2026'
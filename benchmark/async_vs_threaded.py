@@ -0,0 +1,145 @@
+"""
+Compare the asyncio API with the threaded keyword path against local ``DoIPSimulator`` instances
+of the bundled test PDX, one per ECU.
+
+Both paths send the same raw ReadDataByIdentifier request of the first DID which the simulator reads ``--requests`` times to each of
+``--ecus`` ECUs at the same time. The threaded path uses one ``DoIPClient`` and udsoncan
+client per ECU with a thread per ECU, as ``Run Keyword On Devices`` does, the asyncio path
+drives all ECUs from one event loop.
+
+Usage::
+
+   python benchmark/async_vs_threaded.py [--ecus 20] [--requests 50] [--delay 0.002]
+                                         [--pdx test/pdx/CTS_STLA_V1_15_2.pdx --variant CTS_STLA_Brain]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Queue
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from RobotFramework_UDS.AsyncUDS import AsyncUDS
+from RobotFramework_UDS.DiagnosticServices import DiagnosticServices
+from RobotFramework_UDS.DoIPSimulator import DoIPSimulator
+from RobotFramework_UDS.UDSKeywords import UDSKeywords
+from udsoncan.Request import Request
+
+PDX_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "test", "pdx", "CTS_STLA_V1_15_2.pdx"))
+VARIANT = "CTS_STLA_Brain"
+FIRST_LOGICAL_ADDRESS = 0x1001
+READ_DATA_BY_IDENTIFIER_SID = 0x22
+POSITIVE_RESPONSE_OFFSET = 0x40
+
+
+def get_request(simulator):
+    """
+Get a ReadDataByIdentifier request of the first DID which the simulator answers positively.
+    """
+    diag_service_db = simulator.diag_service_db
+    for did in sorted(diag_service_db.services_by_did.get(READ_DATA_BY_IDENTIFIER_SID, {})):
+        request = bytes([READ_DATA_BY_IDENTIFIER_SID, did >> 8, did & 0xFF])
+        response = simulator.get_response(request)[0]
+        if response and response[0] == READ_DATA_BY_IDENTIFIER_SID + POSITIVE_RESPONSE_OFFSET:
+            return request
+    raise ValueError("The simulator does not answer any ReadDataByIdentifier request positively")
+
+
+def run_simulators(queue, pdx_file, variant, ecus, delay):
+    # The simulators run in their own process, so they do not compete with the tester for the GIL
+    diag_service_db = DiagnosticServices(pdx_file, variant)
+    simulators = [DoIPSimulator(diag_service_db, FIRST_LOGICAL_ADDRESS + index) for index in range(ecus)]
+    request = get_request(simulators[0])
+    for simulator in simulators:
+        simulator.configure_service(delay=delay)
+    queue.put(([simulator.start() for simulator in simulators], request))
+    simulators[0].thread.join()
+
+
+def benchmark_threaded(ports, request, requests):
+    uds = UDSKeywords()
+    device_names = [f"ecu{index}" for index in range(len(ports))]
+    for index, device_name in enumerate(device_names):
+        uds.create_uds_connector(device_name, "doip", ecu_ip_address="127.0.0.1",
+                                 ecu_logical_address=FIRST_LOGICAL_ADDRESS + index, tcp_port=ports[index])
+        uds.connect_uds_connector(device_name)
+        uds.connect(device_name)
+
+    def run_device(device_name):
+        client = uds.uds_manager.uds_device[device_name].client
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.send_request(Request.from_payload(request))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(device_names)) as executor:
+        latencies = [latency for result in executor.map(run_device, device_names) for latency in result]
+    elapsed = time.perf_counter() - start
+    for device_name in device_names:
+        uds.remove_uds_connector(device_name)
+    return elapsed, latencies
+
+
+async def benchmark_async(ports, request, requests):
+    uds = AsyncUDS()
+    device_names = [f"ecu{index}" for index in range(len(ports))]
+    for index, device_name in enumerate(device_names):
+        uds.create_device(device_name, "127.0.0.1", FIRST_LOGICAL_ADDRESS + index, tcp_port=ports[index])
+    await asyncio.gather(*(uds.connect(device_name) for device_name in device_names))
+
+    async def run_device(device_name):
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            await uds.request(request, device_name)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_device(device_name) for device_name in device_names))
+    elapsed = time.perf_counter() - start
+    for device_name in device_names:
+        await uds.remove_device(device_name)
+    return elapsed, [latency for result in results for latency in result]
+
+
+def print_result(name, elapsed, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<10} {elapsed:8.3f} s {len(latencies) / elapsed:10.0f} req/s "
+          f"{statistics.median(latencies) * 1000:9.3f} ms {p99 * 1000:9.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the asyncio API against the threaded path.")
+    parser.add_argument("--ecus", type=int, default=20, help="number of ECUs (default: 20)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per ECU (default: 50)")
+    parser.add_argument("--delay", type=float, default=0.002, help="processing delay of the simulators in seconds (default: 0.002)")
+    parser.add_argument("--pdx", default=PDX_FILE, help="PDX file of the simulated ECUs (default: the bundled test PDX)")
+    parser.add_argument("--variant", default=VARIANT, help=f"variant of the simulated ECUs (default: {VARIANT})")
+    args = parser.parse_args(argv)
+
+    queue = Queue()
+    simulators = Process(target=run_simulators, args=(queue, args.pdx, args.variant, args.ecus, args.delay), daemon=True)
+    simulators.start()
+    ports, request = queue.get()
+    try:
+        print(f"{args.ecus} ECUs x {args.requests} requests of {request.hex()}, simulator delay {args.delay * 1000:.1f} ms")
+        print(f"{'path':<10} {'total':>10} {'throughput':>14} {'median':>12} {'p99':>12}")
+        print_result("threaded", *benchmark_threaded(ports, request, args.requests))
+        print_result("asyncio", *asyncio.run(benchmark_async(ports, request, args.requests)))
+    finally:
+        simulators.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Compare the effective throughput of a raw and a compressed ``Download Binary`` over a slow link.
+
+A synthetic flash image is downloaded to a local ``DoIPSimulator`` of the bundled test PDX, which
+delays every TransferData block by the maximum block length divided by ``--bandwidth``, like a CAN
+link behind a gateway. The compressed
+download selects compressionMethod 0x1 (zlib) in the DataFormatIdentifier, the image is compressed
+while it is sent. The effective throughput is the size of the image divided by the transfer time.
+
+Usage::
+
+   python benchmark/compressed_transfer.py [--size 4194304] [--bandwidth 250000] [--random 0.25]
+                                           [--pdx test/pdx/CTS_STLA_V1_15_2.pdx --variant CTS_STLA_Brain]
+"""
+from multiprocessing import Process, Queue
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from RobotFramework_UDS.DiagnosticServices import DiagnosticServices
+from RobotFramework_UDS.DoIPSimulator import DoIPSimulator
+from RobotFramework_UDS.UDSKeywords import UDSKeywords
+from udsoncan import DataFormatIdentifier
+
+PDX_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "test", "pdx", "CTS_STLA_V1_15_2.pdx"))
+VARIANT = "CTS_STLA_Brain"
+ECU_LOGICAL_ADDRESS = 0x1001
+MEMORY_ADDRESS = 0x08000000
+TRANSFER_DATA_SID = 0x36
+
+
+def run_simulator(port_queue, pdx_file, variant, bandwidth):
+    # The simulator runs in its own process, so it does not compete with the compression for the GIL
+    simulator = DoIPSimulator(DiagnosticServices(pdx_file, variant), ECU_LOGICAL_ADDRESS)
+    simulator.configure_service(TRANSFER_DATA_SID, delay=simulator.max_block_length / bandwidth)
+    port_queue.put(simulator.start())
+    simulator.thread.join()
+
+
+def create_image(file_path, size, random_ratio):
+    """
+Write an image of code-like pages with random data, repeated tables and erased (0xFF) flash.
+    """
+    page_size = 4096
+    table = bytes(range(256)) * (page_size // 256)
+    with open(file_path, "wb") as f:
+        for page in range(size // page_size):
+            position = (page % 100) / 100
+            if position < random_ratio:
+                f.write(os.urandom(page_size))
+            elif position < 0.75:
+                f.write(table)
+            else:
+                f.write(b"\xFF" * page_size)
+
+
+def print_result(name, report):
+    print(f"{name:<12} {report['bytes']:>10} {report['transferred_bytes']:>12} {report['elapsed']:8.3f} s "
+          f"{report['throughput'] / 1024:10.1f} KiB/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark raw against compressed downloads.")
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024, help="size of the image in bytes (default: 4 MiB)")
+    parser.add_argument("--bandwidth", type=float, default=250000, help="bandwidth of the link in bytes/s (default: 250000)")
+    parser.add_argument("--random", type=float, default=0.25, help="share of incompressible pages (default: 0.25)")
+    parser.add_argument("--pdx", default=PDX_FILE, help="PDX file of the simulated ECU (default: the bundled test PDX)")
+    parser.add_argument("--variant", default=VARIANT, help=f"variant of the simulated ECU (default: {VARIANT})")
+    args = parser.parse_args(argv)
+
+    port_queue = Queue()
+    simulator = Process(target=run_simulator, args=(port_queue, args.pdx, args.variant, args.bandwidth), daemon=True)
+    simulator.start()
+    port = port_queue.get()
+    image = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    image.close()
+    try:
+        create_image(image.name, args.size, args.random)
+        uds = UDSKeywords()
+        uds.create_uds_connector("default", "doip", ecu_ip_address="127.0.0.1",
+                                 ecu_logical_address=ECU_LOGICAL_ADDRESS, tcp_port=port)
+        uds.connect_uds_connector()
+        uds.connect()
+        print(f"{args.size} bytes, link {args.bandwidth / 1024:.1f} KiB/s, {args.random:.0%} random pages")
+        print(f"{'download':<12} {'bytes':>10} {'transferred':>12} {'elapsed':>10} {'throughput':>16}")
+        print_result("raw", uds.download_binary(image.name, MEMORY_ADDRESS))
+        print_result("zlib", uds.download_binary(image.name, MEMORY_ADDRESS, dfi=DataFormatIdentifier(compression=1)))
+        uds.remove_uds_connector("default")
+    finally:
+        os.unlink(image.name)
+        simulator.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""
+Benchmark suite for the PDX load, the service codecs and the keyword layer, with machine-readable results.
+
+The suite uses the bundled ``test/pdx/*.pdx`` files and runs the following benchmarks:
+
+* ``pdx_load``: time and resident memory of loading a variant, full, variant scoped, in low memory
+  mode, storing it into and loading it from the PDX cache. Every load runs in a fresh process.
+* ``codec``: encode and decode time of the request and positive response of every service of the
+  variant, with the compiled codecs and with odxtools only.
+* ``read_data_by_name``: ``Read Data By Name`` round trips with 1 to ``--max-dids`` DIDs
+  against a local DoIP simulator answering from the PDX.
+* ``flash``: ``Download Binary`` and ``Upload To File`` throughput against the simulator.
+* ``fan_out``: ``Run Keyword On Devices`` with ``Tester Present`` and ``Read Data By Name`` on
+  ``--devices`` simulated ECUs.
+
+The simulators run in their own process, so they do not compete with the tester for the GIL.
+The results are written as JSON to ``--output``. With ``--compare`` the results are compared
+to those of an earlier run, e.g. before a change.
+
+Usage::
+
+   python benchmark/suite.py [--pdx test/pdx/CTS_STLA_V1_15_2.pdx] [--only codec,read_data_by_name]
+                             [--output results.json] [--compare baseline.json]
+"""
+from multiprocessing import Process, Queue
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from RobotFramework_UDS.DiagnosticServices import DiagnosticServices
+from RobotFramework_UDS.DoIPSimulator import DoIPSimulator
+from RobotFramework_UDS.PDXCache import PDXCache
+from RobotFramework_UDS.UDSKeywords import UDSKeywords
+from RobotFramework_UDS.version import VERSION
+
+PDX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "test", "pdx"))
+BENCHMARKS = ("pdx_load", "codec", "read_data_by_name", "flash", "fan_out")
+LOAD_MODES = ("full", "variant_scoped", "low_memory", "cache_store", "cache_load")
+CODEC_MODES = ("on", "off")
+FIRST_LOGICAL_ADDRESS = 0x1001
+MEMORY_ADDRESS = 0x08000000
+READ_DATA_BY_IDENTIFIER_SID = 0x22
+POSITIVE_RESPONSE_OFFSET = 0x40
+# Leaves of the results which are compared between runs, higher is better only for the throughput
+COMPARED_METRICS = ("seconds", "rss_delta", "mean", "median", "p95", "elapsed", "throughput", "encode_mean", "decode_mean")
+
+
+def summarize(durations):
+    """
+Summarize durations in seconds like the transfer statistics: count, min, mean, median, p95 and max.
+    """
+    durations = sorted(durations)
+    if not durations:
+        return {"count": 0, "min": None, "mean": None, "median": None, "p95": None, "max": None}
+    return {
+        "count": len(durations),
+        "min": durations[0],
+        "mean": sum(durations) / len(durations),
+        "median": durations[len(durations) // 2],
+        "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        "max": durations[-1],
+    }
+
+
+def measure(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def variant_in_process(result_queue, pdx_file):
+    with DiagnosticServices.non_strict_mode():
+        odx_db = DiagnosticServices.load_pdx_db(pdx_file)
+    result_queue.put(next(iter(odx_db.ecus)).short_name)
+
+
+def get_variant(pdx_file):
+    """
+Get the first ECU variant of a PDX file. The file is parsed in another process, so the memory
+of the loads measured afterwards starts from a process which has not parsed any PDX file.
+    """
+    result_queue = Queue()
+    process = Process(target=variant_in_process, args=(result_queue, pdx_file))
+    process.start()
+    variant = result_queue.get()
+    process.join()
+    return variant
+
+
+def load_in_process(result_queue, pdx_file, variant, mode, cache_dir):
+    try:
+        rss_before = DiagnosticServices.get_process_memory()
+        start = time.perf_counter()
+        pdx_cache = PDXCache(cache_dir) if mode in ("cache_store", "cache_load") else None
+        diag_service_db = DiagnosticServices(pdx_file, variant, pdx_cache=pdx_cache,
+                                             variant_scoped=mode == "variant_scoped", low_memory=mode == "low_memory")
+        seconds = time.perf_counter() - start
+        rss_after = DiagnosticServices.get_process_memory()
+        result_queue.put({
+            "seconds": seconds,
+            "rss_delta": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            "services": len(diag_service_db.diag_services),
+        })
+    except Exception as e:
+        result_queue.put({"error": str(e)})
+
+
+def benchmark_pdx_load(pdx_file, variant, cache_dir):
+    results = {}
+    for mode in LOAD_MODES:
+        # Every load runs in a fresh process, so neither memory nor parsed objects are shared between modes
+        result_queue = Queue()
+        process = Process(target=load_in_process, args=(result_queue, pdx_file, variant, mode, cache_dir))
+        process.start()
+        results[mode] = result_queue.get()
+        process.join()
+        print(f"  load {mode:<15} {format_seconds(results[mode].get('seconds'))} "
+              f"{format_bytes(results[mode].get('rss_delta'))}{'  ' + results[mode]['error'] if 'error' in results[mode] else ''}")
+    return results
+
+
+def benchmark_codec(diag_service_db, repeat):
+    simulator = DoIPSimulator(diag_service_db, FIRST_LOGICAL_ADDRESS)
+    services = {}
+    skipped = []
+    totals = {mode: {"encode": 0.0, "decode": 0.0} for mode in CODEC_MODES}
+    for service in diag_service_db.diag_services:
+        if service.request is None or not service.positive_responses:
+            continue
+        try:
+            parameters = {parameter.short_name: DoIPSimulator.get_default_value(parameter)
+                          for parameter in service.request.parameters if parameter.is_required}
+            request = bytes(service.request.encode(**parameters))
+            response = simulator.encode_positive_response(service, request)
+        except Exception:
+            # Services whose parameters have no encodable default value are not measured
+            skipped.append(service.short_name)
+            continue
+
+        result = {}
+        for mode in CODEC_MODES:
+            diag_service_db.set_compiled_codec_mode(mode)
+            try:
+                encode = summarize(measure(lambda: diag_service_db.encode_request(service, parameters), repeat))
+                decode = summarize(measure(lambda: diag_service_db.decode_response(service, response), repeat))
+            except Exception:
+                skipped.append(service.short_name)
+                break
+            result[mode] = {"encode_mean": encode["mean"], "encode_p95": encode["p95"],
+                            "decode_mean": decode["mean"], "decode_p95": decode["p95"]}
+        else:
+            services[service.short_name] = result
+            for mode in CODEC_MODES:
+                totals[mode]["encode"] += result[mode]["encode_mean"]
+                totals[mode]["decode"] += result[mode]["decode_mean"]
+    diag_service_db.set_compiled_codec_mode("on")
+
+    for mode in CODEC_MODES:
+        count = max(len(services), 1)
+        print(f"  codec compiled={mode:<4} encode {format_seconds(totals[mode]['encode'] / count)} "
+              f"decode {format_seconds(totals[mode]['decode'] / count)} mean over {len(services)} services")
+    return {
+        "services": services,
+        "skipped": sorted(set(skipped)),
+        "summary": {mode: {"encode_mean": totals[mode]["encode"] / max(len(services), 1),
+                           "decode_mean": totals[mode]["decode"] / max(len(services), 1)} for mode in CODEC_MODES},
+    }
+
+
+def get_readable_dids(diag_service_db):
+    """
+Get the names of the ReadDataByIdentifier services which the simulator answers positively.
+    """
+    simulator = DoIPSimulator(diag_service_db, FIRST_LOGICAL_ADDRESS)
+    service_names = []
+    for did, service in sorted(diag_service_db.services_by_did.get(READ_DATA_BY_IDENTIFIER_SID, {}).items()):
+        request = bytes([READ_DATA_BY_IDENTIFIER_SID, did >> 8, did & 0xFF])
+        response = simulator.get_response(request)[0]
+        if response and response[0] == READ_DATA_BY_IDENTIFIER_SID + POSITIVE_RESPONSE_OFFSET:
+            service_names.append(service.short_name)
+    return service_names
+
+
+def run_simulators(port_queue, pdx_file, variant, cache_dir, count):
+    diag_service_db = DiagnosticServices(pdx_file, variant, pdx_cache=PDXCache(cache_dir))
+    simulators = [DoIPSimulator(diag_service_db, FIRST_LOGICAL_ADDRESS + index) for index in range(count)]
+    port_queue.put([simulator.start() for simulator in simulators])
+    simulators[0].thread.join()
+
+
+def start_simulators(pdx_file, variant, cache_dir, count):
+    port_queue = Queue()
+    process = Process(target=run_simulators, args=(port_queue, pdx_file, variant, cache_dir, count), daemon=True)
+    process.start()
+    return process, port_queue.get()
+
+
+def connect_devices(uds, ports, pdx_file, variant):
+    device_names = []
+    for index, port in enumerate(ports):
+        device_name = f"ecu{index}"
+        uds.create_uds_connector(device_name, "doip", ecu_ip_address="127.0.0.1",
+                                 ecu_logical_address=FIRST_LOGICAL_ADDRESS + index, tcp_port=port)
+        uds.connect_uds_connector(device_name)
+        uds.connect(device_name)
+        uds.load_pdx(pdx_file, variant, device_name)
+        device_names.append(device_name)
+    return device_names
+
+
+def benchmark_read_data_by_name(uds, did_names, max_dids, requests):
+    results = {}
+    for did_count in range(1, min(max_dids, len(did_names)) + 1):
+        service_names = did_names[:did_count]
+        uds.read_data_by_name(service_names, device_name="ecu0")
+        results[str(did_count)] = summarize(measure(lambda: uds.read_data_by_name(service_names, device_name="ecu0"), requests))
+        print(f"  read_data_by_name {did_count:>3} DIDs median {format_seconds(results[str(did_count)]['median'])} "
+              f"p95 {format_seconds(results[str(did_count)]['p95'])}")
+    return results
+
+
+def benchmark_flash(uds, size):
+    image = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    image.close()
+    upload = image.name + ".upload"
+    try:
+        with open(image.name, "wb") as f:
+            f.write(os.urandom(size))
+        results = {}
+        for name, report in (("download", uds.download_binary(image.name, MEMORY_ADDRESS, device_name="ecu0")),
+                             ("upload", uds.upload_to_file(upload, MEMORY_ADDRESS, size, device_name="ecu0"))):
+            results[name] = {key: report[key] for key in ("bytes", "blocks", "elapsed", "throughput", "latency_mean", "latency_p95")}
+            print(f"  flash {name:<8} {size} bytes {format_seconds(report['elapsed'])} "
+                  f"{report['throughput'] / 1024:10.1f} KiB/s")
+        return results
+    finally:
+        for file_path in (image.name, upload):
+            if os.path.exists(file_path):
+                os.unlink(file_path)
+
+
+def benchmark_fan_out(uds, device_names, did_name, requests):
+    results = {}
+    for name, keyword_name, args in (("tester_present", "Tester Present", ()),
+                                     ("read_data_by_name", "Read Data By Name", ([did_name],))):
+        uds.run_keyword_on_devices(device_names, keyword_name, *args, fail_on_error=True)
+        results[name] = summarize(measure(lambda: uds.run_keyword_on_devices(device_names, keyword_name, *args, fail_on_error=True), requests))
+        print(f"  fan_out {name:<18} {len(device_names)} devices median {format_seconds(results[name]['median'])} "
+              f"p95 {format_seconds(results[name]['p95'])}")
+    return results
+
+
+def benchmark_pdx(pdx_file, args, cache_dir):
+    variant = get_variant(pdx_file)
+    print(f"{os.path.basename(pdx_file)} ({variant})")
+    results = {"variant": variant}
+    if "pdx_load" in args.only:
+        results["pdx_load"] = benchmark_pdx_load(pdx_file, variant, cache_dir)
+
+    # The cache is filled once, so the remaining benchmarks do not parse the PDX file again
+    diag_service_db = DiagnosticServices(pdx_file, variant, pdx_cache=PDXCache(cache_dir))
+    if "codec" in args.only:
+        results["codec"] = benchmark_codec(diag_service_db, args.repeat)
+
+    device_benchmarks = [name for name in ("read_data_by_name", "flash", "fan_out") if name in args.only]
+    if not device_benchmarks:
+        return results
+    did_names = get_readable_dids(diag_service_db)
+    device_count = args.devices if "fan_out" in args.only else 1
+    process, ports = start_simulators(pdx_file, variant, cache_dir, device_count)
+    uds = UDSKeywords()
+    uds.configure_pdx_cache(cache_dir)
+    try:
+        device_names = connect_devices(uds, ports, pdx_file, variant)
+        if "read_data_by_name" in args.only:
+            results["read_data_by_name"] = benchmark_read_data_by_name(uds, did_names, args.max_dids, args.requests)
+        if "flash" in args.only:
+            results["flash"] = benchmark_flash(uds, args.flash_size)
+        if "fan_out" in args.only and did_names:
+            results["fan_out"] = benchmark_fan_out(uds, device_names, did_names[0], args.requests)
+        for device_name in device_names:
+            uds.remove_uds_connector(device_name)
+    finally:
+        process.terminate()
+    return results
+
+
+def flatten(results, prefix=""):
+    """
+Flatten nested results to ``a/b/c`` paths of their numeric leaves.
+    """
+    leaves = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            leaves.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = value
+    return leaves
+
+
+def compare(results, baseline, threshold):
+    """
+Print the metrics which changed by more than ``threshold`` against a baseline, return the number of regressions.
+    """
+    # Only the measurements are compared, the arguments of the runs are not
+    current = flatten(results["pdx"])
+    previous = flatten(baseline.get("pdx", {}))
+    regressions = 0
+    print(f"compared to {baseline.get('meta', {}).get('timestamp', 'baseline')}:")
+    for path in sorted(set(current) & set(previous)):
+        metric = path.rsplit("/", 1)[-1]
+        # The per-service codec times are too short to compare single runs, their summary is compared
+        if metric not in COMPARED_METRICS or not previous[path] or "/codec/services/" in path:
+            continue
+        change = (current[path] - previous[path]) / previous[path]
+        if abs(change) < threshold:
+            continue
+        regression = change < 0 if metric == "throughput" else change > 0
+        regressions += regression
+        print(f"  {'REGRESSION' if regression else 'improvement':<11} {path:<70} {previous[path]:12.6g} -> {current[path]:12.6g} ({change:+.1%})")
+    return regressions
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return f"{'-':>10}"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:7.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:7.2f} ms"
+    return f"{seconds:7.3f} s "
+
+
+def format_bytes(size):
+    if size is None:
+        return f"{'-':>10}"
+    return f"{size / (1024 * 1024):7.1f} MiB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDX load, service codecs and keyword round trips.")
+    parser.add_argument("--pdx", action="append", help="PDX file, can be given several times (default: all files of test/pdx)")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"comma separated benchmarks (default: {','.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=200, help="encodes and decodes per service (default: 200)")
+    parser.add_argument("--requests", type=int, default=50, help="round trips per measurement (default: 50)")
+    parser.add_argument("--max-dids", type=int, default=8, help="maximum DIDs per Read Data By Name (default: 8)")
+    parser.add_argument("--flash-size", type=int, default=1024 * 1024, help="size of the flash image in bytes (default: 1 MiB)")
+    parser.add_argument("--devices", type=int, default=10, help="number of simulated ECUs of the fan-out (default: 10)")
+    parser.add_argument("--output", help="file of the JSON results (default: print only)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative change reported by --compare (default: 0.05)")
+    args = parser.parse_args(argv)
+    args.only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in args.only if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s) {', '.join(unknown)}, expected {', '.join(BENCHMARKS)}")
+    pdx_files = args.pdx or sorted(glob.glob(os.path.join(PDX_DIR, "*.pdx")))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "pdx": {},
+    }
+    cache_dir = tempfile.mkdtemp(prefix="uds_benchmark_")
+    try:
+        for pdx_file in pdx_files:
+            results["pdx"][os.path.basename(pdx_file)] = benchmark_pdx(pdx_file, args, cache_dir)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())